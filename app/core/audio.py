@@ -1,7 +1,9 @@
-import sounddevice as sd
 import numpy as np
 import threading
 import queue
+from .ringbuffer import RingBuffer
+from .mixer import Mixer
+from .resample import Resampler
 
 class AudioEngine:
     """
@@ -13,14 +15,18 @@ class AudioEngine:
         self.channels = channels
         self.chunk_size = chunk_size
         
-        self.input_queue = queue.Queue()
+        # Capture FIFO: the callback copies into preallocated memory, read_frame() drains it
+        self.capture_ring = RingBuffer(sample_rate, channels, guard=2 * chunk_size)
         self.output_queues = {} # peer_id: queue.Queue
+        self.mixer = Mixer(chunk_size, channels)
+        self._resamplers = {} # peer_id: (their rate, Resampler), for peers not at our rate
         
         self.is_running = False
         self.stream = None
         self.mute = False
 
     def start(self):
+        import sounddevice as sd # Only needed once there is a device to open
         self.is_running = True
         self.stream = sd.RawStream(
             samplerate=self.sample_rate,
@@ -37,21 +43,25 @@ class AudioEngine:
             
         # Capture input
         if not self.mute:
-            self.input_queue.put(indata.copy())
-        
-        # Mix output from all peer streams
-        mixed_audio = np.zeros((frames, self.channels), dtype='int16')
+            self.capture_ring.write(np.frombuffer(indata, dtype='int16').reshape(-1, self.channels))
         
+        # Mix output from all peer streams straight into the device buffer
+        self.mixer.clear(frames)
         for peer_id, q in list(self.output_queues.items()):
             try:
                 data = q.get_nowait()
-                # Simple additive mixing (might need normalization later to prevent clipping)
-                peer_audio = np.frombuffer(data, dtype='int16').reshape(-1, self.channels)
-                mixed_audio += (peer_audio // 2) # Reduce volume to prevent overflow during mix
+                self.mixer.add(np.frombuffer(data, dtype='int16').reshape(-1, self.channels))
             except queue.Empty:
                 pass
                 
-        outdata[:] = mixed_audio.tobytes()
+        self.mixer.mix_into(np.frombuffer(outdata, dtype='int16').reshape(-1, self.channels))
+
+    def read_frame(self, timeout=None):
+        """Next captured chunk as int16 bytes, or None if nothing arrived within `timeout`."""
+        frame = np.empty((self.chunk_size, self.channels), dtype='int16')
+        if self.capture_ring.read(self.chunk_size, frame, timeout) is None:
+            return None
+        return frame.tobytes()
 
     def add_peer_stream(self, peer_id):
         self.output_queues[peer_id] = queue.Queue()
@@ -59,9 +69,17 @@ class AudioEngine:
     def remove_peer_stream(self, peer_id):
         if peer_id in self.output_queues:
             del self.output_queues[peer_id]
+        self._resamplers.pop(peer_id, None)
 
-    def receive_audio(self, peer_id, data):
+    def receive_audio(self, peer_id, data, rate=None):
+        """Queues a peer's PCM, resampled to our rate first if the peer runs at another `rate`."""
         if peer_id in self.output_queues:
+            if rate and rate != self.sample_rate:
+                from_rate, resampler = self._resamplers.get(peer_id, (None, None))
+                if from_rate != rate:
+                    resampler = Resampler(rate, self.sample_rate, self.channels)
+                    self._resamplers[peer_id] = (rate, resampler)
+                data = resampler.process(np.frombuffer(data, dtype='int16')).tobytes()
             self.output_queues[peer_id].put(data)
 
     def stop(self):
@@ -0,0 +1,234 @@
+"""
+Speech codecs for the audio path, NumPy only.
+
+Each codec has a one-byte ID carried in the v3 audio header, so a room can
+mix codecs freely: receivers pick the decoder per packet. Decoding is
+stateless (every packet carries what it needs), so one shared decoder
+instance per codec serves all senders; encoders may keep state between
+frames, so each sender creates its own with create().
+
+    zlib   lossless, what every client before control version 3 sends
+    ulaw   G.711 mu-law, 8 bits/sample, table lookups both ways
+    alaw   G.711 A-law, 8 bits/sample, table lookups both ways
+    adpcm  IMA-ADPCM, 4 bits/sample; each packet starts with the predictor
+           and step index so it decodes on its own
+"""
+import struct
+import zlib
+import numpy as np
+
+ZLIB = 0
+ULAW = 1
+ALAW = 2
+ADPCM = 3
+
+class Codec:
+    ID = None
+    NAME = None
+    BITS_PER_SAMPLE = 16
+
+    def encode(self, pcm):
+        """int16 samples (any shape, interleaved if multichannel) -> bytes"""
+        raise NotImplementedError
+
+    def decode(self, data):
+        """bytes -> 1-D int16 array"""
+        raise NotImplementedError
+
+class ZlibCodec(Codec):
+    ID = ZLIB
+    NAME = "zlib"
+
+    def __init__(self, level=6):
+        self.level = level
+
+    def encode(self, pcm):
+        return zlib.compress(np.ascontiguousarray(pcm, dtype=np.int16), self.level)
+
+    def decode(self, data):
+        return np.frombuffer(zlib.decompress(data), dtype=np.int16)
+
+def _segments(x, ends):
+    return np.searchsorted(np.array(ends), x, side="left")
+
+def _ulaw_tables():
+    # G.711 mu-law, after the classic Sun reference implementation
+    pcm = np.arange(-32768, 32768, dtype=np.int32) >> 2
+    mask = np.where(pcm < 0, 0x7F, 0xFF)
+    mag = np.minimum(np.abs(pcm), 8159) + (0x84 >> 2)
+    seg = _segments(mag, [0x3F, 0x7F, 0xFF, 0x1FF, 0x3FF, 0x7FF, 0xFFF, 0x1FFF])
+    code = (seg << 4) | ((mag >> (seg + 1)) & 0xF)
+    encode = (np.where(seg >= 8, 0x7F, code) ^ mask).astype(np.uint8)
+
+    u = ~np.arange(256) & 0xFF
+    t = (((u & 0xF) << 3) + 0x84) << ((u & 0x70) >> 4)
+    decode = np.where(u & 0x80, 0x84 - t, t - 0x84).astype(np.int16)
+    return encode, decode
+
+def _alaw_tables():
+    pcm = np.arange(-32768, 32768, dtype=np.int32) >> 3
+    mask = np.where(pcm >= 0, 0xD5, 0x55)
+    mag = np.where(pcm >= 0, pcm, -pcm - 1)
+    seg = _segments(mag, [0x1F, 0x3F, 0x7F, 0xFF, 0x1FF, 0x3FF, 0x7FF, 0xFFF])
+    code = (seg << 4) | np.where(seg < 2, (mag >> 1) & 0xF, (mag >> np.maximum(seg, 1)) & 0xF)
+    encode = (np.where(seg >= 8, 0x7F, code) ^ mask).astype(np.uint8)
+
+    a = np.arange(256) ^ 0x55
+    seg = (a & 0x70) >> 4
+    t = ((a & 0xF) << 4) + np.where(seg == 0, 8, 0x108)
+    t = np.where(seg > 1, t << np.maximum(seg - 1, 0), t)
+    decode = np.where(a & 0x80, t, -t).astype(np.int16)
+    return encode, decode
+
+class _CompandingCodec(Codec):
+    """8-bit G.711 companding: a 64K-entry table to encode, a 256-entry one to decode."""
+    BITS_PER_SAMPLE = 8
+    _tables = None
+
+    def __init__(self):
+        cls = type(self)
+        if cls._tables is None:
+            cls._tables = cls._build_tables()
+        self._encode_table, self._decode_table = cls._tables
+
+    def encode(self, pcm):
+        # Offset the int16 samples to 0..65535 table indices
+        idx = np.asarray(pcm, dtype=np.int16).ravel().view(np.uint16) ^ 0x8000
+        return self._encode_table[idx].tobytes()
+
+    def decode(self, data):
+        return self._decode_table[np.frombuffer(data, dtype=np.uint8)]
+
+class MuLawCodec(_CompandingCodec):
+    ID = ULAW
+    NAME = "ulaw"
+    _build_tables = staticmethod(_ulaw_tables)
+
+class ALawCodec(_CompandingCodec):
+    ID = ALAW
+    NAME = "alaw"
+    _build_tables = staticmethod(_alaw_tables)
+
+_ADPCM_STEPS = [
+    7, 8, 9, 10, 11, 12, 13, 14, 16, 17, 19, 21, 23, 25, 28, 31, 34, 37, 41, 45,
+    50, 55, 60, 66, 73, 80, 88, 97, 107, 118, 130, 143, 157, 173, 190, 209, 230,
+    253, 279, 307, 337, 371, 408, 449, 494, 544, 598, 658, 724, 796, 876, 963,
+    1060, 1166, 1282, 1411, 1552, 1707, 1878, 2066, 2272, 2499, 2749, 3024, 3327,
+    3660, 4026, 4428, 4871, 5358, 5894, 6484, 7132, 7845, 8630, 9493, 10442,
+    11487, 12635, 13899, 15289, 16818, 18500, 20350, 22385, 24623, 27086, 29794,
+    32767,
+]
+_ADPCM_INDEX = [-1, -1, -1, -1, 2, 4, 6, 8] * 2
+
+def _adpcm_tables():
+    # Per (step index, code): the predictor change and the next step index, flattened
+    # as index * 16 + code so the sample loop is two list lookups
+    deltas, nexts = [], []
+    for index, step in enumerate(_ADPCM_STEPS):
+        for code in range(16):
+            diff = step >> 3
+            if code & 4: diff += step
+            if code & 2: diff += step >> 1
+            if code & 1: diff += step >> 2
+            deltas.append(-diff if code & 8 else diff)
+            nexts.append(min(88, max(0, index + _ADPCM_INDEX[code])) * 16)
+    return deltas, nexts
+
+_ADPCM_DELTAS, _ADPCM_NEXT = _adpcm_tables()
+_ADPCM_HEADER = struct.Struct("!hBB") # Predictor, step index, 1 if the last nibble is padding
+
+class AdpcmCodec(Codec):
+    """
+    IMA-ADPCM. The sample recursion can't be vectorized, so the per-sample
+    loop is kept to a few integer operations and table lookups. Predictor
+    and step index carry over between frames (so the encoder is per sender);
+    each packet starts with them so it still decodes on its own.
+    """
+    ID = ADPCM
+    NAME = "adpcm"
+    BITS_PER_SAMPLE = 4
+
+    def __init__(self):
+        self._predicted = 0
+        self._index = 0
+
+    def encode(self, pcm):
+        samples = np.asarray(pcm, dtype=np.int16).ravel().tolist()
+        header = _ADPCM_HEADER.pack(self._predicted, self._index, len(samples) & 1)
+        predicted = self._predicted
+        state = self._index * 16
+        steps, deltas, nexts = _ADPCM_STEPS, _ADPCM_DELTAS, _ADPCM_NEXT
+        codes = []
+        for sample in samples:
+            step = steps[state >> 4]
+            diff = sample - predicted
+            code = 0
+            if diff < 0:
+                code = 8
+                diff = -diff
+            if diff >= step:
+                code |= 4
+                diff -= step
+            step >>= 1
+            if diff >= step:
+                code |= 2
+                diff -= step
+            if diff >= step >> 1:
+                code |= 1
+            state += code
+            predicted += deltas[state]
+            if predicted > 32767: predicted = 32767
+            elif predicted < -32768: predicted = -32768
+            state = nexts[state]
+            codes.append(code)
+        self._predicted = predicted
+        self._index = state >> 4
+
+        # Two codes per byte, first one in the low nibble
+        if len(codes) & 1:
+            codes.append(0)
+        packed = np.array(codes, dtype=np.uint8)
+        return header + (packed[0::2] | (packed[1::2] << 4)).tobytes()
+
+    def decode(self, data):
+        predicted, index, padded = _ADPCM_HEADER.unpack_from(data, 0)
+        packed = np.frombuffer(data, dtype=np.uint8, offset=_ADPCM_HEADER.size)
+        codes = np.empty(2 * len(packed), dtype=np.uint8)
+        codes[0::2] = packed & 0xF
+        codes[1::2] = packed >> 4
+        if padded:
+            codes = codes[:-1]
+
+        out = []
+        state = index * 16
+        deltas, nexts = _ADPCM_DELTAS, _ADPCM_NEXT
+        for code in codes.tolist():
+            state += code
+            predicted += deltas[state]
+            if predicted > 32767: predicted = 32767
+            elif predicted < -32768: predicted = -32768
+            state = nexts[state]
+            out.append(predicted)
+        return np.array(out, dtype=np.int16)
+
+CODECS = {cls.ID: cls for cls in (ZlibCodec, MuLawCodec, ALawCodec, AdpcmCodec)}
+BY_NAME = {cls.NAME: cls.ID for cls in CODECS.values()}
+_shared = {}
+
+def create(codec):
+    """New codec instance (for encoding) from an ID or a name."""
+    if isinstance(codec, str):
+        codec = BY_NAME[codec]
+    return CODECS[codec]()
+
+def get(codec_id):
+    """Shared instance for decoding; raises KeyError for unknown IDs."""
+    codec = _shared.get(codec_id)
+    if codec is None:
+        codec = _shared[codec_id] = CODECS[codec_id]()
+    return codec
+
+def transcode(data, src, dst=ZLIB):
+    if src == dst:
+        return data
+    return get(dst).encode(get(src).decode(data))
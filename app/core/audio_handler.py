@@ -1,17 +1,60 @@
-import sounddevice as sd
 import numpy as np
 import threading
-import queue
-import zlib
+import time
+from .audio_packet import level_from_pcm, FLAG_CN
+from . import vad
+from .jitter import JitterBuffer, LOST
+from .ringbuffer import RingBuffer
+from .mixer import Mixer
+from . import audio_codecs
+from .resample import Resampler
 
 class AudioHandler:
-    def __init__(self, sample_rate=16000, channels=1, chunk_size=1024):
+    FRAME_DURATIONS = (10, 20, 40, 60) # ms of audio per packet
+
+    def __init__(self, sample_rate=16000, channels=1, frame_ms=20, block_size=None, dtx=True, codec="zlib",
+                 min_delay_ms=20):
+        """
+        `frame_ms` sets the packet duration, `block_size` the device callback size
+        in samples (defaults to one packet). The two are independent: the capture
+        ring and the playout cursors pack several blocks into one packet or split
+        one block across packets as needed. `min_delay_ms` is the jitter buffer
+        floor; it grows above that only as far as measured jitter requires.
+        """
+        if frame_ms not in self.FRAME_DURATIONS:
+            raise ValueError(f"frame_ms must be one of {self.FRAME_DURATIONS}")
         self.sample_rate = sample_rate
         self.channels = channels
-        self.chunk_size = chunk_size
+        self.frame_ms = frame_ms
+        self.frame_size = sample_rate * frame_ms // 1000
+        self.block_size = block_size or self.frame_size
+        self.min_delay_ms = min_delay_ms
         
-        self.input_queue = queue.Queue()
-        self.output_queues = {} # username: queue.Queue
+        # Capture: the callback only copies raw PCM in here; level, VAD and compression
+        # run on the sender thread in read_frame(). Holds 1 s, dropping the oldest audio.
+        self.capture_ring = RingBuffer(sample_rate, channels, guard=2 * max(self.block_size, self.frame_size))
+        self._capture_frame = np.zeros((self.frame_size, channels), dtype='int16')
+        self.encoder = audio_codecs.create(codec)
+        self.encode_ms = 0.0 # Smoothed time spent encoding one frame
+        self.jitter_buffers = {} # username: JitterBuffer
+        self._rx_seq = {} # username: next seq to assign to frames from legacy servers
+        self._last_pcm = {} # username: last decoded frame, repeated to conceal losses
+        self._resamplers = {} # username: (their rate, Resampler), for senders not at our rate
+        # Playout: the packet each user is part way through, as [pcm, position, shift],
+        # and one block of scratch space to assemble their samples for the mixer
+        self._playout = {}
+        self._assembly = np.zeros((self.block_size, channels), dtype='int16')
+
+        # DTX: skip silent frames, send a comfort-noise marker now and then instead
+        self.vad = vad.VoiceActivityDetector(self.frame_ms) if dtx else None
+        self.comfort_levels = {} # username: background level (-dBov) while they're silent
+        # One second of unit-RMS white noise, scaled per user when filling DTX gaps. The
+        # first blocks are repeated at the end so any block is one contiguous slice.
+        self._noise_len = sample_rate
+        noise = np.random.default_rng().standard_normal(sample_rate).astype(np.float32)
+        self._noise = np.concatenate((noise, noise[:self.block_size]))
+        self._noise_pos = 0
+        self.mixer = Mixer(self.block_size, channels)
         
         self.is_running = False
         self.stream = None
@@ -21,10 +64,11 @@ class AudioHandler:
         self._lock = threading.Lock()
 
     def start(self):
+        import sounddevice as sd # Only needed once there is a device to open
         self.is_running = True
         self.stream = sd.RawStream(
             samplerate=self.sample_rate,
-            blocksize=self.chunk_size,
+            blocksize=self.block_size,
             dtype='int16',
             channels=self.channels,
             callback=self._audio_callback
@@ -35,63 +79,226 @@ class AudioHandler:
         if status:
             print(f"[Audio] Status: {status}")
 
-        # Capture
-        if not self.muted:
-            # Compress data before putting in queue for networking
-            try:
-                compressed = zlib.compress(bytes(indata))
-                self.input_queue.put(compressed)
-            except Exception as e:
-                print(f"[Audio] Capture error: {e}")
+        # Capture: written even while muted so the media clock keeps running
+        self.capture_ring.write(np.frombuffer(indata, dtype='int16').reshape(-1, self.channels))
         
-        # Playback
-        mixed_audio = np.zeros((frames, self.channels), dtype='int16')
+        # Playback: mix straight into the device buffer
+        mixed_audio = np.frombuffer(outdata, dtype='int16').reshape(-1, self.channels)
+        self.mixer.clear(frames)
         
         if not self.deafened:
             with self._lock:
-                for username, q in list(self.output_queues.items()):
+                assembly = self._assembly[:frames]
+                for i, (username, jb) in enumerate(self.jitter_buffers.items()):
                     try:
-                        data = q.get_nowait()
-                        if not data or len(data) < 2:
+                        filled = self._fill_block(username, jb, assembly)
+                        if not filled:
+                            level = self.comfort_levels.get(username)
+                            if level is not None:
+                                self._comfort_noise(level, frames, i)
                             continue
-                            
-                        # Decompress
-                        decompressed = zlib.decompress(data)
-                        peer_audio = np.frombuffer(decompressed, dtype='int16').reshape(-1, self.channels)
-                        
-                        # Ensure shape matches (trim or pad if necessary)
-                        if peer_audio.shape[0] != frames:
-                            # print(f"[Audio] Resizing peer audio from {peer_audio.shape[0]} to {frames}")
-                            if peer_audio.shape[0] > frames:
-                                peer_audio = peer_audio[:frames]
-                            else:
-                                pad = np.zeros((frames - peer_audio.shape[0], self.channels), dtype='int16')
-                                peer_audio = np.vstack((peer_audio, pad))
-
-                        # Simple additive mixing
-                        mixed_audio = np.add(mixed_audio, peer_audio // 2)
-                    except queue.Empty:
-                        pass
+                        assembly[filled:] = 0 # Ran dry mid-block
+                        self.mixer.add(assembly)
                     except Exception as e:
                         print(f"[Audio] Playback error for {username}: {e}")
         
-        outdata[:] = mixed_audio.tobytes()
+        self.mixer.mix_into(mixed_audio)
+        self._noise_pos = (self._noise_pos + frames) % self._noise_len
+
+    def _fill_block(self, username, jb, out):
+        """
+        Copies the user's next len(out) samples into `out`, taking packets from
+        the jitter buffer as the current one runs out. Returns how many samples
+        were available.
+        """
+        filled = 0
+        while filled < len(out):
+            current = self._playout.get(username)
+            if current is None:
+                data = jb.get()
+                if data is None:
+                    break
+                if data is LOST:
+                    # Concealment: repeat the last frame, halving it on every further loss
+                    last = self._last_pcm.get(username)
+                    if last is None:
+                        continue
+                    current = [last, 0, jb.consecutive_lost]
+                else:
+                    # Already decoded in receive_audio(): just copy into the mix
+                    self._last_pcm[username] = data
+                    current = [data, 0, 0]
+                self._playout[username] = current
+            pcm, pos, shift = current
+            n = min(len(pcm) - pos, len(out) - filled)
+            np.right_shift(pcm[pos:pos + n], shift, out=out[filled:filled + n])
+            filled += n
+            if pos + n == len(pcm):
+                del self._playout[username]
+            else:
+                current[1] = pos + n
+        return filled
+
+    def read_frame(self, timeout=None):
+        """
+        Sender side of the capture path. Blocks until a frame worth sending is
+        captured and returns (encoded frame, RFC 6464 level, flags, capture ms),
+        or None if nothing turned up within `timeout`.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None if deadline is None else max(0, deadline - time.monotonic())
+            frame = self.capture_ring.read(self.frame_size, self._capture_frame, remaining)
+            if frame is None:
+                return None
+            # Media clock: position of this frame in the capture stream, so it keeps
+            # advancing through DTX gaps and overflows
+            start = self.capture_ring.read_position - self.frame_size
+            capture_ms = int(1000 * start / self.sample_rate) & 0xFFFFFFFF
+            if self.muted:
+                continue
+            try:
+                level = level_from_pcm(frame)
+                decision = self.vad.process(level) if self.vad else vad.VOICE
+                if decision == vad.VOICE:
+                    started = time.perf_counter()
+                    data = self.encoder.encode(frame)
+                    self.encode_ms += (1000 * (time.perf_counter() - started) - self.encode_ms) / 16
+                    return data, level, 0, capture_ms
+                if decision == vad.COMFORT_NOISE:
+                    return b'', self.vad.comfort_noise_level, FLAG_CN, capture_ms
+            except Exception as e:
+                print(f"[Audio] Capture error: {e}")
+
+    @property
+    def capture_overflows(self):
+        """Captured samples dropped because the sender thread fell behind."""
+        return self.capture_ring.overflows
+
+    def latency_estimate(self, network_ms=0.0):
+        """
+        Mouth-to-ear delay budget in ms for the current frame and block sizes,
+        using what has been measured so far: device latency once a stream is
+        open, the capture backlog, encode time and each speaker's jitter buffer
+        target (the deepest one counts). `network_ms` is the one-way transit
+        time, which only the caller knows.
+        """
+        block_ms = 1000 * self.block_size / self.sample_rate
+        device_in = device_out = block_ms
+        if self.stream is not None:
+            try:
+                device_in, device_out = (1000 * s for s in self.stream.latency)
+            except:
+                pass
+        with self._lock:
+            # Playout starts once `target` packets are in, the first of which is
+            # already covered by packetization
+            buffered = [(jb.target_frames - 1) * jb.frame_ms for jb in self.jitter_buffers.values()]
+        if not buffered:
+            jb = JitterBuffer(self.frame_ms, min_delay_ms=self.min_delay_ms)
+            buffered = [(jb.target_frames - 1) * jb.frame_ms]
+        stages = {
+            "device_in": device_in,
+            # A packet leaves once its last sample is captured, and samples arrive a block at a time
+            "packetization": max(self.frame_ms, block_ms),
+            # Whole frames waiting for the sender thread, beyond the one being filled
+            "capture_queue": 1000 * max(0, self.capture_ring.available() - self.frame_size) / self.sample_rate,
+            "encode": self.encode_ms,
+            "network": network_ms,
+            "jitter_buffer": max(buffered),
+            "device_out": device_out,
+        }
+        stages["total"] = sum(stages.values())
+        return {name: round(ms, 2) for name, ms in stages.items()}
+
+    def _comfort_noise(self, level, frames, index):
+        # Different offset per user so two silent users' noise doesn't add up coherently
+        start = (self._noise_pos + index * 997) % self._noise_len
+        amplitude = 32768.0 * 10 ** (-level / 20)
+        self.mixer.add_scaled(self._noise[start:start + frames], amplitude)
 
     def add_user(self, username):
         with self._lock:
-            if username not in self.output_queues:
-                self.output_queues[username] = queue.Queue()
+            self._jitter_buffer(username)
 
     def remove_user(self, username):
         with self._lock:
-            if username in self.output_queues:
-                del self.output_queues[username]
+            self.jitter_buffers.pop(username, None)
+            self.comfort_levels.pop(username, None)
+            self._rx_seq.pop(username, None)
+            self._last_pcm.pop(username, None)
+            self._resamplers.pop(username, None)
+            self._playout.pop(username, None)
+
+    def _jitter_buffer(self, username):
+        jb = self.jitter_buffers.get(username)
+        if jb is None:
+            jb = self.jitter_buffers[username] = JitterBuffer(self.frame_ms, min_delay_ms=self.min_delay_ms)
+        return jb
+
+    def set_fec_group(self, username, group):
+        """
+        `username` sends FEC parity over `group` frames: raises the floor of its
+        jitter buffer to that many frames, so a frame rebuilt when the parity
+        arrives is still in time to be played. Other senders keep `min_delay_ms`.
+        """
+        with self._lock:
+            jb = self._jitter_buffer(username)
+            jb.min_delay_ms = max(self.min_delay_ms, group * jb.frame_ms)
+            jb.set_frame_ms(jb.frame_ms)
+
+    def set_codec(self, codec):
+        """Switches the capture encoder (ID or name), e.g. to what the server agreed to."""
+        if isinstance(codec, str):
+            codec = audio_codecs.BY_NAME[codec]
+        if codec != self.encoder.ID:
+            self.encoder = audio_codecs.create(codec)
+
+    def receive_audio(self, username, data, seq=None, timestamp=None, codec=audio_codecs.ZLIB, rate=None):
+        """
+        Decodes a frame on the caller's (network) thread, resamples it to our
+        device rate if the sender runs at another `rate`, and queues the PCM for
+        playout, so the audio callback never runs the codec.
+        """
+        arrival_ms = time.monotonic() * 1000
+        if len(data) < 2:
+            return
+        try:
+            pcm = audio_codecs.get(codec).decode(data).reshape(-1, self.channels)
+            if rate and rate != self.sample_rate:
+                pcm = self._resampler(username, rate).process(pcm)
+        except Exception as e:
+            print(f"[Audio] Decode error for {username}: {e}")
+            return
+        frame_ms = 1000 * len(pcm) / self.sample_rate
+        with self._lock:
+            if seq is None:
+                # Legacy server: no sequence numbers, trust arrival order
+                seq = self._rx_seq.get(username, 0)
+                self._rx_seq[username] = (seq + 1) & 0xFFFF
+            jb = self._jitter_buffer(username)
+            if abs(frame_ms - jb.frame_ms) >= 1: # Sender uses another packet duration
+                jb.set_frame_ms(frame_ms)
+            jb.put(seq, timestamp, pcm, arrival_ms)
+            self.comfort_levels.pop(username, None) # Talking again
+
+    def _resampler(self, username, rate):
+        from_rate, resampler = self._resamplers.get(username, (None, None))
+        if from_rate != rate:
+            resampler = Resampler(rate, self.sample_rate, self.channels)
+            self._resamplers[username] = (rate, resampler)
+        return resampler
+
+    def receive_comfort_noise(self, username, level):
+        """Sender went silent (DTX): play noise at its background level until audio resumes."""
+        with self._lock:
+            self._jitter_buffer(username)
+            self.comfort_levels[username] = level
 
-    def receive_audio(self, username, data):
+    def jitter_stats(self):
+        """Per-speaker buffer depth, target delay, jitter and late/lost counters."""
         with self._lock:
-            if username not in self.output_queues:
-                self.output_queues[username] = queue.Queue()
-            self.output_queues[username].put(data)
+            return {username: jb.stats() for username, jb in self.jitter_buffers.items()}
 
     def set_mute(self, state):
         self.muted = state
@@ -0,0 +1,88 @@
+"""
+Audio packet layouts (packet type 1).
+
+    v1 (legacy): [1] [b'SPK!'] [NameLen] [Name] [AudioData]
+                 clients send NameLen 0, the server fills in the sender's name
+    v2:          [1] [b'SPK2'] [SenderId (u16)] [Flags (u8)] [Level (u8)]
+                 [Seq (u16)] [Timestamp (u32)] [AudioData]
+                 clients send SenderId 0, the server fills in the roster id
+    v3:          [1] [b'SPK3'] [SenderId (u16)] [Flags (u8)] [Level (u8)]
+                 [Codec (u8)] [Rate (u16)] [Seq (u16)] [Timestamp (u32)] [AudioData]
+
+v2 is spoken by peers that negotiated control version >= 2 at JOIN, since
+receivers need the roster to map SenderId back to a name. Level is the
+frame's loudness in -dBov (0 = full scale, 127 = silence), as in RFC 6464,
+so the server can rank speakers without decoding audio. Seq counts packets
+per sender (wrapping at 2^16) and Timestamp is the capture time of the frame
+in ms on the sender's media clock (wrapping at 2^32); the server passes both
+through untouched so receivers can reorder, detect loss and measure jitter.
+
+v3 adds the codec (see audio_codecs.py) and the sample rate in Hz, so
+senders in one room can use different codecs and run at whatever rate their
+hardware prefers; receivers decode and resample per stream. v1 and v2
+AudioData is always zlib at LEGACY_RATE; the server transcodes for peers
+below V3_CTL when a v3 sender uses anything else.
+
+With DTX the sender skips silent frames and sends a FLAG_CN packet with an
+empty AudioData instead, now and then, so receivers can fill the gap with
+noise at the right level. CN markers are never sent in the v1 layout.
+
+With FEC the sender also sends FLAG_FEC parity packets in the v3 layout
+(see fec.py), which only go to peers at control version FEC_CTL or above.
+"""
+import struct
+import numpy as np
+
+MAGIC_V1 = b'SPK!'
+MAGIC_V2 = b'SPK2'
+MAGIC_V3 = b'SPK3'
+V2_CTL = 2 # Control version from which v2 audio is used
+V3_CTL = 3 # ... and v3
+FEC_CTL = 5 # ... and from which FLAG_FEC parity packets are understood
+
+MIX_SENDER_ID = 0 # Server-mixed (MCU) stream
+SILENCE = 127
+LEGACY_RATE = 16000 # What v1/v2 peers run at
+
+# v2 flags
+FLAG_CN = 0x01 # Comfort-noise marker: no audio, Level is the sender's background noise
+FLAG_FEC = 0x02 # Parity over a group of the sender's packets, not a frame (v3 only)
+
+_V2 = struct.Struct("!4sHBBHI")
+_V3 = struct.Struct("!4sHBBBHHI")
+V2_HEADER_SIZE = 1 + _V2.size
+V3_HEADER_SIZE = 1 + _V3.size
+
+def encode_v1(name, data):
+    name_bytes = name.encode()[:255]
+    return b''.join((b'\x01', MAGIC_V1, bytes([len(name_bytes)]), name_bytes, data))
+
+def encode_v2(sender_id, flags, level, seq, timestamp, data):
+    return b'\x01' + _V2.pack(MAGIC_V2, sender_id, flags, level, seq, timestamp) + data
+
+def encode_v3(sender_id, flags, level, codec, rate, seq, timestamp, data):
+    return b'\x01' + _V3.pack(MAGIC_V3, sender_id, flags, level, codec, rate, seq, timestamp) + data
+
+def relay_v2(payload, sender_id):
+    """Rewrites SenderId in a client's v2 or v3 payload (type byte stripped) for relaying."""
+    return b'\x01' + payload[:4] + struct.pack("!H", sender_id) + payload[6:]
+
+def parse_v2(payload):
+    """Parses a type-1 payload (type byte stripped) that starts with MAGIC_V2."""
+    _, sender_id, flags, level, seq, timestamp = _V2.unpack_from(payload, 0)
+    return sender_id, flags, level, seq, timestamp, payload[_V2.size:]
+
+def parse_v3(payload):
+    """Parses a type-1 payload (type byte stripped) that starts with MAGIC_V3."""
+    _, sender_id, flags, level, codec, rate, seq, timestamp = _V3.unpack_from(payload, 0)
+    return sender_id, flags, level, codec, rate, seq, timestamp, payload[_V3.size:]
+
+def level_from_pcm(pcm):
+    """RFC 6464 audio level of an int16 frame: 0 (loudest) .. 127 (silence)."""
+    samples = np.asarray(pcm, dtype=np.float32).ravel()
+    if samples.size == 0:
+        return SILENCE
+    rms = np.sqrt(np.dot(samples, samples) / len(samples)) / 32768.0
+    if rms <= 0:
+        return SILENCE
+    return int(min(SILENCE, max(0, round(-20 * np.log10(rms)))))
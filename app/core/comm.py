@@ -1,61 +1,165 @@
 import socket
+import struct
 import threading
 import time
 from .audio import AudioEngine
-from .network import NetworkManager
+from .network import NetworkManager, PROTOCOL
+from .fanout import FanOut
+
+# Compact packet: [MAGIC (u8)] [flags (u8)] [sender index (u32)] [sample rate (u32)] [PCM...]
+# Legacy packets start with the sender's UUID ("<id>@<rate>|<PCM>"), never with MAGIC.
+MAGIC = 0xA7
+FLAG_RELAY = 0x01 # Sent to the host only, for it to pass on to everyone else
+FLAG_HEARTBEAT = 0x02 # No audio, just keeps us in the peer's registry (sent to each peer directly)
+_HEADER = struct.Struct("!BBII")
 
 class CommunicationBridge:
     """
     Connects NetworkManager and AudioEngine.
     Handles the actual UDP audio data transfer between peers.
+
+    Up to MESH_MAX participants everyone sends every frame to everyone. Past
+    that, peers send one copy to the elected host, flagged FLAG_RELAY, and the
+    host passes it on to all the others, so a peer's uplink stays one stream
+    however big the group gets. The host relays whatever arrives flagged,
+    even if it doesn't think it is the host (yet), so peers that briefly
+    disagree about the election still hear each other. Peers that advertise
+    no PROTOCOL get the legacy format straight from everyone.
+
+    Every packet from a peer counts as a sign of life for NetworkManager's
+    expiry; a FLAG_HEARTBEAT packet goes to every peer each HEARTBEAT_INTERVAL
+    so silent (muted) peers stay in too.
     """
+    MESH_MAX = 4 # Participants, us included
+
     def __init__(self, network_manager, audio_engine):
         self.nm = network_manager
         self.ae = audio_engine
         self.is_running = False
-        
+
         self.udp_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         # Allow multiple instances on the same machine to bind to the same port for local testing
         self.udp_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         self.udp_sock.bind(('', self.nm.port))
-        
+        self._route_state = (None, None) # registry version, route; rebuilt when the peers or the host change
+
     def start(self):
         self.is_running = True
+        self._prefix = f"{self.nm.id}@{self.ae.sample_rate}|".encode()
+        self._headers = {flags: _HEADER.pack(MAGIC, flags, self.nm.index, self.ae.sample_rate)
+                         for flags in (0, FLAG_RELAY, FLAG_HEARTBEAT)}
         threading.Thread(target=self._send_loop, daemon=True).start()
         threading.Thread(target=self._receive_loop, daemon=True).start()
+        threading.Thread(target=self._heartbeat_loop, daemon=True).start()
+
+    def _route(self):
+        """
+        Returns (FanOut our frames go to, their flags, FanOut of every compact
+        peer for relaying, another for heartbeats, {index: peer id},
+        {index: addr}, [legacy addrs]), all derived from one registry snapshot.
+        Each FanOut is only ever sent on by one thread: send() reuses its
+        ctypes buffers and reorders recipients to exclude one.
+        """
+        snap = self.nm.registry.snapshot
+        cached_version, route = self._route_state
+        if cached_version == snap.version:
+            return route
+
+        compact, legacy, addrs = [], [], {}
+        for peer_id, info in snap.peers.items():
+            addr = (info['address'], info['port'])
+            if info.get('proto', 1) >= PROTOCOL:
+                compact.append(addr)
+                addrs[info['index']] = addr
+            else:
+                legacy.append(addr)
+        flags = 0
+        targets = compact
+        host = snap.peers.get(snap.host_id)
+        if len(snap.peers) + 1 > self.MESH_MAX and host and host.get('proto', 1) >= PROTOCOL:
+            flags = FLAG_RELAY
+            targets = [(host['address'], host['port'])]
+        send = FanOut(self.udp_sock)
+        send.update(targets)
+        relay = FanOut(self.udp_sock)
+        relay.update(compact)
+        beat = FanOut(self.udp_sock)
+        beat.update(compact)
+        route = (send, flags, relay, beat, snap.by_index, addrs, legacy)
+        self._route_state = (snap.version, route)
+        return route
 
     def _send_loop(self):
         while self.is_running:
             try:
                 # Get audio data from engine
-                data = self.ae.input_queue.get(timeout=1)
-                
-                # Send to all known peers
-                # In a more optimized version, we might only send to the host 
-                # or use multicast, but for small groups P2P is fine.
-                for peer_id, info in self.nm.peers.items():
+                data = self.ae.read_frame(timeout=1)
+                if data is None:
+                    continue
+
+                # One payload per format, whatever the number of peers
+                send, flags, _, _, _, _, legacy = self._route()
+                if send:
+                    for addr, err in send.send(self._headers[flags] + data):
+                        print(f"[Comm] Send error to {addr}: {err}")
+                for addr in legacy:
                     try:
-                        # Prepend ID so receiver knows who spoke
-                        payload = self.nm.id.encode() + b'|' + data.tobytes()
-                        self.udp_sock.sendto(payload, (info['address'], info['port']))
+                        self.udp_sock.sendto(self._prefix + data, addr)
                     except Exception as e:
-                        print(f"[Comm] Send error to {peer_id}: {e}")
-            except Exception:
-                continue
+                        print(f"[Comm] Send error to {addr}: {e}")
+            except Exception as e:
+                if self.is_running:
+                    print(f"[Comm] Send loop error: {e}")
+
+    def _heartbeat_loop(self):
+        while self.is_running:
+            _, _, _, beat, _, _, _ = self._route()
+            try:
+                beat.send(self._headers[FLAG_HEARTBEAT]) # Failures show up as the peer expiring
+            except OSError:
+                pass # Closed during shutdown
+            time.sleep(self.nm.HEARTBEAT_INTERVAL)
 
     def _receive_loop(self):
         while self.is_running:
             try:
                 data, addr = self.udp_sock.recvfrom(4096)
-                if b'|' in data:
+                if data and data[0] == MAGIC and len(data) >= _HEADER.size:
+                    _, flags, index, rate = _HEADER.unpack_from(data)
+                    if index == self.nm.index:
+                        continue # Our own frame, relayed back
+                    _, _, relay, _, ids, addrs, _ = self._route()
+                    peer_id = ids.get(index)
+                    if peer_id is None and flags & FLAG_HEARTBEAT:
+                        peer_id = self.nm.revive(index)
+                    if peer_id is not None:
+                        self.nm.heard_from(peer_id)
+                    if flags & FLAG_HEARTBEAT:
+                        continue
+                    if flags & FLAG_RELAY:
+                        # Pass it on unflagged, to everyone but whoever spoke
+                        out = bytearray(data)
+                        out[1] = flags & ~FLAG_RELAY
+                        for peer_addr, err in relay.send(bytes(out), exclude=addrs.get(index)):
+                            print(f"[Comm] Relay error to {peer_addr}: {err}")
+                    if peer_id is None:
+                        peer_id = index # Before discovery catches up, the index is all we know
+                    audio_data = data[_HEADER.size:]
+                elif b'|' in data:
                     peer_id_bytes, audio_data = data.split(b'|', 1)
-                    peer_id = peer_id_bytes.decode()
-                    
-                    # If we don't know this peer stream yet, add it
-                    if peer_id not in self.ae.output_queues:
-                        self.ae.add_peer_stream(peer_id)
-                        
-                    self.ae.receive_audio(peer_id, audio_data)
+                    # "<id>@<rate>"; older peers send just "<id>"
+                    peer_id, _, rate = peer_id_bytes.decode().partition('@')
+                    rate = int(rate) if rate else None
+                    if peer_id in self.nm.peers:
+                        self.nm.heard_from(peer_id)
+                else:
+                    continue
+
+                # If we don't know this peer stream yet, add it
+                if peer_id not in self.ae.output_queues:
+                    self.ae.add_peer_stream(peer_id)
+
+                self.ae.receive_audio(peer_id, audio_data, rate)
             except Exception as e:
                 if self.is_running:
                     print(f"[Comm] Receive error: {e}")
@@ -0,0 +1,172 @@
+"""
+Binary control protocol (packet type 2).
+
+    [2 (Type)] [VERSION (1 byte)] [OPCODE (1 byte)] [BODY...]
+
+JOIN itself always goes out as a type-0 JSON command carrying
+"caps": {"ctl": VERSION}; a server that understands this encoding answers
+with a binary JOIN_ACK and both sides switch to it for the rest of the
+session. Peers that never advertise it keep getting JSON.
+
+Version 2 adds the versioned roster: one ROSTER_SNAPSHOT (split into parts
+if needed) followed by small sequence-numbered ROSTER_DELTA messages. A
+client that sees a gap in the sequence sends ROSTER_REQUEST for a fresh
+snapshot. Version 1 clients keep getting full PARTICIPANTS lists.
+
+Version 3 adds codec negotiation: JOIN caps carry "codec" (a name from
+audio_codecs), and JOIN_ACK answers with the ID of the codec the client
+should send, which is zlib if the server doesn't know the one asked for.
+
+Version 4 adds link measurement on the heartbeat. PING carries a sequence
+number and the client's send time, plus the server time from the last PONG
+and how long the client held it; PONG echoes the PING and adds the server's
+own time. The client gets its RTT from each PONG, the server from the next
+PING (RTCP-style: now - echoed time - hold time), and sequence gaps on both
+sides count lost heartbeats. Older peers send and get bodyless PINGs.
+
+Version 5 adds FEC: clients may follow their audio with parity packets
+(audio_packet.FLAG_FEC, see fec.py), which the server only relays to
+clients at this version. Nothing in the control encoding itself changes.
+"""
+import struct
+
+PACKET_TYPE = 2
+VERSION = 5
+ROSTER_VERSION = 2 # First version that uses snapshots + deltas
+CODEC_VERSION = 3 # First version that negotiates the audio codec
+STATS_VERSION = 4 # First version with timestamped PING/PONG
+
+JOIN = 1
+JOIN_ACK = 2
+LEAVE = 3
+PING = 4
+PARTICIPANTS = 5
+ROSTER_SNAPSHOT = 6
+ROSTER_DELTA = 7
+ROSTER_REQUEST = 8
+PONG = 9
+
+JOINED = 1
+LEFT = 2
+_OPS = {"JOINED": JOINED, "LEFT": LEFT}
+_OP_NAMES = {v: k for k, v in _OPS.items()}
+
+SNAPSHOT_PART_BYTES = 1200 # Keep each snapshot datagram under a typical MTU
+
+_HEADER = struct.Struct("!BBB")
+_SNAPSHOT = struct.Struct("!IBB") # seq, part, parts
+_DELTA = struct.Struct("!IBH") # seq, op, client id
+_MEMBER = struct.Struct("!HB") # client id, name length
+_PING = struct.Struct("!HIII") # seq, sent ms, echoed server ms, ms held since that PONG
+_PONG = struct.Struct("!HII") # echoed seq, echoed sent ms, server ms
+
+def _encode_name(name):
+    raw = name.encode()[:255]
+    return bytes([len(raw)]) + raw
+
+def _decode_name(body, offset=0):
+    n = body[offset]
+    end = offset + 1 + n
+    return body[offset + 1:end].decode(errors="replace"), end
+
+def _encode_names(names):
+    # NUL-separated rather than length-prefixed: split() runs in C, a per-name loop doesn't
+    return b'\0'.join(n.replace('\0', '').encode() for n in names)
+
+def _decode_names(body):
+    if not body:
+        return []
+    return body.decode(errors="replace").split('\0')
+
+def _encode_snapshot(args):
+    body = [_SNAPSHOT.pack(args["seq"], args["part"], args["parts"])]
+    for client_id, name in args["members"]:
+        raw = name.encode()[:255]
+        body.append(_MEMBER.pack(client_id, len(raw)) + raw)
+    return b''.join(body)
+
+def _decode_snapshot(body):
+    seq, part, parts = _SNAPSHOT.unpack_from(body, 0)
+    members = []
+    offset = _SNAPSHOT.size
+    while offset < len(body):
+        client_id, n = _MEMBER.unpack_from(body, offset)
+        offset += _MEMBER.size
+        members.append((client_id, body[offset:offset + n].decode(errors="replace")))
+        offset += n
+    return {"seq": seq, "part": part, "parts": parts, "members": members}
+
+def _encode_delta(args):
+    return _DELTA.pack(args["seq"], _OPS[args["op"]], args["id"]) + (args.get("name") or "").encode()[:255]
+
+def _decode_delta(body):
+    seq, op, client_id = _DELTA.unpack_from(body, 0)
+    return {"seq": seq, "op": _OP_NAMES[op], "id": client_id, "name": body[_DELTA.size:].decode(errors="replace")}
+
+def _encode_join_ack(args):
+    if "codec" in args:
+        return bytes([args["ctl"], args["codec"]])
+    return bytes([args["ctl"]])
+
+def _decode_join_ack(body):
+    if len(body) > 1:
+        return {"ctl": body[0], "codec": body[1]}
+    return {"ctl": body[0]}
+
+def _encode_ping(args):
+    if not args:
+        return b''
+    return _PING.pack(args["seq"], args["ts"], args.get("echo", 0), args.get("held", 0))
+
+def _decode_ping(body):
+    if len(body) < _PING.size:
+        return None # Plain keep-alive from an older peer
+    seq, ts, echo, held = _PING.unpack_from(body, 0)
+    return {"seq": seq, "ts": ts, "echo": echo, "held": held}
+
+def _encode_pong(args):
+    return _PONG.pack(args["seq"], args["ts"], args["server_ts"])
+
+def _decode_pong(body):
+    seq, ts, server_ts = _PONG.unpack_from(body, 0)
+    return {"seq": seq, "ts": ts, "server_ts": server_ts}
+
+def snapshot_parts(seq, members):
+    """Splits a roster [(id, name)] into ROSTER_SNAPSHOT args that each fit one datagram."""
+    chunks = [[]]
+    size = 0
+    for client_id, name in members:
+        entry = _MEMBER.size + len(name.encode()[:255])
+        if chunks[-1] and size + entry > SNAPSHOT_PART_BYTES:
+            chunks.append([])
+            size = 0
+        chunks[-1].append((client_id, name))
+        size += entry
+    return [{"seq": seq, "part": i, "parts": len(chunks), "members": chunk} for i, chunk in enumerate(chunks)]
+
+# cmd name: (opcode, encode(args) -> body, decode(body) -> args)
+_CODECS = {
+    "JOIN": (JOIN, _encode_name, lambda body: _decode_name(body)[0]),
+    "JOIN_ACK": (JOIN_ACK, _encode_join_ack, _decode_join_ack),
+    "LEAVE": (LEAVE, lambda args: _encode_name(args or ""), lambda body: _decode_name(body)[0] if body else None),
+    "PING": (PING, _encode_ping, _decode_ping),
+    "PONG": (PONG, _encode_pong, _decode_pong),
+    "PARTICIPANTS": (PARTICIPANTS, _encode_names, _decode_names),
+    "ROSTER_SNAPSHOT": (ROSTER_SNAPSHOT, _encode_snapshot, _decode_snapshot),
+    "ROSTER_DELTA": (ROSTER_DELTA, _encode_delta, _decode_delta),
+    "ROSTER_REQUEST": (ROSTER_REQUEST, lambda args: b'', lambda body: None),
+}
+_BY_OPCODE = {op: (cmd, dec) for cmd, (op, enc, dec) in _CODECS.items()}
+
+def encode(cmd, args=None, version=VERSION):
+    """Returns the full datagram (type byte included) for a command."""
+    opcode, enc, _ = _CODECS[cmd]
+    return _HEADER.pack(PACKET_TYPE, version, opcode) + enc(args)
+
+def decode(payload):
+    """Parses a type-2 payload (type byte already stripped) into (cmd, args)."""
+    version, opcode = payload[0], payload[1]
+    if version > VERSION:
+        raise ValueError(f"Unsupported control version {version}")
+    cmd, dec = _BY_OPCODE[opcode]
+    return cmd, dec(payload[2:])
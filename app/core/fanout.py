@@ -0,0 +1,155 @@
+import ctypes
+import ctypes.util
+import errno
+import os
+import socket
+import sys
+
+class _SockAddrIn(ctypes.Structure):
+    _fields_ = [
+        ("sin_family", ctypes.c_ushort),
+        ("sin_port", ctypes.c_uint16), # Network byte order
+        ("sin_addr", ctypes.c_uint8 * 4),
+        ("sin_zero", ctypes.c_uint8 * 8),
+    ]
+
+class _IoVec(ctypes.Structure):
+    _fields_ = [("iov_base", ctypes.c_void_p), ("iov_len", ctypes.c_size_t)]
+
+class _MsgHdr(ctypes.Structure):
+    _fields_ = [
+        ("msg_name", ctypes.c_void_p),
+        ("msg_namelen", ctypes.c_uint32),
+        ("msg_iov", ctypes.POINTER(_IoVec)),
+        ("msg_iovlen", ctypes.c_size_t),
+        ("msg_control", ctypes.c_void_p),
+        ("msg_controllen", ctypes.c_size_t),
+        ("msg_flags", ctypes.c_int),
+    ]
+
+class _MMsgHdr(ctypes.Structure):
+    _fields_ = [("msg_hdr", _MsgHdr), ("msg_len", ctypes.c_uint)]
+
+def _load_sendmmsg():
+    # sendmmsg(2) is Linux-only; everywhere else we fall back to a sendto loop
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or None, use_errno=True)
+        fn = libc.sendmmsg
+    except (OSError, AttributeError):
+        return None
+    fn.argtypes = [ctypes.c_int, ctypes.POINTER(_MMsgHdr), ctypes.c_uint, ctypes.c_int]
+    fn.restype = ctypes.c_int
+    return fn
+
+_sendmmsg = _load_sendmmsg()
+
+class FanOut:
+    """
+    Precomputed recipient set for relaying one datagram to many clients.
+
+    update() is called on join/leave and rebuilds everything that depends on
+    the recipient list. send() does no per-recipient setup: on Linux the whole
+    batch goes out with one sendmmsg(2) call (all messages share one iovec
+    pointing at the payload), elsewhere it is a tight sendto loop. Failures are
+    returned per recipient instead of being swallowed. Not thread-safe: give
+    each sending thread its own FanOut.
+    """
+    def __init__(self, sock, batched=True):
+        self.sock = sock
+        self.batched = batched and _sendmmsg is not None and sock.family == socket.AF_INET
+        self._addrs = []
+        self._index = {} # addr: position in _addrs (and in the ctypes arrays)
+        self._names = None
+        self._msgs = None
+        self._iov = _IoVec()
+
+    def __len__(self):
+        return len(self._addrs)
+
+    def __contains__(self, addr):
+        return addr in self._index
+
+    @property
+    def recipients(self):
+        return tuple(self._addrs)
+
+    def update(self, addrs):
+        self._addrs = list(addrs)
+        self._index = {addr: i for i, addr in enumerate(self._addrs)}
+        if not self.batched:
+            return
+
+        n = len(self._addrs)
+        self._names = (_SockAddrIn * n)()
+        self._msgs = (_MMsgHdr * n)()
+        iov_ptr = ctypes.pointer(self._iov)
+        for i, addr in enumerate(self._addrs):
+            self._fill_name(i, addr)
+            hdr = self._msgs[i].msg_hdr
+            hdr.msg_name = ctypes.addressof(self._names[i])
+            hdr.msg_namelen = ctypes.sizeof(_SockAddrIn)
+            hdr.msg_iov = iov_ptr
+            hdr.msg_iovlen = 1
+
+    def _fill_name(self, i, addr):
+        name = self._names[i]
+        name.sin_family = socket.AF_INET
+        name.sin_port = socket.htons(addr[1])
+        name.sin_addr[:] = socket.inet_aton(addr[0])
+
+    def _move_to_end(self, i):
+        """Swaps recipient i with the last one so a batch of n-1 skips it."""
+        last = len(self._addrs) - 1
+        if i == last:
+            return
+        a, b = self._addrs[i], self._addrs[last]
+        self._addrs[i], self._addrs[last] = b, a
+        self._index[a], self._index[b] = last, i
+        if self._names is not None:
+            tmp = _SockAddrIn.from_buffer_copy(self._names[i])
+            self._names[i] = self._names[last]
+            self._names[last] = tmp
+
+    def send(self, payload, exclude=None):
+        """Sends payload to every recipient except `exclude`. Returns [(addr, OSError)]."""
+        count = len(self._addrs)
+        i = self._index.get(exclude) if exclude is not None else None
+        if i is not None:
+            self._move_to_end(i)
+            count -= 1
+        if count <= 0:
+            return []
+        if self.batched:
+            return self._send_batch(payload, count)
+
+        failures = []
+        sendto = self.sock.sendto
+        for addr in self._addrs[:count]:
+            try:
+                sendto(payload, addr)
+            except OSError as e:
+                failures.append((addr, e))
+        return failures
+
+    def _send_batch(self, payload, count):
+        buf = ctypes.c_char_p(payload) # Borrows the bytes object's buffer, no copy
+        self._iov.iov_base = ctypes.cast(buf, ctypes.c_void_p)
+        self._iov.iov_len = len(payload)
+
+        failures = []
+        fd = self.sock.fileno()
+        offset = 0
+        while offset < count:
+            sent = _sendmmsg(fd, ctypes.byref(self._msgs[offset]), count - offset, 0)
+            if sent < 0:
+                # sendmmsg stops at the first failing message; report it and carry on
+                err = ctypes.get_errno()
+                if err == errno.EINTR:
+                    continue
+                failures.append((self._addrs[offset], OSError(err, os.strerror(err))))
+                offset += 1
+            else:
+                offset += sent
+        return failures
@@ -0,0 +1,125 @@
+"""
+Forward error correction for the audio path: XOR parity over groups of packets.
+
+A sender with strength k follows every k audio packets with one parity
+packet, a v3 packet flagged FLAG_FEC (see audio_packet.py) whose Seq is the
+first Seq of its group and whose AudioData is
+
+    [Count (u8)] [XOR of the group's units, each zero-padded to the longest]
+
+where a packet's unit is [Flags (u8)] [Level (u8)] [Timestamp (u32)]
+[Length (u16)] [AudioData]. A receiver missing exactly one packet of a group
+XORs the parity with the units it has and gets the lost one back, header
+and all, without a retransmission round trip; Codec and Rate come from the
+parity packet. Two losses in one group are left to concealment.
+
+k trades bandwidth for protection: parity adds 1/k of the packets (each
+as big as the group's largest frame), and a group of k only survives a loss
+if the other k packets arrive. A lost frame comes back when the parity does,
+up to k frames later, so the receiver's jitter buffer has to be that deep
+for it to still be played. A CN marker closes a group early, so the end of
+a talk spurt doesn't wait for the next one to be protected (the markers sent
+on their own during silence aren't).
+"""
+import struct
+from .audio_packet import FLAG_CN
+from .jitter import seq_diff
+
+_UNIT = struct.Struct("!BBIH") # flags, level, timestamp, length
+
+def _unit(flags, level, timestamp, data):
+    # Little-endian ints pad with zeros at the end, which is what XOR over unequal lengths needs
+    return int.from_bytes(_UNIT.pack(flags, level, timestamp, len(data)) + data, "little"), _UNIT.size + len(data)
+
+class FecEncoder:
+    """Sender side: fed every packet sent, returns a parity packet's (seq, data) when a group closes."""
+    def __init__(self, group):
+        if not 1 <= group <= 255:
+            raise ValueError("FEC group must be 1..255 packets")
+        self.group = group
+        self._first = None
+        self._count = 0
+        self._parity = 0
+        self._size = 0
+
+    def add(self, seq, flags, level, timestamp, data):
+        unit, size = _unit(flags, level, timestamp, data)
+        if not self._count:
+            self._first = seq
+        self._parity ^= unit
+        self._size = max(self._size, size)
+        self._count += 1
+        if self._count < self.group and not flags & FLAG_CN:
+            return None
+        out = (self._first, bytes([self._count]) + self._parity.to_bytes(self._size, "little"))
+        if self._count == 1 and flags & FLAG_CN:
+            out = None # A lone CN marker during silence: the next one will do
+        self._count = self._parity = self._size = 0
+        return out
+
+class FecDecoder:
+    """
+    Receiver side, one per sender: remembers the last WINDOW packets and the
+    parity not used yet, and rebuilds a packet as soon as it is the only one
+    of its group missing, whichever arrives last.
+    """
+    WINDOW = 64 # Packets (and parity groups) kept, by sequence number
+
+    def __init__(self):
+        self.units = {} # seq: (unit, size)
+        self.parity = {} # first seq: (count, parity, size)
+        self.newest = None
+        self.recovered = 0
+        self.group = 0 # Largest group seen: the sender's k, unless it never filled one
+
+    def add(self, seq, flags, level, timestamp, data):
+        """A packet arrived; returns the packets it let us rebuild, as [(seq, flags, level, timestamp, data)]."""
+        self.units[seq] = _unit(flags, level, timestamp, data)
+        self._advance(seq)
+        for first, (count, _, _) in list(self.parity.items()):
+            if 0 <= seq_diff(seq, first) < count:
+                return self._recover(first)
+        return []
+
+    def add_parity(self, first, data):
+        """A parity packet arrived (`first` is its Seq); returns what it let us rebuild, as add() does."""
+        if len(data) < 1 + _UNIT.size or not data[0]:
+            return []
+        self.parity[first] = (data[0], int.from_bytes(data[1:], "little"), len(data) - 1)
+        self.group = max(self.group, data[0])
+        self._advance((first + data[0] - 1) & 0xFFFF)
+        return self._recover(first)
+
+    def _recover(self, first):
+        count, parity, size = self.parity[first]
+        missing = None
+        for i in range(count):
+            seq = (first + i) & 0xFFFF
+            entry = self.units.get(seq)
+            if entry is None:
+                if missing is not None:
+                    return [] # Two gone: wait, one may still turn up late
+                missing = seq
+            else:
+                parity ^= entry[0]
+        del self.parity[first]
+        if missing is None:
+            return []
+        if parity.bit_length() > 8 * size:
+            return [] # One of the units isn't what the sender had (a stale one from before a wrap)
+        raw = parity.to_bytes(size, "little")
+        flags, level, timestamp, length = _UNIT.unpack_from(raw)
+        if _UNIT.size + length > size:
+            return []
+        data = raw[_UNIT.size:_UNIT.size + length]
+        self.units[missing] = _unit(flags, level, timestamp, data)
+        self.recovered += 1
+        return [(missing, flags, level, timestamp, data)]
+
+    def _advance(self, seq):
+        if self.newest is None or seq_diff(seq, self.newest) > 0:
+            self.newest = seq
+        if len(self.units) > 2 * self.WINDOW or len(self.parity) > self.WINDOW:
+            newest = self.newest
+            self.units = {s: u for s, u in self.units.items() if 0 <= seq_diff(newest, s) < self.WINDOW}
+            self.parity = {s: p for s, p in self.parity.items() if 0 <= seq_diff(newest, s) < self.WINDOW}
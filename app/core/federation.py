@@ -0,0 +1,106 @@
+"""
+Server-to-server links (packet type 3) for rooms that span several relays.
+
+    [3 (Type)] [OPCODE (1 byte)] [BODY...]
+
+    MEMBERS  [version (u32)] [part (u8)] [parts (u8)], then per local client
+             [id (u16)] [room_len (u8)] [room] [name_len (u8)] [name]
+    AUDIO    one local speaker's frame as a v3 audio datagram (type byte
+             included), SenderId being the speaker's id on the origin relay
+    BYE      empty, the origin relay is shutting down
+
+Every relay lists all the others (a full mesh) and only accepts this packet
+type from them. Each one announces its own clients in MEMBERS, on every
+change and every PEER_INTERVAL seconds, which doubles as the link keep-alive;
+the receiver swaps in the whole list whenever the version differs from the
+one it applied, so a lost or reordered announcement heals on the next one.
+A relay forwards each frame from one of its own clients once to every peer
+that has members in that room, and relays what a peer forwards only to its
+own clients, never on to other peers, so nothing can loop.
+"""
+import socket
+import struct
+
+PACKET_TYPE = 3
+
+MEMBERS = 1
+AUDIO = 2
+BYE = 3
+
+PEER_INTERVAL = 2.0 # Seconds between member announcements
+MEMBERS_PART_BYTES = 1200 # Keep each MEMBERS datagram under a typical MTU
+
+_MEMBERS = struct.Struct("!IBB") # version, part, parts
+_MEMBER = struct.Struct("!HB") # client id, room length
+
+def parse_peer(peer, default_port):
+    """"host", "host:port" or (host, port) -> (ip, port), the address its datagrams come from."""
+    if isinstance(peer, str):
+        host, _, port = peer.rpartition(":") if ":" in peer else (peer, "", "")
+        peer = (host, int(port) if port else default_port)
+    host, port = peer
+    return socket.gethostbyname(host), int(port)
+
+def _entry(client_id, room, name):
+    room, name = room.encode()[:255], name.encode()[:255]
+    return _MEMBER.pack(client_id, len(room)) + room + bytes([len(name)]) + name
+
+def encode_members(version, members):
+    """[(id, room, name)] -> one or more MEMBERS datagrams."""
+    chunks = [[]]
+    size = 0
+    for member in members:
+        entry = _entry(*member)
+        if chunks[-1] and size + len(entry) > MEMBERS_PART_BYTES:
+            chunks.append([])
+            size = 0
+        chunks[-1].append(entry)
+        size += len(entry)
+    return [bytes([PACKET_TYPE, MEMBERS]) + _MEMBERS.pack(version, i, len(chunks)) + b''.join(chunk)
+            for i, chunk in enumerate(chunks)]
+
+def decode_members(body):
+    """MEMBERS body (opcode stripped) -> (version, part, parts, [(id, room, name)])."""
+    version, part, parts = _MEMBERS.unpack_from(body, 0)
+    members = []
+    offset = _MEMBERS.size
+    while offset < len(body):
+        client_id, n = _MEMBER.unpack_from(body, offset)
+        offset += _MEMBER.size
+        room = body[offset:offset + n].decode(errors="replace")
+        offset += n
+        n = body[offset]
+        name = body[offset + 1:offset + 1 + n].decode(errors="replace")
+        offset += 1 + n
+        members.append((client_id, room, name))
+    return version, part, parts, members
+
+def encode_audio(datagram):
+    return bytes([PACKET_TYPE, AUDIO]) + datagram
+
+def encode_bye():
+    return bytes([PACKET_TYPE, BYE])
+
+class PeerLink:
+    """What one peer relay last told us: its members, and the rooms worth forwarding to it."""
+    def __init__(self, addr):
+        self.addr = addr
+        self.last_seen = None # Monotonic time of its last datagram
+        self.version = None # Of the member list applied
+        self.members = {} # its client id: (our roster id, room, name)
+        self.rooms = frozenset() # Rooms it has members in
+        self._parts = {} # part index: (version, members), while a list is arriving
+
+    def receive_part(self, version, part, parts, members):
+        """Returns the complete [(id, room, name)] once every part of one version is in, else None."""
+        if parts <= 1:
+            self._parts = {}
+            return members
+        if any(v != version for v, _ in self._parts.values()):
+            self._parts = {} # A newer announcement started
+        self._parts[part] = (version, members)
+        if len(self._parts) < parts:
+            return None
+        complete = [m for i in range(parts) for m in self._parts.get(i, (None, []))[1]]
+        self._parts = {}
+        return complete
@@ -0,0 +1,137 @@
+import math
+
+LOST = object() # get() result: a frame is missing here, play a concealment frame
+
+def seq_diff(a, b):
+    """a - b for 16-bit wrapping sequence numbers."""
+    return ((a - b + 0x8000) & 0xFFFF) - 0x8000
+
+class JitterBuffer:
+    """
+    Per-speaker playout buffer keyed by sequence number.
+
+    put() is called as packets arrive, get() once per playout frame from the
+    audio callback. The target depth adapts to the measured inter-arrival
+    jitter (RFC 3550 estimator on the sender's capture timestamps), frames
+    that arrive after their slot has been played are dropped as late, and the
+    buffer never holds more than `max_delay_ms`: on overflow the oldest frames
+    are discarded to get back to the target. A missing frame with newer ones
+    already queued is reported as LOST so the caller can conceal it; a few
+    consecutive misses with nothing queued means the speaker stopped, and the
+    buffer goes back to prefetching.
+    """
+    def __init__(self, frame_ms, min_delay_ms=40, max_delay_ms=400, max_conceal=3):
+        self.min_delay_ms = min_delay_ms
+        self.max_delay_ms = max_delay_ms
+        self.max_conceal = max_conceal
+        self.frame_ms = frame_ms
+        self.target_frames = 0
+        self.set_frame_ms(frame_ms)
+
+        self.frames = {} # seq: frame
+        self.next_seq = None # Next sequence number to play
+        self.playing = False
+        self.jitter_ms = 0.0
+
+        self.received = 0
+        self.late = 0 # Arrived after their slot was played (or duplicates)
+        self.lost = 0 # Concealed because a newer frame was already here
+        self.dropped = 0 # Discarded to enforce the latency cap
+        self.underruns = 0
+        self.consecutive_lost = 0
+
+        self._last_arrival = None
+        self._last_ts = None
+
+    def set_frame_ms(self, frame_ms):
+        """Re-derives the frame-count bounds (and keeps the target delay) when the sender's packet duration changes."""
+        target_ms = self.target_frames * self.frame_ms
+        self.frame_ms = frame_ms
+        self.min_frames = max(1, math.ceil(self.min_delay_ms / frame_ms))
+        self.max_frames = max(self.min_frames + 1, math.ceil(self.max_delay_ms / frame_ms))
+        self.target_frames = min(self.max_frames, max(self.min_frames, math.ceil(target_ms / frame_ms)))
+
+    @property
+    def depth(self):
+        return len(self.frames)
+
+    def put(self, seq, timestamp, frame, arrival_ms):
+        self.received += 1
+        self._update_jitter(timestamp, arrival_ms)
+
+        if self.next_seq is None:
+            self.next_seq = seq
+        elif seq_diff(seq, self.next_seq) < 0 or seq in self.frames:
+            if self.playing or seq in self.frames:
+                self.late += 1
+                return
+            self.next_seq = seq # Reordered while still prefetching: start earlier
+        self.frames[seq] = frame
+
+        # Latency cap: skip ahead to the newest `target` frames
+        if len(self.frames) > self.max_frames:
+            newest = max(self.frames, key=lambda s: seq_diff(s, self.next_seq))
+            keep_from = (newest - self.target_frames + 1) & 0xFFFF
+            for s in list(self.frames):
+                if seq_diff(s, keep_from) < 0:
+                    del self.frames[s]
+                    self.dropped += 1
+            self.next_seq = keep_from
+
+    def _update_jitter(self, timestamp, arrival_ms):
+        if timestamp is not None and self._last_ts is not None:
+            transit_delta = (arrival_ms - self._last_arrival) - ((timestamp - self._last_ts) & 0xFFFFFFFF)
+            if abs(transit_delta) < 10000: # Ignore wraps and DTX restarts
+                self.jitter_ms += (abs(transit_delta) - self.jitter_ms) / 16
+        self._last_arrival = arrival_ms
+        self._last_ts = timestamp
+        # Enough depth to ride out ~3x the mean jitter, within the configured bounds
+        wanted = math.ceil(3 * self.jitter_ms / self.frame_ms) + 1
+        self.target_frames = min(self.max_frames, max(self.min_frames, wanted))
+
+    def get(self):
+        """Returns the next frame, LOST, or None when there is nothing to play."""
+        if not self.playing:
+            if len(self.frames) < self.target_frames:
+                return None
+            self.playing = True
+            self.consecutive_lost = 0
+
+        frame = self.frames.pop(self.next_seq, None)
+        if frame is not None:
+            self.next_seq = (self.next_seq + 1) & 0xFFFF
+            self.consecutive_lost = 0
+            # Running deeper than needed (jitter went down): drop one frame to catch up
+            if len(self.frames) > self.target_frames + 2:
+                self.frames.pop(self.next_seq, None)
+                self.next_seq = (self.next_seq + 1) & 0xFFFF
+                self.dropped += 1
+            return frame
+
+        if not self.frames:
+            # Nothing queued: either a burst of loss or the speaker stopped (DTX)
+            self.consecutive_lost += 1
+            if self.consecutive_lost > self.max_conceal:
+                self.playing = False
+                self.next_seq = None
+                self.underruns += 1
+                return None
+            self.next_seq = (self.next_seq + 1) & 0xFFFF
+            return LOST
+
+        self.lost += 1
+        self.consecutive_lost += 1
+        self.next_seq = (self.next_seq + 1) & 0xFFFF
+        return LOST
+
+    def stats(self):
+        return {
+            "depth": self.depth,
+            "target_ms": self.target_frames * self.frame_ms,
+            "jitter_ms": round(self.jitter_ms, 2),
+            "received": self.received,
+            "late": self.late,
+            "lost": self.lost,
+            "dropped": self.dropped,
+            "underruns": self.underruns,
+        }
@@ -0,0 +1,84 @@
+import collections
+import itertools
+from .jitter import seq_diff
+
+class SeqTracker:
+    """
+    Loss accounting for one stream of 16-bit sequence numbers: every gap
+    counts as lost, reordered and duplicate packets count as late, and a jump
+    further than MAX_GAP is taken as the sender restarting. loss_rate covers
+    the last `window` sequence numbers.
+    """
+    MAX_GAP = 1000
+
+    def __init__(self, window=500):
+        self.next_seq = None
+        self.received = 0
+        self.lost = 0
+        self.late = 0
+        self._recent = collections.deque(maxlen=window) # 1 per packet that arrived, 0 per gap
+
+    def update(self, seq):
+        if self.next_seq is not None:
+            gap = seq_diff(seq, self.next_seq)
+            if gap < 0:
+                self.late += 1
+                return
+            if gap <= self.MAX_GAP:
+                self.lost += gap
+                self._recent.extend(itertools.repeat(0, min(gap, self._recent.maxlen)))
+        self.received += 1
+        self._recent.append(1)
+        self.next_seq = (seq + 1) & 0xFFFF
+
+    @property
+    def loss_rate(self):
+        if not self._recent:
+            return 0.0
+        return 1 - sum(self._recent) / len(self._recent)
+
+class LinkStats:
+    """
+    Rolling quality figures for one link: round-trip time from the heartbeat,
+    heartbeat loss, and loss plus RFC 3550 inter-arrival jitter of the audio
+    stream. Updated from the receive thread; snapshot() is what callers read.
+    """
+    def __init__(self, rtt_window=16):
+        self.rtt_ms = None # Smoothed like TCP's SRTT (1/8 gain)
+        self._rtts = collections.deque(maxlen=rtt_window)
+        self.pings = SeqTracker(window=100)
+        self.audio = SeqTracker()
+        self.jitter_ms = 0.0
+        self.recovered = 0 # Lost audio frames rebuilt from FEC parity (still counted in audio.lost)
+        self._last_arrival = None
+        self._last_ts = None
+
+    def add_rtt(self, rtt_ms):
+        if rtt_ms < 0 or rtt_ms > 60000:
+            return # Clock wrap or a stale echo
+        self._rtts.append(rtt_ms)
+        self.rtt_ms = rtt_ms if self.rtt_ms is None else self.rtt_ms + (rtt_ms - self.rtt_ms) / 8
+
+    def on_audio(self, seq, timestamp, arrival_ms):
+        self.audio.update(seq)
+        if self._last_ts is not None:
+            transit_delta = (arrival_ms - self._last_arrival) - ((timestamp - self._last_ts) & 0xFFFFFFFF)
+            if abs(transit_delta) < 10000: # Ignore wraps and DTX restarts
+                self.jitter_ms += (abs(transit_delta) - self.jitter_ms) / 16
+        self._last_arrival = arrival_ms
+        self._last_ts = timestamp
+
+    def snapshot(self):
+        rtts = list(self._rtts)
+        return {
+            "rtt_ms": None if self.rtt_ms is None else round(self.rtt_ms, 2),
+            "rtt_min_ms": min(rtts) if rtts else None,
+            "rtt_max_ms": max(rtts) if rtts else None,
+            "ping_loss": round(self.pings.loss_rate, 4),
+            "packets": self.audio.received,
+            "lost": self.audio.lost,
+            "late": self.audio.late,
+            "loss_rate": round(self.audio.loss_rate, 4),
+            "jitter_ms": round(self.jitter_ms, 2),
+            "recovered": self.recovered,
+        }
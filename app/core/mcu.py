@@ -0,0 +1,119 @@
+import collections
+import threading
+import zlib
+import numpy as np
+from .audio_packet import level_from_pcm
+from . import audio_codecs
+from .resample import Resampler
+
+class ServerMixer:
+    """
+    Server-side mixing (MCU mode). Incoming frames are decoded into per-sender
+    sample queues; every frame interval mix() takes `frame_size` samples per
+    active speaker (whatever packet sizes they arrived in) and builds each
+    recipient's N-minus-one mix in one vectorized pass:
+
+        total = sum(frames)                 # what a pure listener hears
+        mix_i = total - frames[i]           # what speaker i hears
+
+    Listeners all share the same encoded `total`, so the encode cost is
+    (speakers + 1) per tick no matter how many clients are connected.
+    """
+    NAME = "Mix" # Sender name the mixed stream is relayed under
+
+    def __init__(self, sample_rate=16000, frame_size=320, max_queue=5):
+        self.sample_rate = sample_rate
+        self.frame_size = frame_size
+        self.max_queue = max_queue # Ticks' worth of audio held per sender before dropping the oldest
+
+        self._queues = {} # addr: deque of int16 arrays, the first one possibly partly consumed
+        self._queued = {} # addr: samples in that deque
+        self._resamplers = {} # addr: (sender rate, Resampler), for senders not at sample_rate
+        self._frames = np.zeros((0, frame_size), dtype=np.int32)
+        self._lock = threading.Lock()
+
+    @property
+    def interval(self):
+        return self.frame_size / self.sample_rate
+
+    def push(self, addr, data, codec=audio_codecs.ZLIB, rate=None):
+        """
+        Decodes one frame from `addr`, encoded with `codec` (an audio_codecs ID) at
+        `rate` Hz, and resamples it to the mix rate if needed.
+        """
+        pcm = audio_codecs.get(codec).decode(data)
+        if rate and rate != self.sample_rate:
+            from_rate, resampler = self._resamplers.get(addr, (None, None))
+            if from_rate != rate:
+                resampler = Resampler(rate, self.sample_rate)
+                self._resamplers[addr] = (rate, resampler)
+            pcm = resampler.process(pcm).ravel()
+        with self._lock:
+            q = self._queues.get(addr)
+            if q is None:
+                q = self._queues[addr] = collections.deque()
+            q.append(pcm)
+            queued = self._queued.get(addr, 0) + len(pcm)
+            while queued > self.max_queue * self.frame_size and len(q) > 1:
+                queued -= len(q.popleft())
+            self._queued[addr] = queued
+
+    def remove(self, addr):
+        with self._lock:
+            self._queues.pop(addr, None)
+            self._queued.pop(addr, None)
+        self._resamplers.pop(addr, None)
+
+    def mix(self, recipients):
+        """
+        Returns [(encoded_frame, level, [addr, ...])] for this tick. Speakers get their
+        own N-minus-one mix, everyone else shares the full mix. Only the recipients'
+        own queues are mixed, so one mixer serves several rooms: one call per room.
+        """
+        with self._lock:
+            queues = self._queues
+            speakers = [addr for addr in recipients if queues.get(addr)]
+            if not speakers:
+                return []
+            if self._frames.shape[0] < len(speakers):
+                self._frames = np.zeros((len(speakers), self.frame_size), dtype=np.int32)
+            frames = self._frames[:len(speakers)]
+            for i, addr in enumerate(speakers):
+                self._take(addr, frames[i])
+
+        total = frames.sum(axis=0)
+        minus = total[None, :] - frames
+        np.clip(total, -32768, 32767, out=total)
+        np.clip(minus, -32768, 32767, out=minus)
+
+        out = []
+        speaker_set = set(speakers)
+        listeners = [addr for addr in recipients if addr not in speaker_set]
+        if listeners:
+            out.append((self._encode(total), level_from_pcm(total), listeners))
+        if len(speakers) > 1:
+            # A lone speaker's N-minus-one mix is silence, so it gets nothing
+            for i, addr in enumerate(speakers):
+                out.append((self._encode(minus[i]), level_from_pcm(minus[i]), [addr]))
+        return out
+
+    def _take(self, addr, row):
+        """Moves up to one tick of samples from addr's queue into `row`, zero-padding the rest."""
+        q = self._queues[addr]
+        filled = 0
+        while q and filled < len(row):
+            pcm = q[0]
+            n = min(len(pcm), len(row) - filled)
+            row[filled:filled + n] = pcm[:n]
+            filled += n
+            if n == len(pcm):
+                q.popleft()
+            else:
+                q[0] = pcm[n:] # Rest of this packet goes into the next tick
+        row[filled:] = 0
+        self._queued[addr] -= filled
+
+    @staticmethod
+    def _encode(frame):
+        # Level 1: the server compresses speakers + 1 frames per tick
+        return zlib.compress(frame.astype(np.int16).tobytes(), 1)
@@ -0,0 +1,152 @@
+"""
+Relay metrics and a Prometheus-style text endpoint.
+
+The hot path only does plain integer adds, inlined at the call sites, without
+locks: each counter is written from the receive thread (the MCU mix thread
+has its own), and a scrape reading a counter one packet stale is harmless.
+Relay time is sampled on one audio packet in TIMING_SAMPLE. Rendering,
+per-client rates and label formatting all happen at scrape time, and the
+per-client figures come from the LinkStats the server keeps anyway.
+
+    curl http://127.0.0.1:9105/metrics
+"""
+import bisect
+import http.server
+import threading
+import time
+
+# Relay processing time per packet, seconds
+LATENCY_BUCKETS = (5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 5e-3, 0.025)
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1) # Last slot is +Inf
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def render(self, name, help_text):
+        lines = [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+        cumulative = 0
+        for bound, count in zip(self.buckets + ("+Inf",), self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f"{name}_sum {self.sum:.9f}")
+        lines.append(f"{name}_count {cumulative}")
+        return lines
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _metric(lines, name, kind, help_text, samples):
+    """Appends one metric family; samples are (labels dict or None, value)."""
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} {kind}")
+    for labels, value in samples:
+        if labels:
+            inner = ",".join(f'{k}="{_label(v)}"' for k, v in labels.items())
+            lines.append(f"{name}{{{inner}}} {value}")
+        else:
+            lines.append(f"{name} {value}")
+
+class RelayMetrics:
+    """Counters kept by a server-mode NetworkEngine (see NetworkEngine.metrics)."""
+    PACKET_TYPES = {0: "command", 1: "audio", 2: "control", 3: "federation"}
+    TIMING_SAMPLE = 16 # Time one audio packet in this many (a power of two)
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.packets_in = [0] * 256 # By packet type byte
+        self.bytes_in = 0
+        self.packets_out = 0
+        self.bytes_out = 0
+        self.mix_packets_out = 0 # Written by the MCU mix thread
+        self.mix_bytes_out = 0
+        self.send_errors = 0
+        self.relay_seconds = Histogram()
+        self._last_scrape = None # (monotonic time, {addr: audio packets})
+
+    def sent(self, packets, nbytes):
+        self.packets_out += packets
+        self.bytes_out += nbytes
+
+    def render(self, clients, link_stats):
+        """
+        Prometheus text format. `clients` is the number of joined clients,
+        `link_stats` is NetworkEngine.link_stats() (one entry per client).
+        """
+        now = time.monotonic()
+        lines = []
+        _metric(lines, "speekchat_uptime_seconds", "gauge", "Seconds since the relay started.",
+                [(None, round(now - self.started, 3))])
+        _metric(lines, "speekchat_clients", "gauge", "Joined clients.", [(None, clients)])
+        by_type = [({"type": name}, self.packets_in[i]) for i, name in self.PACKET_TYPES.items()]
+        by_type.append(({"type": "unknown"}, sum(self.packets_in) - sum(n for _, n in by_type)))
+        _metric(lines, "speekchat_packets_received_total", "counter", "Datagrams received, by packet type.", by_type)
+        _metric(lines, "speekchat_bytes_received_total", "counter", "Bytes received.", [(None, self.bytes_in)])
+        _metric(lines, "speekchat_packets_sent_total", "counter", "Datagrams sent, by path.",
+                [({"path": "relay"}, self.packets_out), ({"path": "mix"}, self.mix_packets_out)])
+        _metric(lines, "speekchat_bytes_sent_total", "counter", "Bytes sent, by path.",
+                [({"path": "relay"}, self.bytes_out), ({"path": "mix"}, self.mix_bytes_out)])
+        _metric(lines, "speekchat_send_errors_total", "counter", "Failed sends to clients.", [(None, self.send_errors)])
+        lines += self.relay_seconds.render("speekchat_relay_seconds",
+                                           f"Time to handle one audio datagram (1 in {self.TIMING_SAMPLE} sampled).")
+
+        # Per client: audio totals, rates since the previous scrape, link quality
+        previous_time, previous = self._last_scrape or (self.started, {})
+        elapsed = max(now - previous_time, 1e-9)
+        totals, rates, rtt, loss, jitter = [], [], [], [], []
+        for addr, stats in link_stats.items():
+            labels = {"client": f"{addr[0]}:{addr[1]}", "username": stats["username"], "room": stats.get("room", "")}
+            totals.append((labels, stats["packets"]))
+            rates.append((labels, round((stats["packets"] - previous.get(addr, 0)) / elapsed, 2)))
+            if stats["rtt_ms"] is not None:
+                rtt.append((labels, stats["rtt_ms"]))
+            loss.append((labels, stats["loss_rate"]))
+            jitter.append((labels, stats["jitter_ms"]))
+        self._last_scrape = (now, {addr: stats["packets"] for addr, stats in link_stats.items()})
+        _metric(lines, "speekchat_client_audio_packets_total", "counter", "Audio datagrams received per client.", totals)
+        _metric(lines, "speekchat_client_audio_packets_per_second", "gauge",
+                "Per-client audio rate since the previous scrape.", rates)
+        _metric(lines, "speekchat_client_rtt_ms", "gauge", "Smoothed heartbeat round-trip time.", rtt)
+        _metric(lines, "speekchat_client_audio_loss_ratio", "gauge", "Recent audio loss from this client.", loss)
+        _metric(lines, "speekchat_client_jitter_ms", "gauge", "Audio inter-arrival jitter from this client.", jitter)
+        return "\n".join(lines) + "\n"
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        try:
+            body = self.server.render().encode()
+        except Exception as e:
+            self.send_error(500, str(e))
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass # Scrapes every few seconds would flood the console
+
+class MetricsServer:
+    """Serves render() (a callable returning the text) on http://host:port/metrics from a daemon thread."""
+    def __init__(self, render, port=9105, host="127.0.0.1"):
+        self.httpd = http.server.ThreadingHTTPServer((host, port), _Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.render = render
+        self.port = self.httpd.server_address[1]
+
+    def start(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        print(f"[Server] Metrics on http://{self.httpd.server_address[0]}:{self.port}/metrics")
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,102 @@
+import numpy as np
+
+_curves = {} # (knee, range): limiter lookup table, shared by all mixers
+
+def _limiter_curve(knee, limit):
+    """
+    int16 output for every int32 sum in [-limit, limit], laid out so a negative sum
+    wraps around to the end: |y| = min(|x|, k) + (1 - k) * tanh(max(|x| - k, 0) / (1 - k)),
+    with x and k as fractions of full scale.
+    """
+    curve = _curves.get((knee, limit))
+    if curve is None:
+        x = np.abs(np.arange(limit + 1) / 32767)
+        y = np.minimum(x, knee) + (1 - knee) * np.tanh(np.maximum(x - knee, 0) / (1 - knee))
+        y = np.round(y * 32767).astype(np.int16)
+        curve = _curves[(knee, limit)] = np.concatenate((y, -y[:0:-1]))
+    return curve
+
+class Mixer:
+    """
+    Playback mixer for the audio callbacks, built once and reused every block.
+
+    Ready streams are summed in place into a preallocated int32 accumulator
+    (short frames only cover their own samples, long ones are trimmed), and
+    mix_into() writes the result straight into the device buffer. Nothing is
+    halved up front: a lone speaker plays at full level, and only peaks above
+    `knee` (fraction of full scale) go through a tanh soft limiter, which
+    bends them smoothly towards full scale instead of wrapping or clipping.
+    """
+    RANGE = 4 * 32767 # Sums beyond 4x full scale are limited like 4x full scale
+
+    def __init__(self, block_size, channels=1, knee=0.5):
+        self.channels = channels
+        self.knee = knee
+        self._curve = _limiter_curve(knee, self.RANGE)
+        self._alloc(block_size)
+        self._frames = block_size
+        self._count = 0
+
+    def _alloc(self, block_size):
+        # Only happens when the device hands us a bigger block than we've seen
+        self._acc = np.zeros((block_size, self.channels), dtype=np.int32)
+        self._tmp = np.zeros((block_size, self.channels), dtype=np.int32)
+        self._abs = np.zeros((block_size, self.channels), dtype=np.int32)
+        self._idx = np.zeros((block_size, self.channels), dtype=np.intp) # Limiter table indices
+
+    def clear(self, frames):
+        """Starts a new block of `frames` samples."""
+        if frames > self._acc.shape[0]:
+            self._alloc(frames)
+        self._frames = frames
+        self._count = 0
+
+    def add(self, pcm, shift=0):
+        """Adds an int16 (n, channels) frame, attenuated by 6 dB per `shift`."""
+        n = min(len(pcm), self._frames)
+        # Widen first: int16 + int32 ufuncs would go through a temporary cast buffer
+        tmp = self._tmp[:n]
+        np.copyto(tmp, pcm[:n])
+        if shift:
+            np.right_shift(tmp, shift, out=tmp)
+        self._accumulate(tmp, n)
+
+    def add_scaled(self, samples, gain):
+        """Adds float samples ((n,) or (n, channels)) multiplied by `gain`."""
+        n = min(len(samples), self._frames)
+        if samples.ndim == 1:
+            samples = samples[:, None]
+        tmp = self._tmp[:n]
+        np.multiply(samples[:n], gain, out=tmp, casting='unsafe')
+        self._accumulate(tmp, n)
+
+    def _accumulate(self, frame, n):
+        acc = self._acc
+        if self._count == 0:
+            acc[:n] = frame
+            acc[n:self._frames] = 0
+        else:
+            np.add(acc[:n], frame, out=acc[:n])
+        self._count += 1
+
+    def mix_into(self, out):
+        """Writes the mix of everything added since clear() into the int16 array `out`."""
+        frames = self._frames
+        if self._count == 0:
+            out[:] = 0
+            return out
+        acc = self._acc[:frames]
+
+        peak = np.abs(acc, out=self._abs[:frames]).max()
+        if peak <= self.knee * 32767:
+            out[:] = acc
+            return out
+
+        # Soft limiter, through the precomputed curve: clamp to the table's range and look
+        # every sample up (negative sums wrap around to the end of the table)
+        idx = self._idx[:frames]
+        np.copyto(idx, acc)
+        np.minimum(idx, self.RANGE, out=idx)
+        np.maximum(idx, -self.RANGE, out=idx)
+        np.take(self._curve, idx, out=out, mode='wrap')
+        return out
@@ -3,30 +3,143 @@ import threading
 import time
 import uuid
 import json
+from collections import namedtuple
+from types import MappingProxyType
 from zeroconf import ServiceInfo, Zeroconf, ServiceBrowser
 
+PROTOCOL = 2 # P2P audio format we speak, advertised at registration (peers without it use the legacy one)
+
+def peer_index(peer_id):
+    """Compact numeric id of a peer for packet headers: the top 32 bits of its UUID."""
+    return int(peer_id.replace('-', '')[:8], 16)
+
+# One published state of the registry. Never mutated: a change builds a new one.
+PeerSnapshot = namedtuple("PeerSnapshot", "version peers host_id by_index")
+
+class PeerRegistry:
+    """
+    The peers a node knows about, published as immutable snapshots: writers
+    (zeroconf callbacks, the expiry loop) serialize on a lock, build a new
+    PeerSnapshot and swap the reference; readers on the audio path just take
+    `registry.snapshot` once and use it, without locking and without the
+    dict changing under them.
+
+    The host is the smallest ID, ourselves included. A join only compares the
+    newcomer with the current host; the remaining IDs are only scanned when
+    the host itself leaves.
+
+    Liveness is separate from membership: touch() is a plain dict store from
+    the receive path, and expire() drops peers not heard from in time (only
+    those that speak PROTOCOL and so heartbeat; legacy ones wait for zeroconf
+    to remove them). Expired peers are remembered so a heartbeat can revive
+    them without waiting for discovery.
+    """
+    def __init__(self, self_id):
+        self.self_id = self_id
+        self.snapshot = PeerSnapshot(0, MappingProxyType({}), self_id, MappingProxyType({}))
+        self._lock = threading.Lock()
+        self._last_seen = {} # peer id: monotonic time we last heard from it
+        self._expired = {} # peer index: (peer id, info), peers that went quiet
+
+    def _publish(self, peers, host_id):
+        # Caller holds the lock
+        old = self.snapshot
+        by_index = {info['index']: peer_id for peer_id, info in peers.items()}
+        self.snapshot = PeerSnapshot(old.version + 1, MappingProxyType(peers), host_id, MappingProxyType(by_index))
+        return old.host_id != host_id
+
+    def add(self, peer_id, info):
+        """Adds or updates a peer (info: dict with username, address, port, index, proto). Returns True if the host changed."""
+        self.touch(peer_id)
+        with self._lock:
+            snap = self.snapshot
+            if snap.peers.get(peer_id) == info:
+                return False
+            self._expired.pop(info['index'], None)
+            peers = dict(snap.peers)
+            peers[peer_id] = MappingProxyType(dict(info))
+            return self._publish(peers, min(snap.host_id, peer_id))
+
+    def remove(self, peer_ids, expired=False):
+        """Removes peers; returns True if the host changed."""
+        with self._lock:
+            snap = self.snapshot
+            if not expired:
+                for peer_id in peer_ids:
+                    self._expired.pop(peer_index(peer_id), None) # Gone for good, don't revive it
+            gone = [peer_id for peer_id in peer_ids if peer_id in snap.peers]
+            if not gone:
+                return False
+            peers = dict(snap.peers)
+            for peer_id in gone:
+                info = peers.pop(peer_id)
+                self._last_seen.pop(peer_id, None)
+                if expired:
+                    self._expired[info['index']] = (peer_id, info)
+            host_id = snap.host_id
+            if host_id in gone:
+                host_id = min(list(peers) + [self.self_id])
+            return self._publish(peers, host_id)
+
+    def touch(self, peer_id, now=None):
+        self._last_seen[peer_id] = time.monotonic() if now is None else now
+
+    def revive(self, index):
+        """A heartbeat from a peer index we don't know: re-adds it if it had only expired. Returns its ID or None."""
+        entry = self._expired.get(index)
+        if entry is None:
+            return None
+        peer_id, info = entry
+        self.add(peer_id, info)
+        return peer_id
+
+    def expire(self, timeout, now=None):
+        """Drops heartbeating peers silent for `timeout` seconds; returns (their IDs, whether the host changed)."""
+        now = time.monotonic() if now is None else now
+        snap = self.snapshot
+        stale = [peer_id for peer_id, info in snap.peers.items()
+                 if info.get('proto', 1) >= PROTOCOL and now - self._last_seen.get(peer_id, now) > timeout]
+        if not stale:
+            return [], False
+        return stale, self.remove(stale, expired=True)
+
 class NetworkManager:
     """
     Handles peer discovery, host election, and heartbeat.
     """
     SERVICE_TYPE = "_speekchat._udp.local."
-    
+    HEARTBEAT_INTERVAL = 2 # Seconds between heartbeats (sent by CommunicationBridge) and expiry checks
+    PEER_TIMEOUT = 10 # Seconds without hearing from a peer before it is dropped
+
     def __init__(self, username, port=50005):
         self.id = str(uuid.uuid4())
+        self.index = peer_index(self.id)
         self.username = username
         self.port = port
-        self.peers = {} # id: {username, address, last_seen}
-        self.host_id = None
+        self.registry = PeerRegistry(self.id)
         self.is_running = False
-        
+
         self.zeroconf = Zeroconf()
         self.browser = None
-        
+
+    @property
+    def peers(self):
+        """Read-only {id: {username, address, port, index, proto}} of the current snapshot."""
+        return self.registry.snapshot.peers
+
+    @property
+    def host_id(self):
+        return self.registry.snapshot.host_id
+
+    @property
+    def version(self):
+        return self.registry.snapshot.version
+
     def start(self):
         self.is_running = True
-        
+
         # Register self
-        desc = {'id': self.id, 'username': self.username}
+        desc = {'id': self.id, 'username': self.username, 'proto': str(PROTOCOL)}
         info = ServiceInfo(
             self.SERVICE_TYPE,
             f"{self.id}.{self.SERVICE_TYPE}",
@@ -35,47 +148,59 @@ class NetworkManager:
             properties=desc,
         )
         self.zeroconf.register_service(info)
-        
+
         # Browse for others
         self.browser = ServiceBrowser(self.zeroconf, self.SERVICE_TYPE, self)
-        
-        # Election thread
-        threading.Thread(target=self._election_loop, daemon=True).start()
+
+        # Expiry thread
+        threading.Thread(target=self._expiry_loop, daemon=True).start()
 
     def remove_service(self, zc, type_, name):
         peer_id = name.split('.')[0]
-        if peer_id in self.peers:
-            del self.peers[peer_id]
-            self._elect_host()
+        if self.registry.remove([peer_id]):
+            self._host_changed()
 
     def add_service(self, zc, type_, name):
         info = zc.get_service_info(type_, name)
         if info:
             peer_id = info.properties.get(b'id', b'').decode()
             username = info.properties.get(b'username', b'').decode()
-            if peer_id and peer_id != self.id:
-                self.peers[peer_id] = {
-                    'username': username,
-                    'address': socket.inet_ntoa(info.addresses[0]),
-                    'port': info.port,
-                    'last_seen': time.time()
-                }
-                self._elect_host()
+            proto = int(info.properties.get(b'proto') or 1)
+            self._add_peer(peer_id, username, socket.inet_ntoa(info.addresses[0]), info.port, proto)
+
+    def _add_peer(self, peer_id, username, address, port, proto=PROTOCOL):
+        if peer_id and peer_id != self.id:
+            info = {'username': username, 'address': address, 'port': port, 'index': peer_index(peer_id),
+                    'proto': proto}
+            if self.registry.add(peer_id, info):
+                self._host_changed()
 
     def update_service(self, zc, type_, name):
-        pass
+        self.add_service(zc, type_, name) # Address or name may have changed; counts as a sign of life too
+
+    def heard_from(self, peer_id):
+        """Called by the transport for every packet from a known peer."""
+        self.registry.touch(peer_id)
+
+    def revive(self, index):
+        """A heartbeat from an unknown peer index: brings it back if it had only timed out."""
+        host_id = self.host_id
+        peer_id = self.registry.revive(index)
+        if peer_id and self.host_id != host_id:
+            self._host_changed()
+        return peer_id
 
-    def _elect_host(self):
-        # The host is the one with the lexicographically smallest ID
-        all_ids = list(self.peers.keys()) + [self.id]
-        all_ids.sort()
-        self.host_id = all_ids[0]
-        print(f"[Network] Elected host: {self.host_id} (Me: {self.id == self.host_id})")
+    def _host_changed(self):
+        print(f"[Network] Elected host: {self.host_id} (Me: {self.is_host})")
 
-    def _election_loop(self):
+    def _expiry_loop(self):
         while self.is_running:
-            # Periodically re-verify peers if needed (Zeroconf usually handles this via remove_service)
-            time.sleep(5)
+            time.sleep(self.HEARTBEAT_INTERVAL)
+            expired, host_changed = self.registry.expire(self.PEER_TIMEOUT)
+            for peer_id in expired:
+                print(f"[Network] Peer {peer_id} timed out")
+            if host_changed:
+                self._host_changed()
 
     def stop(self):
         self.is_running = False
@@ -2,23 +2,90 @@ import socket
 import threading
 import time
 import json
+import heapq
 import requests
+from .fanout import FanOut
+from . import control
+from .mcu import ServerMixer
+from .speakers import SpeakerSelector
+from . import audio_packet
+from . import audio_codecs
+from .resample import Resampler
+from .linkstats import LinkStats
+from .metrics import RelayMetrics
+from . import federation
+from .fec import FecEncoder, FecDecoder
 
 class NetworkEngine:
     PORT = 50005
     BUFFER_SIZE = 8192
+    PING_INTERVAL = 5 # Seconds between client heartbeats
+    ROOM_MAX = 32 # Characters of a room name; longer names are cut
 
-    def __init__(self, is_server=False, username="Unknown"):
+    def __init__(self, is_server=False, username="Unknown", reuse_port=False, mix=False, last_n=None, codec="zlib",
+                 sample_rate=audio_packet.LEGACY_RATE, metrics=True, client_timeout=15.0, sweep_interval=1.0,
+                 sweep_limit=None, room="", port=None, peers=None, fec=0):
         self.is_server = is_server
         self.username = username
         self.is_running = False
+        self.port = port or self.PORT # Server: where to listen. Client: where the server listens
         
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if reuse_port:
+            # Lets several worker processes share the server port (Linux/BSD only)
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
         
         if self.is_server:
-            self.sock.bind(('', self.PORT))
+            self.sock.bind(('', self.port))
             self.clients = {} # (addr, port): username
+            self.client_ctl = {} # (addr, port): negotiated control version (0 = JSON)
+            # Rooms: every client is in exactly one, picked at JOIN ("" for clients that don't pick).
+            # Relay, roster and mix only ever look at the sender's room, through these indexes,
+            # which are rebuilt per room on join/leave (and replaced, never mutated, so the mix
+            # thread can read them)
+            self.client_rooms = {} # (addr, port): room name
+            self._room_members = {} # room: frozenset of its (addr, port)
+            self._room_fanouts = {} # room: {control version: FanOut of the members speaking it}
+            self._room_seq = {} # room: roster sequence, bumped on every join/leave in that room
+            self.client_ids = {} # (addr, port): roster id (unique across rooms)
+            self.roster_seq = 0 # Bumped on every join/leave, in any room
+            self._next_client_id = 1
+            self._ids_wrapped = False # Once ids wrap, new ones have to skip those still in use
+            self.send_failures = {} # (addr, port): failed relay sends
+            self.on_relay_error = None # Callback(addr, exc)
+            # MCU mode: mix on the server and send each client a single stream
+            self.mixer = ServerMixer() if mix else None
+            # Last-N: only relay the N loudest speakers of each room (None relays everyone)
+            self.last_n = last_n
+            self.selectors = {} # room: SpeakerSelector, created on its first audio
+            self._legacy_seq = {} # (addr, port): next seq for a legacy (v1) sender's frames
+            self._mix_seq = {} # (addr, port): next seq of that client's MCU stream
+            self._legacy_resamplers = {} # (addr, port): (sender rate, Resampler to LEGACY_RATE for v1/v2 receivers)
+            self._link_stats = {} # (addr, port): LinkStats of that client's heartbeat and audio
+            self.metrics = RelayMetrics() if metrics else None # Served by metrics.MetricsServer
+            # Liveness: any packet refreshes a client's last-seen time; each client has one
+            # entry in a heap of deadlines, checked lazily, so a packet costs a dict store
+            # and a sweep only looks at clients that may have expired
+            self.client_timeout = client_timeout # Seconds of silence before a client is dropped
+            self.sweep_interval = sweep_interval # Seconds between expiry sweeps
+            self.sweep_limit = sweep_limit # Max heap entries examined per sweep (None = all due)
+            self._last_seen = {} # (addr, port): monotonic time of its last packet
+            self._expiry = [] # heap of (deadline, addr)
+            self._queued = set() # addrs with an entry in _expiry: one each, however often they rejoin
+            self._rejoin_asked = set() # Strangers sent REJOIN since the last sweep (one each per sweep)
+            self._next_sweep = 0
+            # Federation (see federation.py): other relays sharing our rooms, and their
+            # clients, who get roster ids here but live in no local index but the roster
+            self.peer_links = {} # (ip, port): PeerLink
+            if peers and mix:
+                raise ValueError("MCU mixing only mixes local clients, it can't be combined with peers")
+            for peer in peers or ():
+                addr = federation.parse_peer(peer, self.PORT)
+                self.peer_links[addr] = federation.PeerLink(addr)
+            self._remote_by_room = {} # room: {roster id: username} of peers' clients
+            self._members_version = 0 # Of our own member list, bumped on join/leave
+            self._next_announce = 0
         else:
             # On Windows, we often need to bind even if we don't care about the port
             # to avoid errors when starting to receive before sending anything.
@@ -28,9 +95,32 @@ class NetworkEngine:
                 pass
             self.server_addr = None
             self.participants = []
+            self.ctl_version = 0 # Switches to binary control once the server acks it
+            self._audio_seq = 0
+            self.requested_codec = codec # Announced at JOIN
+            self.room = str(room)[:self.ROOM_MAX] # Announced at JOIN, the server only relays within it
+            self.codec = audio_codecs.ZLIB # What the server agreed to; zlib until it acks
+            self.sample_rate = sample_rate # Of the audio we send, announced in every v3 header
+            # FEC (see fec.py): one parity packet after every `fec` of ours (0 = off), sent once
+            # the server speaks FEC_CTL; decoders start on a sender's first parity packet
+            self._fec_encoder = FecEncoder(fec) if fec else None
+            self._fec_decoders = {} # username: FecDecoder
+            self.roster = {} # roster id: username (control v2+)
+            self.roster_seq = None
+            self._snapshot_parts = {} # part index: members, while a snapshot is arriving
+            self._last_roster_request = 0
+            self.server_stats = LinkStats() # RTT and heartbeat loss to the server
+            self._sender_stats = {} # username: LinkStats of the audio we get from them
+            self._ping_seq = 0
+            self._last_pong = None # (server ms, our ms when it arrived), echoed in the next PING
+            self._joining = False # A _join_loop is running (REJOINs meanwhile are expected, not news)
+            self.metrics = None
 
-        self.on_audio_received = None # Callback(username, data)
+        self.on_audio_received = None # Callback(username, data, seq, timestamp, codec, rate); seq/timestamp None from legacy servers
+        self.on_comfort_noise = None # Callback(username, level), sender is silent (DTX)
+        self.on_fec_stream = None # Callback(username, group), sender protects groups of up to `group` frames
         self.on_participants_updated = None # Callback(list)
+        self.on_participants_delta = None # Callback(op, username), op is "JOINED" or "LEFT"
         self.on_connected = None # Callback()
         self.on_error = None # Callback(msg)
         self._stop_lock = threading.Lock()
@@ -41,17 +131,25 @@ class NetworkEngine:
         
         # Start receiving BEFORE sending join request
         threading.Thread(target=self._receive_loop, daemon=True).start()
+        self._start_mixer()
 
-        if not self.is_server:
+        if self.is_server:
+            threading.Thread(target=self._sweep_timer, daemon=True).start()
+        else:
             if not server_ip:
                 raise ValueError("Server IP required for client mode")
-            self.server_addr = (server_ip, self.PORT)
+            self.server_addr = (server_ip, self.port)
             # Send join request in a loop until ACK or timeout
+            self._joining = True
             threading.Thread(target=self._join_loop, daemon=True).start()
             threading.Thread(target=self._heartbeat_loop, daemon=True).start()
 
-    def _join_loop(self):
-        """Client-side loop to reliably join the server."""
+    def _start_mixer(self):
+        if self.is_server and self.mixer:
+            threading.Thread(target=self._mix_loop, daemon=True).start()
+
+    def _join_loop(self, rejoin=False):
+        """Client-side loop to reliably join the server (again, after a REJOIN, without re-firing on_connected)."""
         attempts = 0
         max_attempts = 15
         while self.is_running and attempts < max_attempts:
@@ -61,7 +159,8 @@ class NetworkEngine:
             # Wait for either PARTICIPANTS or JOIN_ACK via the event
             if self._connected_event.wait(timeout=2.0):
                 print("[Network] Connection confirmed.")
-                if self.on_connected: self.on_connected()
+                self._joining = False
+                if self.on_connected and not rejoin: self.on_connected()
                 return
                 
             attempts += 1
@@ -72,23 +171,24 @@ class NetworkEngine:
             if self.on_error: self.on_error(err)
             self.stop()
 
+    def _rejoin(self):
+        """The server answered with REJOIN: it doesn't know us any more (we went quiet past its timeout, or it restarted)."""
+        if self._joining or not self.is_running:
+            return # Already on it
+        self._joining = True
+        print("[Network] Server dropped us, rejoining...")
+        self._connected_event.clear()
+        threading.Thread(target=self._join_loop, args=(True,), daemon=True).start()
+
     def _receive_loop(self):
         while self.is_running:
             try:
                 data, addr = self.sock.recvfrom(self.BUFFER_SIZE)
-                if not data: continue
-
-                # Packet format: [TYPE (1 byte)] [DATA...]
-                # TYPE 0: Command (JSON)
-                # TYPE 1: Audio
-                
-                msg_type = data[0]
-                payload = data[1:]
-
-                if msg_type == 0: # Command
-                    self._handle_command(payload, addr)
-                elif msg_type == 1: # Audio
-                    self._handle_audio(payload, addr)
+                if not data:
+                    if self.is_server:
+                        self._maybe_sweep() # Wake-up from _sweep_timer
+                    continue
+                self._dispatch(data, addr)
 
             except OSError as e:
                 if self.is_running:
@@ -102,112 +202,823 @@ class NetworkEngine:
                     print(f"[Network] Unexpected error: {e}")
                     break
 
+    def _dispatch(self, data, addr):
+        """Routes one datagram to the command or audio handler."""
+        # Packet format: [TYPE (1 byte)] [DATA...]
+        # TYPE 0: Command (JSON)
+        # TYPE 1: Audio
+        # TYPE 2: Command (binary, see control.py)
+        msg_type = data[0]
+        payload = data[1:]
+        metrics = self.metrics
+        if metrics:
+            metrics.packets_in[msg_type] += 1
+            metrics.bytes_in += len(data)
+        if self.is_server and addr in self._last_seen:
+            self._last_seen[addr] = time.monotonic()
+
+        if msg_type == 1: # Audio
+            if metrics and not metrics.packets_in[1] & (metrics.TIMING_SAMPLE - 1):
+                start = time.perf_counter()
+                self._handle_audio(payload, addr)
+                metrics.relay_seconds.observe(time.perf_counter() - start)
+            else:
+                self._handle_audio(payload, addr)
+        elif msg_type == 0: # Command
+            self._handle_command(payload, addr)
+        elif msg_type == control.PACKET_TYPE:
+            self._handle_binary_command(payload, addr)
+        elif msg_type == federation.PACKET_TYPE and self.is_server:
+            self._handle_peer(payload, addr)
+
+    def _sendto(self, payload, addr):
+        """Single place every outgoing datagram goes through."""
+        self.sock.sendto(payload, addr)
+
     def _handle_command(self, payload, addr):
         try:
             cmd_data = json.loads(payload.decode())
-            cmd = cmd_data.get("cmd")
-            args = cmd_data.get("args")
+            caps = cmd_data.get("caps") or {}
+            self._on_command(cmd_data.get("cmd"), cmd_data.get("args"), addr, caps)
+        except Exception as e:
+            print(f"Command error: {e}")
 
-            if self.is_server:
-                if cmd == "JOIN":
-                    username = args
-                    self.clients[addr] = username
-                    print(f"[Server] {username} joined from {addr}")
-                    # Send ACK immediately
-                    self._send_command_to("JOIN_ACK", None, addr)
-                    self._broadcast_participants()
-                elif cmd == "LEAVE":
-                    if addr in self.clients:
-                        del self.clients[addr]
-                        self._broadcast_participants()
-                elif cmd == "PING":
-                    # Just an alive Signal
-                    pass
-            else:
-                if cmd == "PARTICIPANTS":
-                    self.participants = args
-                    if hasattr(self, '_connected_event'):
-                        self._connected_event.set()
-                    if self.on_participants_updated:
-                        self.on_participants_updated(self.participants)
-                elif cmd == "JOIN_ACK":
-                    print("[Network] Received JOIN_ACK from server.")
-                    if hasattr(self, '_connected_event'):
-                        self._connected_event.set()
+    def _handle_binary_command(self, payload, addr):
+        try:
+            cmd, args = control.decode(payload)
+            self._on_command(cmd, args, addr, {})
         except Exception as e:
             print(f"Command error: {e}")
 
+    def _on_command(self, cmd, args, addr, caps):
+        if self.is_server:
+            if cmd == "JOIN":
+                username = args
+                ctl = min(int(caps.get("ctl", 0)), control.VERSION)
+                room = str(caps.get("room") or "")[:self.ROOM_MAX]
+                if addr in self.clients and self.client_rooms.get(addr, "") != room:
+                    self._drop_client(addr) # Switching rooms: leave the old one first
+                is_new = self._add_client(addr, username, ctl, room)
+                if is_new is None:
+                    # No ACK: the client gives up with our reason instead of timing out
+                    self._send_command_to("JOIN_REJECT", "Server full", addr)
+                    return
+                print(f"[Server] {username} joined {self._room_label(room)} from {addr}")
+                # Send ACK immediately, in the encoding the client just negotiated
+                ack = {"ctl": ctl} if ctl else None
+                if ctl >= control.CODEC_VERSION:
+                    ack["codec"] = audio_codecs.BY_NAME.get(caps.get("codec"), audio_codecs.ZLIB)
+                self._send_command_to("JOIN_ACK", ack, addr)
+                if is_new:
+                    self._broadcast_participants(("JOINED", addr, username), room)
+                else:
+                    # Join retry from a known client: only it needs the roster again
+                    self._send_roster_to(addr)
+            elif cmd == "LEAVE":
+                self._drop_client(addr)
+            elif cmd == "ROSTER_REQUEST":
+                if addr in self.clients:
+                    self._send_roster_to(addr)
+            elif cmd == "PING":
+                if addr not in self.clients:
+                    self._ask_to_rejoin(addr) # Expired while it was away, it still thinks it's in
+                    return
+                # Alive signal; control v4 clients stamp it so both ends can measure the link
+                stats = self._link(addr)
+                if args and stats:
+                    now = self._now_ms()
+                    stats.pings.update(args["seq"])
+                    if args["echo"]:
+                        stats.add_rtt((now - args["echo"] - args["held"]) & 0xFFFFFFFF)
+                    self._send_command_to("PONG", {"seq": args["seq"], "ts": args["ts"], "server_ts": now}, addr)
+        else:
+            if cmd == "PARTICIPANTS":
+                self.participants = args
+                if hasattr(self, '_connected_event'):
+                    self._connected_event.set()
+                if self.on_participants_updated:
+                    self.on_participants_updated(self.participants)
+            elif cmd == "ROSTER_SNAPSHOT":
+                self._on_roster_snapshot(args)
+            elif cmd == "ROSTER_DELTA":
+                self._on_roster_delta(args)
+            elif cmd == "PONG":
+                now = self._now_ms()
+                self.server_stats.pings.update(args["seq"])
+                self.server_stats.add_rtt((now - args["ts"]) & 0xFFFFFFFF)
+                self._last_pong = (args["server_ts"], now)
+            elif cmd == "REJOIN":
+                self._rejoin()
+            elif cmd == "JOIN_REJECT":
+                if self._joining and self.is_running:
+                    err = f"Server refused to let us join: {args}"
+                    print(f"[Network] {err}")
+                    if self.on_error: self.on_error(err)
+                    self.stop()
+            elif cmd == "JOIN_ACK":
+                print("[Network] Received JOIN_ACK from server.")
+                # Legacy servers ack in JSON without args: stay on JSON then
+                if isinstance(args, dict):
+                    self.ctl_version = min(int(args.get("ctl", 0)), control.VERSION)
+                    if args.get("codec") in audio_codecs.CODECS:
+                        self.codec = args["codec"]
+                if hasattr(self, '_connected_event'):
+                    self._connected_event.set()
+
+    def _on_roster_snapshot(self, args):
+        if args["part"] == 0:
+            self._snapshot_parts = {}
+        self._snapshot_parts[args["part"]] = (args["seq"], args["members"])
+        if len(self._snapshot_parts) < args["parts"]:
+            return
+        parts = [self._snapshot_parts.get(i) for i in range(args["parts"])]
+        self._snapshot_parts = {}
+        if None in parts or any(seq != args["seq"] for seq, _ in parts):
+            self._request_roster() # Parts from different snapshots got mixed up
+            return
+
+        self.roster = {client_id: name for _, members in parts for client_id, name in members}
+        self.roster_seq = args["seq"]
+        self.participants = list(self.roster.values())
+        if hasattr(self, '_connected_event'):
+            self._connected_event.set()
+        if self.on_participants_updated:
+            self.on_participants_updated(self.participants)
+
+    def _on_roster_delta(self, args):
+        if self.roster_seq is None or args["seq"] <= self.roster_seq:
+            return # No snapshot yet, or a duplicate
+        if args["seq"] != self.roster_seq + 1:
+            print(f"[Network] Roster gap ({self.roster_seq} -> {args['seq']}), requesting snapshot")
+            self._request_roster()
+            return
+
+        self.roster_seq = args["seq"]
+        if args["op"] == "JOINED":
+            self.roster[args["id"]] = args["name"]
+            name = args["name"]
+        else:
+            name = self.roster.pop(args["id"], args["name"])
+            self._sender_stats.pop(name, None)
+            self._fec_decoders.pop(name, None)
+        self.participants = list(self.roster.values())
+        if self.on_participants_delta:
+            self.on_participants_delta(args["op"], name)
+        elif self.on_participants_updated:
+            self.on_participants_updated(self.participants)
+
+    def _request_roster(self):
+        # Several deltas can arrive after one gap; one request per second is enough
+        now = time.monotonic()
+        if now - self._last_roster_request < 1.0:
+            return
+        self._last_roster_request = now
+        self._send_command("ROSTER_REQUEST", None)
+
+    def _add_client(self, addr, username, ctl=0, room=""):
+        """Registers a client in `room`; returns True if it was not a member yet, None if there is no room for it."""
+        self._track(addr)
+        is_new = addr not in self.clients
+        changed = is_new or self.client_ctl.get(addr) != ctl
+        self.clients[addr] = username
+        self.client_ctl[addr] = ctl
+        if is_new:
+            self.client_ids[addr] = self._new_client_id()
+            self.roster_seq += 1
+            self.client_rooms[addr] = room
+            self._room_members[room] = self._room_members.get(room, frozenset()) | {addr}
+            self._room_seq[room] = self._room_seq.get(room, 0) + 1
+        if changed:
+            self._clients_changed(room)
+        return is_new
+
+    def _new_client_id(self):
+        """Next roster id (1..0xFFFF), local or a peer's client; after a wrap, skips ids still held."""
+        used = ()
+        if self._ids_wrapped:
+            used = set(self.client_ids.values())
+            for link in self.peer_links.values():
+                used.update(local_id for local_id, _, _ in link.members.values())
+            if len(used) >= 0xFFFF:
+                raise RuntimeError("All roster ids are in use")
+        while True:
+            client_id = self._next_client_id
+            if client_id == 0xFFFF:
+                self._ids_wrapped = True
+            self._next_client_id = client_id % 0xFFFF + 1
+            if client_id not in used:
+                return client_id
+
+    def _drop_client(self, addr):
+        """Removes a client and tells the rest of its room it left."""
+        if addr in self.clients:
+            username = self.clients[addr]
+            client_id = self.client_ids.get(addr, 0)
+            room = self.client_rooms.get(addr, "")
+            self._remove_client(addr)
+            self._broadcast_participants(("LEFT", client_id, username), room)
+
+    def _track(self, addr):
+        """
+        Starts liveness tracking for a client. Its heap entry lives until a sweep finds
+        it gone; a rejoin before then reuses that entry rather than pushing another.
+        """
+        now = time.monotonic()
+        if addr not in self._queued:
+            heapq.heappush(self._expiry, (now + self.client_timeout, addr))
+            self._queued.add(addr)
+        self._last_seen[addr] = now
+
+    def _sweep_timer(self):
+        """
+        Threaded server: pokes the receive loop with an empty datagram once per
+        sweep interval, so expiry runs on the receive thread like everything
+        else that touches the client table, and the socket can stay blocking.
+        """
+        wake = ("127.0.0.1", self.sock.getsockname()[1])
+        while self.is_running:
+            time.sleep(self.sweep_interval)
+            try:
+                self.sock.sendto(b'', wake)
+            except OSError:
+                pass # Closed during shutdown
+
+    def _maybe_sweep(self):
+        now = time.monotonic()
+        if now >= self._next_sweep:
+            self._next_sweep = now + self.sweep_interval
+            self._rejoin_asked.clear()
+            self._expire_clients(now)
+            if self.peer_links:
+                self._peer_tick(now)
+
+    def _expire_clients(self, now):
+        """
+        Drops clients silent for client_timeout. Entries whose client was heard
+        from since they were pushed are re-queued at the new deadline instead.
+        """
+        heap = self._expiry
+        examined = 0
+        while heap and heap[0][0] <= now and (self.sweep_limit is None or examined < self.sweep_limit):
+            examined += 1
+            _, addr = heapq.heappop(heap)
+            seen = self._last_seen.get(addr)
+            if seen is None or addr not in self.clients:
+                self._queued.discard(addr) # Left already
+                self._last_seen.pop(addr, None)
+                continue
+            if now - seen < self.client_timeout:
+                heapq.heappush(heap, (seen + self.client_timeout, addr))
+                continue
+            print(f"[Server] {self.clients[addr]} at {addr} timed out")
+            self._queued.discard(addr)
+            self._drop_client(addr)
+
+    def _remove_client(self, addr):
+        del self.clients[addr]
+        self.client_ctl.pop(addr, None)
+        self.client_ids.pop(addr, None)
+        self.roster_seq += 1
+        room = self.client_rooms.pop(addr, "")
+        self._room_members[room] = self._room_members.get(room, frozenset()) - {addr}
+        self._room_seq[room] = self._room_seq.get(room, 0) + 1
+        self._forget_client(addr, room)
+        self._clients_changed(room)
+
+    def _forget_client(self, addr, room):
+        """Drops what we keep per client outside the membership tables (stats, stream state, speaker scores)."""
+        if self.mixer:
+            self.mixer.remove(addr)
+        if room in self.selectors:
+            self.selectors[room].remove(addr)
+        self._legacy_seq.pop(addr, None)
+        self._mix_seq.pop(addr, None)
+        self._legacy_resamplers.pop(addr, None)
+        self._link_stats.pop(addr, None)
+        self._last_seen.pop(addr, None)
+        self.send_failures.pop(addr, None)
+
+    def _clients_changed(self, room=None):
+        """
+        Rebuilds the indexes derived from the membership (only on join/leave):
+        those of `room`, or of every room after the whole table was replaced.
+        """
+        if room is None:
+            members = {}
+            for addr in self.clients:
+                members.setdefault(self.client_rooms.get(addr, ""), set()).add(addr)
+            self._room_members = {r: frozenset(addrs) for r, addrs in members.items()}
+            rooms = set(self._room_members) | set(self._room_fanouts)
+        else:
+            rooms = [room]
+        for room in rooms:
+            members = self._room_members.get(room)
+            if not members:
+                # Last one out: forget the room entirely
+                self._room_members.pop(room, None)
+                self._room_fanouts.pop(room, None)
+                self._room_seq.pop(room, None)
+                self.selectors.pop(room, None)
+                continue
+            groups = {}
+            for addr in members:
+                groups.setdefault(self.client_ctl.get(addr, 0), []).append(addr)
+            fanouts = {}
+            for ctl, addrs in groups.items():
+                fanout = FanOut(self.sock)
+                fanout.update(addrs)
+                fanouts[ctl] = fanout
+            self._room_fanouts[room] = fanouts
+        if self.peer_links:
+            self._members_version = (self._members_version + 1) & 0xFFFFFFFF
+            self._announce_members()
+
+    def _room_roster_seq(self, room):
+        return self._room_seq.get(room, 0)
+
+    @staticmethod
+    def _room_label(room):
+        return f"room '{room}'" if room else "the default room"
+
+    def clients_by_room(self):
+        """Server: {room: [username, ...]} of every room with someone in it; peers' clients are marked."""
+        out = {}
+        for room, members in list(self._room_members.items()):
+            names = [self.clients.get(addr) for addr in members]
+            out[room] = [name for name in names if name is not None]
+        for link in list(self.peer_links.values()):
+            for _, room, name in list(link.members.values()):
+                out.setdefault(room, []).append(f"{name} (via {link.addr[0]}:{link.addr[1]})")
+        return {room: sorted(names) for room, names in out.items()}
+
+    def _report_send_failures(self, payload, failures):
+        if self.metrics:
+            self.metrics.send_errors += len(failures)
+        for addr, err in failures:
+            count = self.send_failures.get(addr, 0) + 1
+            self.send_failures[addr] = count
+            # First failure and then every 100th, so a dead client can't flood the log
+            if count == 1 or count % 100 == 0:
+                print(f"[Server] Relay to {addr} failed ({count}x): {err}")
+            if self.on_relay_error:
+                self.on_relay_error(addr, err)
+
     def _handle_audio(self, payload, addr):
-        # Payload here is data[1:]
-        if not payload.startswith(b'SPK!'):
+        # Payload here is data[1:], see audio_packet.py for the layouts
+        name = None
+        codec, rate = audio_codecs.ZLIB, audio_packet.LEGACY_RATE
+        if payload.startswith(audio_packet.MAGIC_V3):
+            sender_id, flags, level, codec, rate, seq, timestamp, audio_data = audio_packet.parse_v3(payload)
+            version = 3
+        elif payload.startswith(audio_packet.MAGIC_V2):
+            sender_id, flags, level, seq, timestamp, audio_data = audio_packet.parse_v2(payload)
+            version = 2
+        elif payload.startswith(audio_packet.MAGIC_V1):
+            name_len = payload[4]
+            name = payload[5:5+name_len]
+            audio_data = payload[5+name_len:]
+            sender_id, flags, level, seq, timestamp = None, 0, None, None, None
+            version = 1
+        else:
             return # Ignore non-audio or invalid packets
 
-        audio_payload = payload[4:]
-
         if self.is_server:
-            # Relay to everyone else
-            sender_name = self.clients.get(addr, "Unknown")
-            name_bytes = sender_name.encode()
-            
-            # Reconstruct: [1 (Type)] [b'SPK!'] [NameLen] [Name] [AudioData]
-            # audio_payload[1:] skips the dummy NameLen (0) sent by the client
-            relay_payload = bytes([1]) + b'SPK!' + bytes([len(name_bytes)]) + name_bytes + audio_payload[1:]
-            
-            for client_addr in list(self.clients.keys()):
-                if client_addr != addr:
-                    try:
-                        self.sock.sendto(relay_payload, client_addr)
-                    except:
-                        pass
+            if addr not in self.clients:
+                self._ask_to_rejoin(addr) # Never joined, or timed out and came back
+                return
+            is_fec = flags & audio_packet.FLAG_FEC
+            if seq is not None and not is_fec:
+                self._link(addr).on_audio(seq, timestamp, self._now_ms())
+            is_cn = flags & audio_packet.FLAG_CN
+            # CN markers carry the noise floor, not speech: keep them out of the ranking
+            if self.last_n and not is_cn and not self._selected(self.client_rooms[addr], addr, level, flags):
+                return # Not among the loudest N of its room right now
+            if self.mixer:
+                if is_cn or is_fec:
+                    return # The mix simply has no frame from this sender (and we don't protect the mix)
+                # MCU mode: decode now, the mix loop sends one stream per client
+                self.mixer.push(addr, audio_data, codec, rate)
+                return
+            self._relay_audio(addr, payload, (version, flags, level, codec, rate, seq, timestamp), audio_data)
         else:
-            # Client receives: [b'SPK!'] [NameLen (1)] [Name] [AudioData]
-            # payload was data[1:], so it starts with b'SPK!'
-            name_len = audio_payload[0]
-            username = audio_payload[1:1+name_len].decode()
-            audio_data = audio_payload[1+name_len:]
-            
-            if self.on_audio_received:
-                self.on_audio_received(username, audio_data)
+            if sender_id is None:
+                username = name.decode()
+            elif sender_id == audio_packet.MIX_SENDER_ID:
+                username = ServerMixer.NAME
+            else:
+                username = self.roster.get(sender_id, "Unknown")
+            stats = None
+            if seq is not None:
+                # Gaps here include frames a last-N server chose not to relay
+                stats = self._sender_stats.get(username)
+                if stats is None:
+                    stats = self._sender_stats[username] = LinkStats()
+            if flags & audio_packet.FLAG_FEC:
+                decoder = self._fec_decoders.get(username)
+                if decoder is None:
+                    decoder = self._fec_decoders[username] = FecDecoder()
+                group = decoder.group
+                recovered = decoder.add_parity(seq, audio_data)
+                if decoder.group > group and self.on_fec_stream:
+                    self.on_fec_stream(username, decoder.group)
+            else:
+                if stats:
+                    stats.on_audio(seq, timestamp, self._now_ms())
+                self._deliver(username, flags, level, seq, timestamp, codec, rate, audio_data)
+                decoder = self._fec_decoders.get(username)
+                recovered = decoder.add(seq, flags, level, timestamp, audio_data) if decoder else ()
+            for seq, flags, level, timestamp, audio_data in recovered:
+                stats.recovered += 1
+                self._deliver(username, flags, level, seq, timestamp, codec, rate, audio_data)
 
-    def _broadcast_participants(self):
-        if not self.is_server: return
-        msg = json.dumps({"cmd": "PARTICIPANTS", "args": list(self.clients.values())}).encode()
-        payload = bytes([0]) + msg
-        for client_addr in self.clients:
+    def _deliver(self, username, flags, level, seq, timestamp, codec, rate, audio_data):
+        if flags & audio_packet.FLAG_CN:
+            if self.on_comfort_noise:
+                self.on_comfort_noise(username, level)
+        elif self.on_audio_received:
+            self.on_audio_received(username, audio_data, seq, timestamp, codec, rate)
+
+    def _selected(self, room, sender, level, flags=0):
+        """Last-N: whether `sender` is among the loudest of its room. FEC parity follows its frames, unranked."""
+        selector = self.selectors.get(room)
+        if selector is None:
+            selector = self.selectors[room] = SpeakerSelector(max_speakers=self.last_n)
+        if flags & audio_packet.FLAG_FEC:
+            return sender in selector.active
+        return selector.update(sender, level)
+
+    def _relay_audio(self, addr, payload, header, audio_data, sender=None):
+        """
+        Relays one frame to everyone else in the sender's room; each header layout is built at most once.
+        `header` is (version, flags, level, codec, rate, seq, timestamp) of the sender's
+        packet; for legacy (v1) senders everything but the version is filled in here.
+        `sender` is (roster id, room, name) for a peer relay's client, which only our
+        own clients hear; our own clients' frames are also forwarded to the peers.
+        """
+        version, flags, level, codec, rate, seq, timestamp = header
+        if sender is None:
+            sender_id, room = self.client_ids.get(addr, 0), self.client_rooms[addr]
+        else:
+            sender_id, room = sender[0], sender[1]
+        if version == 1:
+            # Legacy sender: number its frames here so newer receivers can still buffer them
+            seq = self._legacy_seq.get(addr, 0)
+            self._legacy_seq[addr] = (seq + 1) & 0xFFFF
+            level, timestamp = audio_packet.SILENCE, int(time.monotonic() * 1000) & 0xFFFFFFFF
+        is_cn = flags & audio_packet.FLAG_CN
+        is_fec = flags & audio_packet.FLAG_FEC
+        zlib_data = None
+        built = {} # audio layout version: payload (None = not sent to that layout)
+        for ctl, fanout in self._room_fanouts.get(room, {}).items():
+            if is_fec and ctl < audio_packet.FEC_CTL:
+                continue # Parity would play as noise there
+            want = 3 if ctl >= audio_packet.V3_CTL else 2 if ctl >= audio_packet.V2_CTL else 1
+            if want not in built:
+                if want == version and version > 1:
+                    built[want] = audio_packet.relay_v2(payload, sender_id)
+                elif want == 3:
+                    built[want] = audio_packet.encode_v3(sender_id, flags, level, codec, rate, seq, timestamp, audio_data)
+                elif want == 1 and is_cn:
+                    built[want] = None # Legacy clients have no notion of comfort noise
+                else:
+                    # Below v3 receivers only decode zlib at LEGACY_RATE: convert once for all of them
+                    if zlib_data is None:
+                        zlib_data = audio_data if is_cn else self._legacy_audio(addr, audio_data, codec, rate)
+                    if want == 2:
+                        built[want] = audio_packet.encode_v2(sender_id, flags, level, seq, timestamp, zlib_data)
+                    else:
+                        built[want] = audio_packet.encode_v1(sender[2] if sender else self.clients[addr], zlib_data)
+            out = built[want]
+            if out is None:
+                continue
+            self._fanout_send(fanout, out, exclude=addr)
+
+        if sender is None and self.peer_links:
+            forward = None
+            for link in self.peer_links.values():
+                if room not in link.rooms:
+                    continue # Nobody there to hear it
+                if forward is None:
+                    if 3 not in built:
+                        built[3] = (audio_packet.relay_v2(payload, sender_id) if version == 3 else
+                                    audio_packet.encode_v3(sender_id, flags, level, codec, rate, seq, timestamp,
+                                                           audio_data))
+                    forward = federation.encode_audio(built[3])
+                self._send_to_peer(forward, link.addr)
+
+    def _legacy_audio(self, addr, audio_data, codec, rate):
+        """A v3 sender's frame as v1/v2 receivers expect it: zlib at LEGACY_RATE."""
+        if rate == audio_packet.LEGACY_RATE:
+            return audio_codecs.transcode(audio_data, codec)
+        from_rate, resampler = self._legacy_resamplers.get(addr, (None, None))
+        if from_rate != rate:
+            resampler = Resampler(rate, audio_packet.LEGACY_RATE)
+            self._legacy_resamplers[addr] = (rate, resampler)
+        pcm = resampler.process(audio_codecs.get(codec).decode(audio_data))
+        return audio_codecs.get(audio_codecs.ZLIB).encode(pcm)
+
+    def _mix_loop(self):
+        """Server (MCU mode): one mix per frame interval, on a steady clock."""
+        interval = self.mixer.interval
+        next_tick = time.perf_counter()
+        while self.is_running:
             try:
-                self.sock.sendto(payload, client_addr)
-            except:
-                pass
+                timestamp = int(time.monotonic() * 1000) & 0xFFFFFFFF
+                mixes = []
+                for members in list(self._room_members.values()):
+                    mixes += self.mixer.mix(members) # Each room only hears its own speakers
+                for frame, level, recipients in mixes:
+                    v1 = None
+                    failures = []
+                    for addr in recipients:
+                        ctl = self.client_ctl.get(addr, 0)
+                        if ctl >= audio_packet.V2_CTL:
+                            # Each client's mix is its own stream with its own sequence
+                            seq = self._mix_seq.get(addr, 0)
+                            self._mix_seq[addr] = (seq + 1) & 0xFFFF
+                            if ctl >= audio_packet.V3_CTL:
+                                payload = audio_packet.encode_v3(audio_packet.MIX_SENDER_ID, 0, level, audio_codecs.ZLIB,
+                                                                 self.mixer.sample_rate, seq, timestamp, frame)
+                            else:
+                                payload = audio_packet.encode_v2(audio_packet.MIX_SENDER_ID, 0, level, seq, timestamp, frame)
+                        else:
+                            payload = v1 = v1 or audio_packet.encode_v1(self.mixer.NAME, frame)
+                        try:
+                            self._sendto(payload, addr)
+                            if self.metrics:
+                                self.metrics.mix_packets_out += 1
+                                self.metrics.mix_bytes_out += len(payload)
+                        except OSError as e:
+                            failures.append((addr, e))
+                    if failures:
+                        self._report_send_failures(payload, failures)
+            except Exception as e:
+                print(f"[Server] Mix error: {e}")
+
+            next_tick += interval
+            delay = next_tick - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_tick = time.perf_counter() # Fell behind, don't try to catch up in a burst
+
+    def _broadcast_participants(self, change=None, room=""):
+        """
+        Tells the clients in `room` about a membership change there. Roster-capable
+        clients get a single delta (`change` is (op, addr or id, name)); older ones
+        get the room's full list.
+        """
+        if not self.is_server: return
+        names = None
+        for ctl, fanout in self._room_fanouts.get(room, {}).items():
+            if change and ctl >= control.ROSTER_VERSION:
+                op, who, name = change
+                if op == "JOINED" and who in self.client_ids:
+                    # The joiner itself gets a snapshot instead of its own delta
+                    client_id, exclude = self.client_ids[who], who
+                else:
+                    client_id, exclude = who, None
+                args = {"seq": self._room_roster_seq(room), "op": op, "id": client_id, "name": name}
+                payload = control.encode("ROSTER_DELTA", args, ctl)
+                self._fanout_send(fanout, payload, exclude=exclude)
+            else:
+                if names is None:
+                    names = self._room_names(room)
+                payload = self._encode_command("PARTICIPANTS", names, ctl)
+                self._fanout_send(fanout, payload)
+
+        if change and change[0] == "JOINED" and self.client_ctl.get(change[1], 0) >= control.ROSTER_VERSION:
+            self._send_roster_to(change[1])
+
+    def _room_names(self, room):
+        names = [self.clients[a] for a in self._room_members.get(room, ()) if a in self.clients]
+        return names + list(self._remote_by_room.get(room, {}).values())
+
+    def _send_roster_to(self, addr):
+        """The full roster of addr's room."""
+        room = self.client_rooms.get(addr, "")
+        ctl = self.client_ctl.get(addr, 0)
+        if ctl < control.ROSTER_VERSION:
+            self._send_command_to("PARTICIPANTS", self._room_names(room), addr)
+            return
+        members = [(self.client_ids[a], self.clients[a]) for a in self._room_members.get(room, ()) if a in self.clients]
+        members += self._remote_by_room.get(room, {}).items()
+        for part in control.snapshot_parts(self._room_roster_seq(room), members):
+            self._send_command_to("ROSTER_SNAPSHOT", part, addr)
+
+    def _broadcast_command(self, cmd, args):
+        """Sends a command to every client in every room, encoded once per control version."""
+        payloads = {}
+        for fanouts in list(self._room_fanouts.values()):
+            for ctl, fanout in fanouts.items():
+                if ctl not in payloads:
+                    payloads[ctl] = self._encode_command(cmd, args, ctl)
+                self._fanout_send(fanout, payloads[ctl])
+
+    def _fanout_send(self, fanout, payload, exclude=None):
+        """Sends to one FanOut group, counting what went out and reporting what didn't."""
+        failures = fanout.send(payload, exclude=exclude)
+        metrics = self.metrics
+        if metrics:
+            sent = len(fanout) - (exclude in fanout) - len(failures)
+            metrics.packets_out += sent
+            metrics.bytes_out += sent * len(payload)
+        if failures:
+            self._report_send_failures(payload, failures)
+
+    def _handle_peer(self, payload, addr):
+        """A datagram from another relay (see federation.py); ignored unless it is a configured peer."""
+        link = self.peer_links.get(addr)
+        if link is None or not payload:
+            return
+        first_contact = link.last_seen is None
+        link.last_seen = time.monotonic()
+        if first_contact:
+            self._announce_members(link) # Don't make it wait a whole interval for our rooms
+        op, body = payload[0], payload[1:]
+        try:
+            if op == federation.AUDIO:
+                self._handle_peer_audio(link, body)
+            elif op == federation.MEMBERS:
+                version, part, parts, members = federation.decode_members(body)
+                members = link.receive_part(version, part, parts, members)
+                if members is not None and version != link.version:
+                    link.version = version
+                    self._apply_peer_members(link, members)
+            elif op == federation.BYE:
+                print(f"[Server] Peer relay {addr} left")
+                link.version = None
+                self._apply_peer_members(link, [])
+        except Exception as e:
+            print(f"[Server] Peer error from {addr}: {e}")
+
+    def _handle_peer_audio(self, link, datagram):
+        if not datagram.startswith(b'\x01' + audio_packet.MAGIC_V3):
+            return
+        payload = datagram[1:]
+        sender_id, flags, level, codec, rate, seq, timestamp, audio_data = audio_packet.parse_v3(payload)
+        sender = link.members.get(sender_id)
+        if sender is None:
+            return # Its member list hasn't got here yet
+        key = (link.addr, sender_id)
+        if self.last_n and not flags & audio_packet.FLAG_CN and not self._selected(sender[1], key, level, flags):
+            return
+        self._relay_audio(key, payload, (3, flags, level, codec, rate, seq, timestamp), audio_data, sender)
+
+    def _apply_peer_members(self, link, members):
+        """Swaps in a peer's [(id, room, name)], telling our clients in the rooms concerned who came and went."""
+        new = {client_id: (room, name) for client_id, room, name in members}
+        for client_id, (local_id, room, name) in list(link.members.items()):
+            if new.get(client_id) != (room, name):
+                del link.members[client_id]
+                self._remote_changed("LEFT", (link.addr, client_id), local_id, room, name)
+        for client_id, (room, name) in new.items():
+            if client_id not in link.members:
+                local_id = self._new_client_id()
+                link.members[client_id] = (local_id, room, name)
+                self._remote_changed("JOINED", (link.addr, client_id), local_id, room, name)
+        link.rooms = frozenset(room for room, _ in new.values())
+
+    def _remote_changed(self, op, key, local_id, room, name):
+        names = dict(self._remote_by_room.get(room, {}))
+        if op == "JOINED":
+            names[local_id] = name
+        else:
+            names.pop(local_id, None)
+            if room in self.selectors:
+                self.selectors[room].remove(key)
+            self._legacy_resamplers.pop(key, None)
+        if names:
+            self._remote_by_room[room] = names
+        else:
+            self._remote_by_room.pop(room, None)
+        self.roster_seq += 1
+        self._room_seq[room] = self._room_seq.get(room, 0) + 1
+        self._broadcast_participants((op, local_id, name), room)
+        if room not in self._room_members:
+            self._room_seq.pop(room, None) # None of ours in there to keep count for
+
+    def _announce_members(self, link=None):
+        """Sends our own clients to one peer, or to all of them."""
+        members = [(self.client_ids[a], self.client_rooms.get(a, ""), name)
+                   for a, name in list(self.clients.items()) if a in self.client_ids]
+        datagrams = federation.encode_members(self._members_version, members)
+        for link in [link] if link else self.peer_links.values():
+            for datagram in datagrams:
+                self._send_to_peer(datagram, link.addr)
+
+    def _peer_tick(self, now):
+        """Runs with the expiry sweep: periodic announcements, and dropping peers that went quiet."""
+        if now >= self._next_announce:
+            self._next_announce = now + federation.PEER_INTERVAL
+            self._announce_members()
+        for link in self.peer_links.values():
+            if link.version is not None and now - link.last_seen > self.client_timeout:
+                print(f"[Server] Peer relay {link.addr} timed out")
+                link.version = None
+                self._apply_peer_members(link, [])
+
+    def _send_to_peer(self, payload, addr):
+        try:
+            self._sendto(payload, addr)
+            if self.metrics:
+                self.metrics.sent(1, len(payload))
+        except OSError as e:
+            self._report_send_failures(payload, [(addr, e)])
+
+    def _leave_peers(self):
+        for link in self.peer_links.values():
+            self._send_to_peer(federation.encode_bye(), link.addr)
+
+    @staticmethod
+    def _encode_command(cmd, args, ctl, caps=None):
+        if ctl:
+            return control.encode(cmd, args, ctl)
+        msg = {"cmd": cmd, "args": args}
+        if caps:
+            msg["caps"] = caps
+        return bytes([0]) + json.dumps(msg).encode()
 
-    def send_audio(self, data):
+    def send_audio(self, data, level=0, flags=0, timestamp=None):
+        """
+        Sends one frame encoded with self.codec (the codec the server agreed to).
+        `level` is its RFC 6464 loudness (0 = loudest), `timestamp` its capture
+        time in ms on the sender's media clock.
+        """
         if self.is_server: return # Server only relays
         if not self.server_addr: return
         
-        # Audio packet: [1 (Type)] [b'SPK!'] [0 (Dummy NameLen)] [AudioData]
-        payload = bytes([1]) + b'SPK!' + bytes([0]) + data
+        parity = None
+        if self.ctl_version >= audio_packet.V2_CTL:
+            if timestamp is None:
+                timestamp = int(time.monotonic() * 1000)
+            seq = self._audio_seq
+            self._audio_seq = (seq + 1) & 0xFFFF
+            if self.ctl_version >= audio_packet.V3_CTL:
+                payload = audio_packet.encode_v3(0, flags, level, self.codec, self.sample_rate, seq,
+                                                 timestamp & 0xFFFFFFFF, data)
+                if self._fec_encoder and self.ctl_version >= audio_packet.FEC_CTL:
+                    parity = self._fec_encoder.add(seq, flags, level, timestamp & 0xFFFFFFFF, data)
+            else:
+                payload = audio_packet.encode_v2(0, flags, level, seq, timestamp & 0xFFFFFFFF, data)
+        elif flags & audio_packet.FLAG_CN:
+            return # Legacy server: just stay quiet
+        else:
+            # Audio packet: [1 (Type)] [b'SPK!'] [0 (Dummy NameLen)] [AudioData]
+            payload = bytes([1]) + b'SPK!' + bytes([0]) + data
         try:
             self.sock.sendto(payload, self.server_addr)
+            if parity:
+                # This frame closed an FEC group: its parity goes right after it
+                first_seq, parity_data = parity
+                self.sock.sendto(audio_packet.encode_v3(0, audio_packet.FLAG_FEC, audio_packet.SILENCE, self.codec,
+                                                        self.sample_rate, first_seq, timestamp & 0xFFFFFFFF,
+                                                        parity_data), self.server_addr)
         except Exception as e:
             print(f"Send audio error: {e}")
 
+    def _ask_to_rejoin(self, addr):
+        """
+        Tells an address we don't know (any more) to JOIN again. Always JSON, like JOIN
+        itself: we no longer know what it negotiated, and clients that predate REJOIN
+        just ignore an unknown command. At most once per address per sweep interval.
+        """
+        if addr in self._rejoin_asked:
+            return
+        self._rejoin_asked.add(addr)
+        try:
+            payload = self._encode_command("REJOIN", None, 0)
+            self._sendto(payload, addr)
+            if self.metrics:
+                self.metrics.sent(1, len(payload))
+        except OSError:
+            pass # Closed during shutdown
+
     def _send_command_to(self, cmd, args, addr):
         """Helper to send command to a specific address."""
         try:
-            msg = json.dumps({"cmd": cmd, "args": args}).encode()
-            payload = bytes([0]) + msg
+            payload = self._encode_command(cmd, args, self.client_ctl.get(addr, 0))
             if self.sock:
-                self.sock.sendto(payload, addr)
+                self._sendto(payload, addr)
+                if self.metrics:
+                    self.metrics.sent(1, len(payload))
         except Exception as e:
             print(f"Error sending command to {addr}: {e}")
 
     def _send_command(self, cmd, args):
         try:
-            msg = json.dumps({"cmd": cmd, "args": args}).encode()
-            payload = bytes([0]) + msg
             if self.is_server:
                 # Server rarely sends commands to everyone except participants update
                 pass
             else:
+                # JOIN always goes out as JSON so any server version understands it
+                if cmd == "JOIN":
+                    caps = {"ctl": control.VERSION, "codec": self.requested_codec}
+                    if self.room:
+                        caps["room"] = self.room
+                    payload = self._encode_command(cmd, args, 0, caps=caps)
+                else:
+                    payload = self._encode_command(cmd, args, self.ctl_version)
                 if self.server_addr and self.sock:
                     self.sock.sendto(payload, self.server_addr)
         except (OSError, AttributeError):
@@ -215,8 +1026,54 @@ class NetworkEngine:
 
     def _heartbeat_loop(self):
         while self.is_running:
-            self._send_command("PING", None)
-            time.sleep(5)
+            self._send_command("PING", self._ping_args())
+            time.sleep(self.PING_INTERVAL)
+
+    def _ping_args(self):
+        if self.ctl_version < control.STATS_VERSION:
+            return None # Older servers only need to know we're alive
+        now = self._now_ms()
+        seq = self._ping_seq
+        self._ping_seq = (seq + 1) & 0xFFFF
+        args = {"seq": seq, "ts": now}
+        if self._last_pong:
+            server_ts, received = self._last_pong
+            args["echo"] = server_ts
+            args["held"] = (now - received) & 0xFFFFFFFF
+        return args
+
+    def _link(self, addr):
+        """Server: the LinkStats of a joined client (None for strangers)."""
+        stats = self._link_stats.get(addr)
+        if stats is None and addr in self.clients:
+            stats = self._link_stats[addr] = LinkStats()
+        return stats
+
+    @staticmethod
+    def _now_ms():
+        return int(time.monotonic() * 1000) & 0xFFFFFFFF
+
+    def metrics_text(self):
+        """Server: the Prometheus-style text served by metrics.MetricsServer."""
+        return self.metrics.render(len(self.clients), self.link_stats())
+
+    def link_stats(self):
+        """
+        Rolling RTT, heartbeat loss, audio loss and jitter (see LinkStats.snapshot).
+        Server: {addr: stats} per client, with its "username" and "room". Client: {"server":
+        stats of the link to the server, "senders": {username: stats of their audio}}.
+        """
+        if self.is_server:
+            out = {}
+            for addr, stats in list(self._link_stats.items()):
+                username = self.clients.get(addr)
+                if username is not None:
+                    out[addr] = dict(stats.snapshot(), username=username, room=self.client_rooms.get(addr, ""))
+            return out
+        return {
+            "server": self.server_stats.snapshot(),
+            "senders": {name: stats.snapshot() for name, stats in list(self._sender_stats.items())},
+        }
 
     def stop(self):
         with self._stop_lock:
@@ -227,6 +1084,8 @@ class NetworkEngine:
             try:
                 if not self.is_server and self.server_addr:
                     self._send_command("LEAVE", self.username)
+                elif self.is_server:
+                    self._leave_peers()
             except:
                 pass
             
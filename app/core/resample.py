@@ -0,0 +1,58 @@
+import math
+import numpy as np
+
+_banks = {} # (up, down): polyphase filter bank, shared by every stream with that rate pair
+
+def filter_bank(up, down, taps=24, beta=8.0):
+    """
+    Polyphase split of a Kaiser-windowed sinc low-pass for resampling by up/down:
+    row p holds the taps used for output samples at phase p. The cut-off sits a
+    little under the lower of the two Nyquist frequencies, and the filter gets
+    longer as the decimation ratio grows so aliasing stays down.
+    """
+    key = (up, down)
+    bank = _banks.get(key)
+    if bank is None:
+        per_phase = math.ceil(taps * max(1.0, down / up))
+        n = up * per_phase
+        cutoff = 0.45 / max(up, down) # Cycles per sample at the upsampled rate
+        m = np.arange(n) - (n - 1) / 2
+        h = 2 * cutoff * np.sinc(2 * cutoff * m) * np.kaiser(n, beta) * up
+        bank = _banks[key] = h.reshape(per_phase, up).T.astype(np.float32).copy()
+    return bank
+
+class Resampler:
+    """
+    Streaming rational resampler for one audio stream, from_rate -> to_rate.
+
+    Frames are processed as they arrive: the filter history and the output
+    phase carry over between calls, so consecutive frames join without
+    clicks. Each call gathers one window of input per output sample and
+    applies its phase's taps in a single einsum, with no per-sample Python.
+    """
+    def __init__(self, from_rate, to_rate, channels=1):
+        g = math.gcd(from_rate, to_rate)
+        self.up = to_rate // g
+        self.down = from_rate // g
+        self.channels = channels
+        self.bank = filter_bank(self.up, self.down)
+        self._taps = self.bank.shape[1]
+        self._history = np.zeros((self._taps - 1, channels), dtype=np.float32)
+        self._t = 0 # Upsampled-time position of the next output, relative to the next frame
+
+    def process(self, pcm):
+        """int16 samples ((n,) or (n, channels)) -> resampled int16 (m, channels)."""
+        x = np.asarray(pcm, dtype=np.float32).reshape(-1, self.channels)
+        n = len(x)
+        ext = np.concatenate((self._history, x))
+
+        end = n * self.up
+        count = max(0, -(-(end - self._t) // self.down))
+        t = self._t + self.down * np.arange(count)
+        newest = t // self.up + self._taps - 1 # Index in ext of each output's newest input
+        windows = ext[newest[:, None] - np.arange(self._taps)] # (count, taps, channels)
+        y = np.einsum('nk,nkc->nc', self.bank[t % self.up], windows)
+
+        self._t += count * self.down - end
+        self._history = ext[len(ext) - (self._taps - 1):]
+        return np.clip(np.rint(y), -32768, 32767).astype(np.int16)
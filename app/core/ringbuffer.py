@@ -0,0 +1,79 @@
+import threading
+import numpy as np
+
+class RingBuffer:
+    """
+    Fixed-capacity single-producer/single-consumer sample FIFO backed by one
+    preallocated NumPy array.
+
+    The producer (the audio callback) only ever copies into the array and
+    bumps its own counter: it never blocks, never allocates sample memory and
+    never touches the consumer's state. When the consumer falls behind, the
+    oldest samples are simply overwritten; the consumer notices on its next
+    read, skips what it lost and counts it in `overflows`. A read that was
+    overtaken by the producer while copying is retried, so torn frames are
+    never returned. `guard` is the largest block the producer writes at once.
+    """
+    def __init__(self, capacity, channels=1, dtype=np.int16, guard=None):
+        self.capacity = capacity
+        self.channels = channels
+        self.guard = guard if guard is not None else capacity // 4
+        self._buf = np.zeros((capacity, channels), dtype=dtype)
+        self._written = 0 # Samples ever written (producer only)
+        self._read = 0 # Samples ever consumed or skipped (consumer only)
+        self.overflows = 0 # Samples dropped because the consumer was too slow
+        self._ready = threading.Event()
+
+    @property
+    def read_position(self):
+        """Total samples the consumer has moved past (a media clock, drops included)."""
+        return self._read
+
+    def available(self):
+        return min(self._written - self._read, self.capacity - self.guard)
+
+    def write(self, samples):
+        """Producer side: copies a (frames, channels) block in, overwriting the oldest data if full."""
+        n = len(samples)
+        if n > self.capacity:
+            samples = samples[n - self.capacity:]
+            self._written += n - self.capacity
+            n = self.capacity
+        start = self._written % self.capacity
+        first = min(n, self.capacity - start)
+        self._buf[start:start + first] = samples[:first]
+        if first < n:
+            self._buf[:n - first] = samples[first:]
+        self._written += n
+        self._ready.set()
+
+    def read(self, n, out, timeout=None):
+        """
+        Consumer side: copies the oldest n samples into `out` (shape (n, channels)).
+        Returns `out`, or None if n samples didn't arrive within `timeout`.
+        """
+        if self._written - self._read < n:
+            self._ready.clear()
+            # Re-check after clearing so a write in between isn't missed
+            while self._written - self._read < n:
+                if not self._ready.wait(timeout):
+                    return None
+                self._ready.clear()
+
+        limit = self.capacity - self.guard
+        while True:
+            behind = self._written - self._read
+            if behind > limit:
+                # Producer lapped us: skip to the oldest samples that are still intact
+                self.overflows += behind - limit
+                self._read += behind - limit
+            start = self._read % self.capacity
+            first = min(n, self.capacity - start)
+            out[:first] = self._buf[start:start + first]
+            if first < n:
+                out[first:n] = self._buf[:n - first]
+            # Intact unless the producer (plus one block in flight) reached our region meanwhile
+            if self._written + self.guard - self._read <= self.capacity:
+                break
+        self._read += n
+        return out
@@ -0,0 +1,339 @@
+import multiprocessing as mp
+import os
+import socket
+import struct
+import threading
+import time
+from multiprocessing import shared_memory
+from .network_engine import NetworkEngine
+
+class SharedClientTable:
+    """
+    Fixed-size client table in shared memory so every relay worker can fan out
+    to every participant, whichever worker the participant's packets land on.
+
+    Layout: [version (u64)] followed by max_clients slots of
+    [active (u8)] [ip (4 bytes)] [port (u16)] [ctl version (u8)] [name_len (u8)] [name (NAME_MAX bytes)]
+    [room_len (u8)] [room (ROOM_MAX bytes)],
+    then max_clients room entries of
+    [active (u8)] [room_len (u8)] [room (ROOM_MAX bytes)] [roster seq (u32)].
+    The version works as a seqlock: writers make it odd while a slot is being
+    changed, readers retry if it moved while they were copying. Every change
+    bumps it by two. The slot index doubles as the client's roster id, and
+    each room with someone in it has an entry holding its own roster sequence,
+    bumped under the same seqlock on every join/leave there, so a change in
+    one room never looks like a roster gap in another. Every process attaching
+    to the table has to be given the same `max_clients` as its creator.
+    """
+    MAX_CLIENTS = 256 # Default; roster ids are slot + 1, so up to 0xFFFF
+    NAME_MAX = 64
+    ROOM_MAX = 4 * NetworkEngine.ROOM_MAX # Bytes: room names are cut in characters, before encoding
+    HEADER = struct.Struct("!Q")
+    SLOT = struct.Struct(f"!B4sHBB{NAME_MAX}sB{ROOM_MAX}s")
+    ROOM = struct.Struct(f"!BB{ROOM_MAX}sI")
+
+    def __init__(self, name=None, lock=None, max_clients=None):
+        self.max_clients = max_clients or self.MAX_CLIENTS
+        if not 1 <= self.max_clients <= 0xFFFF:
+            raise ValueError("max_clients must be 1..65535")
+        size = self._room_offset(self.max_clients)
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+            self.shm.buf[:size] = bytes(size)
+            self.owner = True
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            self.owner = False
+        self.lock = lock or mp.Lock()
+        self._cached_version = -1
+        self._cached = {}
+        self._cached_rooms = {}
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def version(self):
+        return self.HEADER.unpack_from(self.shm.buf, 0)[0]
+
+    def _bump(self):
+        self.HEADER.pack_into(self.shm.buf, 0, self.version() + 1)
+
+    def _slot_offset(self, index):
+        return self.HEADER.size + index * self.SLOT.size
+
+    def _room_offset(self, index):
+        return self.HEADER.size + self.max_clients * self.SLOT.size + index * self.ROOM.size
+
+    def _bump_room(self, room):
+        """Bumps the roster sequence of `room` (encoded), creating its entry; returns the new value. Caller holds the lock."""
+        free = None
+        for i in range(self.max_clients):
+            active, room_len, name, seq = self.ROOM.unpack_from(self.shm.buf, self._room_offset(i))
+            if active and name[:room_len] == room:
+                break
+            if not active and free is None:
+                free = i
+        else:
+            i, seq = free, 0 # One entry per client fits every room
+        seq = (seq + 1) & 0xFFFFFFFF
+        self.ROOM.pack_into(self.shm.buf, self._room_offset(i), 1, len(room), room, seq)
+        return seq
+
+    def _release_room(self, room):
+        """Frees the entry of `room` if no slot is in it any more. Caller holds the lock."""
+        for i in range(self.max_clients):
+            active, _, _, _, _, _, room_len, slot_room = self.SLOT.unpack_from(self.shm.buf, self._slot_offset(i))
+            if active and slot_room[:room_len] == room:
+                return
+        for i in range(self.max_clients):
+            active, room_len, name, _ = self.ROOM.unpack_from(self.shm.buf, self._room_offset(i))
+            if active and name[:room_len] == room:
+                self.shm.buf[self._room_offset(i)] = 0
+                return
+
+    def _find(self, addr):
+        """Returns (slot of addr, first free slot); either may be None. Caller holds the lock."""
+        ip = socket.inet_aton(addr[0])
+        free = None
+        for i in range(self.max_clients):
+            active, slot_ip, slot_port = self.SLOT.unpack_from(self.shm.buf, self._slot_offset(i))[:3]
+            if active and slot_ip == ip and slot_port == addr[1]:
+                return i, free
+            if not active and free is None:
+                free = i
+        return None, free
+
+    def add(self, addr, username, ctl=0, room=""):
+        """Adds or updates a client; returns the roster sequence of its room after that, None if the table is full."""
+        name = username.encode()[:self.NAME_MAX]
+        room = room.encode()[:self.ROOM_MAX]
+        with self.lock:
+            index, free = self._find(addr)
+            old_room = None
+            if index is None:
+                index = free
+            else:
+                _, _, _, _, _, _, room_len, old_room = self.SLOT.unpack_from(self.shm.buf, self._slot_offset(index))
+                old_room = old_room[:room_len]
+            if index is None:
+                print(f"[Server] Client table full, rejecting {addr}")
+                return None
+            slot = self.SLOT.pack(1, socket.inet_aton(addr[0]), addr[1], ctl, len(name), name, len(room), room)
+            offset = self._slot_offset(index)
+            if self.shm.buf[offset:offset + self.SLOT.size] == slot:
+                return self._room_seq_locked(room) # Join retry, nothing changed
+            self._bump()
+            self.shm.buf[offset:offset + self.SLOT.size] = slot
+            if old_room != room:
+                # Joined, or moved: a roster change in the room(s) concerned. A join retry
+                # or a new ctl/name is not, and leaves the sequences alone.
+                seq = self._bump_room(room)
+                if old_room is not None:
+                    self._bump_room(old_room)
+                    self._release_room(old_room)
+            else:
+                seq = self._room_seq_locked(room)
+            self._bump()
+        return seq
+
+    def _room_seq_locked(self, room):
+        for i in range(self.max_clients):
+            active, room_len, name, seq = self.ROOM.unpack_from(self.shm.buf, self._room_offset(i))
+            if active and name[:room_len] == room:
+                return seq
+        return 0
+
+    def remove(self, addr):
+        """Removes a client; returns the roster sequence of the room it left, None if it wasn't here."""
+        with self.lock:
+            index, _ = self._find(addr)
+            if index is None:
+                return None
+            _, _, _, _, _, _, room_len, room = self.SLOT.unpack_from(self.shm.buf, self._slot_offset(index))
+            self._bump()
+            self.shm.buf[self._slot_offset(index)] = 0
+            seq = self._bump_room(room[:room_len])
+            self._release_room(room[:room_len])
+            self._bump()
+        return seq
+
+    def snapshot(self):
+        """Returns {addr: (username, ctl, slot, room)}; cached until some worker changes the table."""
+        version = self.version()
+        if version == self._cached_version:
+            return self._cached
+
+        while True:
+            if version % 2:
+                time.sleep(0) # Writer in progress
+                version = self.version()
+                continue
+            clients = {}
+            for i in range(self.max_clients):
+                active, ip, port, ctl, name_len, name, room_len, room = self.SLOT.unpack_from(self.shm.buf,
+                                                                                         self._slot_offset(i))
+                if active:
+                    clients[(socket.inet_ntoa(ip), port)] = (name[:name_len].decode(errors="replace"), ctl, i,
+                                                             room[:room_len].decode(errors="replace"))
+            rooms = {}
+            for i in range(self.max_clients):
+                active, room_len, room, seq = self.ROOM.unpack_from(self.shm.buf, self._room_offset(i))
+                if active:
+                    rooms[room[:room_len].decode(errors="replace")] = seq
+            after = self.version()
+            if after == version:
+                break
+            version = after
+
+        self._cached_version = version
+        self._cached = clients
+        self._cached_rooms = rooms
+        return clients
+
+    def room_seqs(self):
+        """{room: roster sequence} of every room with someone in it, read along with snapshot()."""
+        self.snapshot()
+        return self._cached_rooms
+
+    def close(self):
+        self.shm.close()
+        if self.owner:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+
+class _ShardWorker(NetworkEngine):
+    """Relay worker that keeps its client list in the shared table."""
+    def __init__(self, table, port=None):
+        super().__init__(is_server=True, username="Server", reuse_port=True, port=port)
+        self.table = table
+        self._lock = threading.Lock() # Receive thread vs sweep thread
+
+    def _sync_clients(self):
+        if self.table.version() != self.table._cached_version:
+            snapshot = self.table.snapshot()
+            gone = [(addr, self.client_rooms.get(addr, "")) for addr in self.clients if addr not in snapshot]
+            self.clients = {addr: info[0] for addr, info in snapshot.items()}
+            self.client_ctl = {addr: info[1] for addr, info in snapshot.items()}
+            self.client_ids = {addr: info[2] + 1 for addr, info in snapshot.items()}
+            self.client_rooms = {addr: info[3] for addr, info in snapshot.items()}
+            self._room_seq = dict(self.table.room_seqs())
+            self.roster_seq = self.table._cached_version // 2
+            self._clients_changed()
+            for addr, room in gone:
+                self._forget_client(addr, room) # Whichever worker saw it leave
+
+    def _dispatch(self, data, addr):
+        with self._lock:
+            self._sync_clients()
+            super()._dispatch(data, addr)
+
+    def _sweep_timer(self):
+        # The empty wake-up datagram would land on whichever worker the kernel
+        # hashes it to, not necessarily us: sweep from this thread instead
+        while self.is_running:
+            time.sleep(self.sweep_interval)
+            with self._lock:
+                try:
+                    self._sync_clients()
+                    self._maybe_sweep()
+                except Exception as e:
+                    print(f"[Server] Sweep error: {e}")
+
+    def _add_client(self, addr, username, ctl=0, room=""):
+        # Only the worker the client's packets hash to tracks (and expires) it
+        self._track(addr)
+        is_new = addr not in self.clients
+        seq = self.table.add(addr, username, ctl, room)
+        if seq is None:
+            return None # Table full
+        self._sync_clients()
+        if room in self._room_seq:
+            # The delta we are about to send is for our change, even if another
+            # worker has changed the room again since
+            self._room_seq[room] = seq
+        return is_new and addr in self.clients
+
+    def _remove_client(self, addr):
+        room = self.client_rooms.get(addr, "")
+        seq = self.table.remove(addr)
+        self._sync_clients()
+        if seq is not None and room in self._room_seq:
+            self._room_seq[room] = seq # For the LEFT delta, as in _add_client
+        self._forget_client(addr, room)
+
+def _worker_main(table_name, lock, max_clients, stop_event, port):
+    table = SharedClientTable(table_name, lock, max_clients)
+    worker = _ShardWorker(table, port)
+    worker.start()
+    try:
+        stop_event.wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        worker.stop()
+        table.close()
+
+class ShardedRelayServer:
+    """
+    Multi-process relay: N server-mode NetworkEngine workers bound to the same UDP port
+    with SO_REUSEPORT. The kernel spreads clients across workers by address
+    hash and the shared client table lets any worker relay to any participant.
+    Exposes the same clients/is_running/start/stop surface ServerApp uses.
+    """
+    PORT = NetworkEngine.PORT
+
+    get_public_ip = staticmethod(NetworkEngine.get_public_ip)
+    get_local_ip = staticmethod(NetworkEngine.get_local_ip)
+
+    def __init__(self, workers=None, port=None, max_clients=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.port = port or self.PORT
+        self.max_clients = max_clients or SharedClientTable.MAX_CLIENTS
+        if not hasattr(socket, "SO_REUSEPORT") and self.workers > 1:
+            print("[Server] SO_REUSEPORT not supported on this platform, using a single worker")
+            self.workers = 1
+        self.is_running = False
+        self.table = None
+        self._stop_event = None
+        self._procs = []
+
+    @property
+    def clients(self):
+        if not self.table:
+            return {}
+        return {addr: info[0] for addr, info in self.table.snapshot().items()}
+
+    def clients_by_room(self):
+        """{room: [username, ...]} of every room with someone in it."""
+        out = {}
+        if self.table:
+            for name, _, _, room in self.table.snapshot().values():
+                out.setdefault(room, []).append(name)
+        return {room: sorted(names) for room, names in out.items()}
+
+    def start(self, server_ip=None):
+        self.table = SharedClientTable(max_clients=self.max_clients)
+        self._stop_event = mp.Event()
+        for _ in range(self.workers):
+            p = mp.Process(target=_worker_main,
+                           args=(self.table.name, self.table.lock, self.max_clients, self._stop_event, self.port),
+                           daemon=True)
+            p.start()
+            self._procs.append(p)
+        self.is_running = True
+        print(f"[Server] Started {self.workers} relay workers on port {self.port}")
+
+    def stop(self):
+        if not self.is_running:
+            return
+        self.is_running = False
+        self._stop_event.set()
+        for p in self._procs:
+            p.join(timeout=3)
+            if p.is_alive():
+                p.terminate()
+        self._procs = []
+        self.table.close()
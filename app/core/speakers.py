@@ -0,0 +1,70 @@
+import time
+
+class SpeakerSelector:
+    """
+    Last-N selective forwarding: tracks a smoothed loudness per sender from the
+    level byte every v2 audio packet carries and only lets the `max_speakers`
+    loudest through.
+
+    Hysteresis keeps the set from flapping: a challenger only replaces the
+    quietest active speaker if it is `hysteresis_db` louder, and a speaker
+    keeps its slot for at least `hold_time` seconds. A speaker that stops
+    sending (muted, DTX) loses its slot once it has been quiet for `hold_time`.
+    All of this is O(max_speakers) per packet, no sorting.
+    """
+    def __init__(self, max_speakers=3, hysteresis_db=6.0, hold_time=0.5, min_level=60, smoothing=0.3):
+        self.max_speakers = max_speakers
+        self.hysteresis_db = hysteresis_db
+        self.hold_time = hold_time
+        self.min_level = min_level # Frames quieter than -min_level dBov never claim a slot
+        self.smoothing = smoothing
+
+        self.scores = {} # sender: smoothed loudness in dB above silence
+        self.active = {} # sender: time it got its slot
+        self._last_voice = {} # sender: last time a frame was above min_level
+
+    def update(self, sender, level, now=None):
+        """Feeds one packet's level (0 loudest .. 127 silence); returns True if it should be forwarded."""
+        if level is None:
+            return True # Legacy senders carry no level, always forward them
+        if now is None:
+            now = time.monotonic()
+
+        loudness = 127 - level
+        score = self.scores.get(sender, 0.0)
+        score += self.smoothing * (loudness - score)
+        self.scores[sender] = score
+        voiced = level <= self.min_level
+        if voiced:
+            self._last_voice[sender] = now
+
+        if sender in self.active:
+            return True
+        if not voiced:
+            return False
+
+        if len(self.active) < self.max_speakers:
+            self.active[sender] = now
+            return True
+
+        # Full: find the weakest active speaker, counting stale ones as silent
+        weakest, weakest_score = None, None
+        for s, since in self.active.items():
+            s_score = self.scores.get(s, 0.0)
+            if now - self._last_voice.get(s, since) > self.hold_time:
+                s_score = float("-inf")
+            if weakest is None or s_score < weakest_score:
+                weakest, weakest_score = s, s_score
+
+        if now - self.active[weakest] < self.hold_time and weakest_score != float("-inf"):
+            return False
+        if score > weakest_score + self.hysteresis_db:
+            del self.active[weakest]
+            self.active[sender] = now
+            return True
+        return False
+
+    def remove(self, sender):
+        self.scores.pop(sender, None)
+        self.active.pop(sender, None)
+        self._last_voice.pop(sender, None)
@@ -0,0 +1,60 @@
+VOICE = 0 # Send the frame
+SILENT = 1 # Drop the frame
+COMFORT_NOISE = 2 # Drop the frame but send a comfort-noise marker instead
+
+class VoiceActivityDetector:
+    """
+    Energy VAD driving discontinuous transmission (DTX).
+
+    Works on the RFC 6464 level we already compute per frame (0 loudest ..
+    127 silence), so it costs a few float operations per block. A frame is
+    speech when it is `margin_db` louder than a running noise-floor estimate;
+    after speech ends, `hangover_ms` more frames still go out so word endings
+    aren't clipped. During silence one comfort-noise marker (carrying the
+    noise level) goes out immediately and then every `cn_interval_ms`, which
+    doubles as a keepalive so the server and receivers know we're still here.
+    """
+    def __init__(self, frame_ms, margin_db=9.0, hangover_ms=300, cn_interval_ms=400, max_level=70):
+        self.margin_db = margin_db
+        self.max_level = max_level # Anything quieter than -max_level dBov is never speech
+        self.hangover_frames = max(1, round(hangover_ms / frame_ms))
+        self.cn_frames = max(1, round(cn_interval_ms / frame_ms))
+
+        self.noise_level = None # Background level estimate in -dBov, seeded by the first frame
+        self._hangover = 0
+        self._since_cn = None # Frames since the last comfort-noise marker, None while talking
+
+    def process(self, level):
+        """Classifies one frame's level; returns VOICE, SILENT or COMFORT_NOISE."""
+        if self.noise_level is None:
+            self.noise_level = float(max(level, self.max_level - self.margin_db))
+        speech = level < self.max_level and level <= self.noise_level - self.margin_db
+
+        # Follow the noise floor quickly towards quieter frames, slowly towards louder
+        # background, and barely at all during speech (a real step in background noise
+        # still wins after ~10 s)
+        if level > self.noise_level:
+            rate = 0.5
+        elif not speech:
+            rate = 0.05
+        else:
+            rate = 0.01
+        self.noise_level += rate * (level - self.noise_level)
+
+        if speech:
+            self._hangover = self.hangover_frames
+            self._since_cn = None
+            return VOICE
+        if self._hangover > 0:
+            self._hangover -= 1
+            return VOICE
+
+        if self._since_cn is None or self._since_cn >= self.cn_frames:
+            self._since_cn = 1
+            return COMFORT_NOISE
+        self._since_cn += 1
+        return SILENT
+
+    @property
+    def comfort_noise_level(self):
+        return int(min(127, max(0, round(self.noise_level))))
@@ -0,0 +1,146 @@
+"""
+Real-time budget of the audio hot paths, driven with synthetic NumPy
+buffers (no sound device needed):
+
+  handler   AudioHandler._audio_callback: N speakers' jitter buffers mixed
+            into one device block (budget: one block)
+  engine    AudioEngine._audio_callback (P2P): N peer queues (one block)
+  codec     per-frame encode and decode on the sender / network thread
+            (one frame)
+  mcu       ServerMixer.mix(): packets of other durations padded, split or
+            trimmed into one tick, N-minus-one mixes encoded (one tick)
+
+Every case must stay under BUDGET_FRACTION of its budget at p99; the exit
+status is non-zero otherwise. tests/test_audio_budget.py runs the quick
+matrix on every test run, timed in thread CPU time rather than wall-clock
+time so a busy machine doesn't fail it.
+
+    python benchmarks/bench_audio.py
+"""
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core import audio_codecs
+from app.core.audio import AudioEngine
+from app.core.audio_handler import AudioHandler
+from app.core.mcu import ServerMixer
+
+RATE = 16000
+BUDGET_FRACTION = 0.25 # p99 must leave three quarters of the budget to everything else
+
+def speech(n, rate=RATE, seed=0):
+    t = np.arange(n) / rate
+    rng = np.random.default_rng(seed)
+    signal = 6000 * np.sin(2 * np.pi * (180 + 20 * seed) * t) + rng.normal(0, 300, n)
+    return signal.astype(np.int16)
+
+def timed(fn, prepare, iterations, clock=time.perf_counter):
+    """Seconds per call of fn() by `clock`, with prepare() run untimed before each call."""
+    samples = np.empty(iterations)
+    for i in range(iterations):
+        prepare()
+        start = clock()
+        fn()
+        samples[i] = clock() - start
+    return samples
+
+def handler_callback(speakers, frame_ms, block_ms=None, iterations=300, clock=time.perf_counter):
+    block = RATE * block_ms // 1000 if block_ms else None
+    h = AudioHandler(RATE, frame_ms=frame_ms, block_size=block, dtx=False)
+    frames = [speech(h.frame_size, seed=i).reshape(-1, 1) for i in range(speakers)]
+    seqs = [0] * speakers
+    for i in range(speakers):
+        h.add_user(f"s{i}")
+    indata, outdata = speech(h.block_size).tobytes(), bytearray(2 * h.block_size)
+
+    def prepare():
+        # Keep every jitter buffer just above its target, as steady arrivals would
+        for i, jb in enumerate(h.jitter_buffers.values()):
+            while jb.depth <= jb.target_frames:
+                jb.put(seqs[i] & 0xFFFF, seqs[i] * frame_ms, frames[i], seqs[i] * frame_ms)
+                seqs[i] += 1
+
+    samples = timed(lambda: h._audio_callback(indata, outdata, h.block_size, None, None), prepare, iterations, clock)
+    return samples, h.block_size / RATE
+
+def engine_callback(speakers, chunk, rate=44100, iterations=300, clock=time.perf_counter):
+    e = AudioEngine(rate, chunk_size=chunk)
+    chunks = [speech(chunk, rate, seed=i).tobytes() for i in range(speakers)]
+    for i in range(speakers):
+        e.add_peer_stream(i)
+    indata, outdata = speech(chunk, rate).tobytes(), bytearray(2 * chunk)
+
+    def prepare():
+        for i, q in e.output_queues.items():
+            if q.empty():
+                q.put(chunks[i])
+
+    samples = timed(lambda: e._audio_callback(indata, outdata, chunk, None, None), prepare, iterations, clock)
+    return samples, chunk / rate
+
+def codec_frame(name, frame_ms, iterations=300, clock=time.perf_counter):
+    frame = speech(RATE * frame_ms // 1000)
+    encoder = audio_codecs.create(name)
+    decoder = audio_codecs.get(encoder.ID)
+    samples = timed(lambda: decoder.decode(encoder.encode(frame)), lambda: None, iterations, clock)
+    return samples, frame_ms / 1000
+
+def mcu_tick(speakers, packet_ms, recipients=30, iterations=200, clock=time.perf_counter):
+    mixer = ServerMixer(RATE, frame_size=RATE * 20 // 1000)
+    packets = [audio_codecs.create("zlib").encode(speech(RATE * packet_ms // 1000, seed=i)) for i in range(speakers)]
+    addrs = [("10.0.0.1", 1000 + i) for i in range(recipients)]
+
+    def prepare():
+        # Top every speaker up to at least one tick of audio, in packets of packet_ms
+        for i in range(speakers):
+            while mixer._queued.get(addrs[i], 0) < mixer.frame_size:
+                mixer.push(addrs[i], packets[i])
+
+    samples = timed(lambda: mixer.mix(addrs), prepare, iterations, clock)
+    return samples, mixer.interval
+
+def cases(quick=False):
+    """(name, function, kwargs) for the full matrix, or a smaller one for the test suite."""
+    speakers = (1, 4) if quick else (1, 4, 16)
+    out = []
+    for n in speakers:
+        for frame_ms in ((20,) if quick else (10, 20, 60)):
+            out.append((f"handler {n} spk {frame_ms} ms", handler_callback, {"speakers": n, "frame_ms": frame_ms}))
+        out.append((f"handler {n} spk 60 ms pkts, 10 ms blocks", handler_callback,
+                    {"speakers": n, "frame_ms": 60, "block_ms": 10}))
+        for chunk in ((1024,) if quick else (441, 1024)):
+            out.append((f"engine {n} peers {chunk} @44.1k", engine_callback, {"speakers": n, "chunk": chunk}))
+        for packet_ms in ((10, 60) if quick else (10, 20, 60)):
+            out.append((f"mcu {n} spk {packet_ms} ms pkts", mcu_tick, {"speakers": n, "packet_ms": packet_ms}))
+    for name in (("zlib", "adpcm") if quick else audio_codecs.BY_NAME):
+        out.append((f"codec {name} 20 ms", codec_frame, {"name": name, "frame_ms": 20}))
+    return out
+
+def run_all(quick=False, clock=time.perf_counter):
+    """Yields one result dict per case: name, median/p99/max and budget in seconds (as measured by `clock`)."""
+    for name, fn, kwargs in cases(quick):
+        if quick:
+            kwargs = dict(kwargs, iterations=100)
+        samples, budget = fn(clock=clock, **kwargs)
+        yield {"name": name, "median": float(np.median(samples)), "p99": float(np.percentile(samples, 99)),
+               "max": float(samples.max()), "budget": budget}
+
+def main():
+    print(f"{'case':<40}{'median us':>10}{'p99 us':>9}{'max us':>9}{'budget ms':>10}{'p99 %':>7}")
+    failed = []
+    for r in run_all(quick="--quick" in sys.argv):
+        share = r["p99"] / r["budget"] * 100
+        print(f"{r['name']:<40}{r['median'] * 1e6:>10.1f}{r['p99'] * 1e6:>9.1f}{r['max'] * 1e6:>9.1f}"
+              f"{r['budget'] * 1e3:>10.1f}{share:>6.1f}%")
+        if r["p99"] > BUDGET_FRACTION * r["budget"]:
+            failed.append(r["name"])
+    if failed:
+        print(f"Over {BUDGET_FRACTION:.0%} of the real-time budget: {', '.join(failed)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
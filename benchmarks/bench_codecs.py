@@ -0,0 +1,60 @@
+"""
+Encode/decode cost, bitrate and quality of each audio codec on a speech-like
+signal (20 ms frames at 16 kHz, the client default).
+
+    python benchmarks/bench_codecs.py
+"""
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core import audio_codecs
+
+RATE = 16000
+FRAME = 320
+
+def speech_like(seconds=2):
+    # Harmonic "voice" with a wobbling pitch and syllable envelope, plus room noise
+    rng = np.random.default_rng(0)
+    t = np.arange(int(seconds * RATE)) / RATE
+    pitch = 140 + 30 * np.sin(2 * np.pi * 0.7 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / RATE
+    voice = sum(np.sin(k * phase) / k for k in range(1, 12))
+    envelope = np.clip(np.sin(2 * np.pi * 3 * t), 0, None) ** 0.5
+    signal = 6000 * voice * envelope + rng.normal(0, 200, t.size)
+    return np.clip(signal, -32768, 32767).astype(np.int16)
+
+def run(name, frames):
+    encoder = audio_codecs.create(name)
+    decoder = audio_codecs.get(encoder.ID)
+
+    start = time.perf_counter()
+    packets = [encoder.encode(f) for f in frames]
+    encode = (time.perf_counter() - start) / len(frames)
+
+    start = time.perf_counter()
+    decoded = [decoder.decode(p) for p in packets]
+    decode = (time.perf_counter() - start) / len(frames)
+
+    original = np.concatenate(frames).astype(np.float64)
+    error = original - np.concatenate(decoded)
+    snr = 10 * np.log10(np.dot(original, original) / max(np.dot(error, error), 1e-9))
+    bytes_per_s = sum(len(p) for p in packets) / (len(frames) * FRAME / RATE)
+    return encode, decode, bytes_per_s, snr
+
+def main():
+    signal = speech_like()
+    frames = [signal[i:i + FRAME] for i in range(0, len(signal) - FRAME + 1, FRAME)]
+    budget = FRAME / RATE
+    print(f"{'codec':>6}{'enc us':>9}{'dec us':>9}{'% core':>8}{'kbit/s':>8}{'SNR dB':>8}")
+    for name in audio_codecs.BY_NAME:
+        encode, decode, bytes_per_s, snr = run(name, frames)
+        load = (encode + decode) / budget * 100
+        snr = "inf" if snr > 200 else f"{snr:.1f}"
+        print(f"{name:>6}{encode * 1e6:>9.1f}{decode * 1e6:>9.1f}{load:>7.2f}%{bytes_per_s * 8 / 1000:>8.1f}{snr:>8}")
+
+if __name__ == "__main__":
+    main()
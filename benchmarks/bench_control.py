@@ -0,0 +1,42 @@
+"""
+Per-message encode/parse cost of the binary control protocol vs. the JSON
+commands it replaces.
+
+    python benchmarks/bench_control.py
+"""
+import json
+import os
+import sys
+import timeit
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core import control
+
+def _json_encode(cmd, args):
+    return bytes([0]) + json.dumps({"cmd": cmd, "args": args}).encode()
+
+def _json_decode(payload):
+    msg = json.loads(payload.decode())
+    return msg.get("cmd"), msg.get("args")
+
+CASES = [
+    ("PING", None),
+    ("LEAVE", "User_1234"),
+    ("PARTICIPANTS", [f"User_{1000 + i}" for i in range(30)]),
+]
+
+def main():
+    n = 100000
+    print(f"{'message':<16}{'path':<8}{'bytes':>6}{'encode us':>11}{'parse us':>10}")
+    for cmd, args in CASES:
+        for label, enc, dec in (("json", _json_encode, _json_decode),
+                                ("binary", control.encode, control.decode)):
+            data = enc(cmd, args)
+            payload = data[1:]
+            t_enc = timeit.timeit(lambda: enc(cmd, args), number=n) / n * 1e6
+            t_dec = timeit.timeit(lambda: dec(payload), number=n) / n * 1e6
+            print(f"{cmd:<16}{label:<8}{len(data):>6}{t_enc:>11.2f}{t_dec:>10.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""
+Fan-out micro-benchmark: one relay datagram to N recipients, sendmmsg batch
+vs. a per-recipient sendto loop.
+
+    python benchmarks/bench_fanout.py --clients 30
+"""
+import argparse
+import os
+import socket
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.fanout import FanOut
+
+def run(n_clients, iterations, batched):
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sinks = []
+    for _ in range(n_clients):
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        s.bind(("127.0.0.1", 0))
+        sinks.append(s)
+
+    fanout = FanOut(sender, batched=batched)
+    fanout.update(s.getsockname() for s in sinks)
+    payload = os.urandom(1200)
+    exclude = sinks[0].getsockname()
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fanout.send(payload, exclude=exclude)
+    elapsed = time.perf_counter() - start
+
+    for s in sinks + [sender]:
+        s.close()
+    return fanout.batched, elapsed / iterations * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--clients", type=int, default=30)
+    parser.add_argument("--iterations", type=int, default=5000)
+    args = parser.parse_args()
+
+    for batched in (False, True):
+        used, us = run(args.clients, args.iterations, batched)
+        label = "sendmmsg" if used else "sendto loop"
+        print(f"{label:>12}: {us:8.1f} us per fan-out to {args.clients - 1} recipients")
+
+if __name__ == "__main__":
+    main()
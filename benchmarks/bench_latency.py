@@ -0,0 +1,116 @@
+"""
+Mouth-to-ear latency per packet duration, measured end to end through a
+local relay server: two clients run AudioHandlers whose callbacks are
+clocked in real time with a 10 ms device block (no sound card needed).
+Clicks injected into alice's capture are timed until they come out of
+bob's playback. Device buffering is counted as one block each way, the
+same as latency_estimate() assumes without a stream. The estimate budgets
+for bob's current jitter buffer target, which a stream that started playing
+before any jitter was measured will not have grown into, so on loopback it
+reads a little above the measurement.
+
+    python benchmarks/bench_latency.py
+"""
+import os
+import sys
+import threading
+import time
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.audio_handler import AudioHandler
+from app.core.network_engine import NetworkEngine
+
+RATE = 16000
+BLOCK = 160 # 10 ms device callbacks
+CLICK_EVERY = 0.5 # s
+
+def run(frame_ms, seconds=4):
+    server = NetworkEngine(is_server=True)
+    server.start()
+    clients = {}
+    for name in ("alice", "bob"):
+        audio = AudioHandler(RATE, frame_ms=frame_ms, block_size=BLOCK, dtx=False)
+        net = NetworkEngine(is_server=False, username=name, sample_rate=RATE)
+        net.on_audio_received = audio.receive_audio
+        connected = threading.Event()
+        net.on_connected = connected.set
+        net.start("127.0.0.1")
+        assert connected.wait(5)
+        clients[name] = (audio, net)
+
+    running = True
+    sent = {"alice": 0, "bob": 0}
+    clicks = [] # Capture time of each click
+    heard = [] # Playout time of each click
+
+    def sender(name):
+        audio, net = clients[name]
+        while running:
+            frame = audio.read_frame(timeout=0.2)
+            if frame is not None:
+                data, level, flags, timestamp = frame
+                net.send_audio(data, level, flags, timestamp)
+                sent[name] += 1
+
+    def device():
+        # Each tick hands the block captured over the last 10 ms to both handlers and
+        # takes the next 10 ms of playout from them
+        silence = bytes(2 * BLOCK)
+        click = np.zeros(BLOCK, dtype=np.int16)
+        click[:16] = 20000
+        out = bytearray(2 * BLOCK)
+        block_s = BLOCK / RATE
+        next_click = time.perf_counter() + CLICK_EVERY
+        tick = time.perf_counter()
+        while running:
+            tick += block_s
+            time.sleep(max(0, tick - time.perf_counter()))
+            now = time.perf_counter()
+            if now >= next_click:
+                clicks.append(now - block_s) # Start of the block, as spoken
+                next_click += CLICK_EVERY
+                clients["alice"][0]._audio_callback(click.tobytes(), out, BLOCK, None, None)
+            else:
+                clients["alice"][0]._audio_callback(silence, out, BLOCK, None, None)
+            clients["bob"][0]._audio_callback(silence, out, BLOCK, None, None)
+            pcm = np.frombuffer(bytes(out), dtype=np.int16)
+            loud = np.flatnonzero(np.abs(pcm) > 10000)
+            if len(loud) and (not heard or now - heard[-1] > CLICK_EVERY / 2):
+                heard.append(now + block_s + loud[0] / RATE) # Out of the speaker after one block of buffering
+
+    threads = [threading.Thread(target=sender, args=(name,), daemon=True) for name in clients]
+    threads.append(threading.Thread(target=device, daemon=True))
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    running = False
+    for t in threads:
+        t.join(1)
+    elapsed = time.perf_counter() - start
+    estimate = clients["bob"][0].latency_estimate()
+
+    for audio, net in clients.values():
+        net.stop()
+    server.stop()
+
+    # Pair each click with the first one heard after it
+    measured = []
+    for c in clicks:
+        later = [h for h in heard if h > c]
+        if later and later[0] - c < CLICK_EVERY:
+            measured.append(1000 * (later[0] - c))
+    return measured, sent["alice"] / elapsed, estimate
+
+def main():
+    print(f"{'frame ms':>9}{'pkt/s':>7}{'measured ms':>13}{'estimate ms':>13}  stages")
+    for frame_ms in AudioHandler.FRAME_DURATIONS:
+        measured, rate, estimate = run(frame_ms)
+        median = f"{np.median(measured):.1f}" if measured else "n/a"
+        stages = ", ".join(f"{k} {v:g}" for k, v in estimate.items() if k != "total")
+        print(f"{frame_ms:>9}{rate:>7.0f}{median:>13}{estimate['total']:>13.1f}  {stages}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+"""
+Server CPU cost of MCU mode: decode + mix + encode per tick for N clients
+of which S are speaking, reported per mixed client.
+
+    python benchmarks/bench_mcu.py
+"""
+import os
+import sys
+import time
+import zlib
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.mcu import ServerMixer
+
+def run(n_clients, n_speakers, ticks=200):
+    mixer = ServerMixer()
+    rng = np.random.default_rng(0)
+    t = np.arange(mixer.frame_size) / mixer.sample_rate
+    frames = []
+    for i in range(n_speakers):
+        tone = 3000 * np.sin(2 * np.pi * (200 + 40 * i) * t) + rng.normal(0, 300, t.size)
+        frames.append(zlib.compress(tone.astype(np.int16).tobytes()))
+    clients = [("10.0.0.1", 1000 + i) for i in range(n_clients)]
+
+    start = time.perf_counter()
+    for _ in range(ticks):
+        for i in range(n_speakers):
+            mixer.push(clients[i], frames[i])
+        mixer.mix(clients)
+    per_tick = (time.perf_counter() - start) / ticks
+    return per_tick, per_tick / n_clients, per_tick / mixer.interval
+
+def main():
+    print(f"{'clients':>8}{'speakers':>9}{'ms/tick':>9}{'us/client':>11}{'% of 1 core':>13}")
+    for n_clients, n_speakers in [(10, 2), (30, 3), (30, 10), (100, 5), (300, 5), (300, 30)]:
+        per_tick, per_client, load = run(n_clients, n_speakers)
+        print(f"{n_clients:>8}{n_speakers:>9}{per_tick * 1e3:>9.2f}{per_client * 1e6:>11.1f}{load * 100:>12.1f}%")
+
+if __name__ == "__main__":
+    main()
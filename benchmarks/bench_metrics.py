@@ -0,0 +1,65 @@
+"""
+Cost of the relay metrics on the hot path: time to handle one audio
+datagram (parse, relay to N-1 clients over loopback) with the counters and
+the relay-time histogram switched on vs off, plus the cost of one scrape.
+Rounds alternate between the two servers and the best of each is kept, so
+machine noise doesn't land on one side only.
+
+    python benchmarks/bench_metrics.py
+"""
+import os
+import socket
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core import audio_packet
+from app.core.network_engine import NetworkEngine
+
+AUDIO_BYTES = 200 # About one 20 ms ADPCM frame
+
+def timed(server, stream, sender, packets):
+    start = time.perf_counter()
+    for i in range(packets):
+        server._dispatch(stream[i % len(stream)], sender)
+    return (time.perf_counter() - start) / packets
+
+def run(n_clients, packets=10000, rounds=9):
+    sinks = []
+    for i in range(n_clients):
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        s.bind(("127.0.0.1", 0))
+        sinks.append(s)
+    servers = {}
+    for metrics in (False, True):
+        server = servers[metrics] = NetworkEngine(is_server=True, metrics=metrics)
+        for i, s in enumerate(sinks):
+            server._add_client(s.getsockname(), f"bench_{i}", ctl=4)
+    sender = sinks[0].getsockname()
+    stream = [audio_packet.encode_v3(0, 0, 30, 0, 16000, seq, seq * 20, bytes(AUDIO_BYTES)) for seq in range(1000)]
+
+    best = {False: None, True: None}
+    for _ in range(rounds):
+        for metrics, server in servers.items():
+            elapsed = timed(server, stream, sender, packets)
+            best[metrics] = elapsed if best[metrics] is None else min(best[metrics], elapsed)
+
+    start = time.perf_counter()
+    for _ in range(100):
+        servers[True].metrics_text()
+    scrape = (time.perf_counter() - start) / 100
+    for server in servers.values():
+        server.sock.close()
+    for s in sinks:
+        s.close()
+    return best[False], best[True], scrape
+
+def main():
+    print(f"{'clients':>8}{'off us/pkt':>12}{'on us/pkt':>11}{'overhead':>10}{'scrape ms':>11}")
+    for n_clients in (2, 10, 30):
+        off, on, scrape = run(n_clients)
+        print(f"{n_clients:>8}{off * 1e6:>12.2f}{on * 1e6:>11.2f}{(on / off - 1) * 100:>9.1f}%{scrape * 1e3:>11.2f}")
+
+if __name__ == "__main__":
+    main()
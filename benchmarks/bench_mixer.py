@@ -0,0 +1,71 @@
+"""
+Client playback mixing cost per audio callback against the number of
+simultaneous speakers: the old per-callback np.zeros / vstack / np.add // 2
+path versus the preallocated Mixer, as a share of the block's real-time
+budget (1024 samples at 16 kHz = 64 ms).
+
+    python benchmarks/bench_mixer.py
+"""
+import os
+import sys
+import time
+import tracemalloc
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.mixer import Mixer
+
+BLOCK = 1024
+RATE = 16000
+
+def legacy(frames_in, out):
+    mixed_audio = np.zeros((BLOCK, 1), dtype='int16')
+    for peer_audio in frames_in:
+        if peer_audio.shape[0] != BLOCK:
+            if peer_audio.shape[0] > BLOCK:
+                peer_audio = peer_audio[:BLOCK]
+            else:
+                pad = np.zeros((BLOCK - peer_audio.shape[0], 1), dtype='int16')
+                peer_audio = np.vstack((peer_audio, pad))
+        mixed_audio = np.add(mixed_audio, peer_audio // 2)
+    out[:] = np.frombuffer(mixed_audio.tobytes(), dtype='int16').reshape(-1, 1)
+
+def preallocated(mixer, frames_in, out):
+    mixer.clear(BLOCK)
+    for peer_audio in frames_in:
+        mixer.add(peer_audio)
+    mixer.mix_into(out)
+
+def timed(fn, *args, reps=5000):
+    start = time.perf_counter()
+    for _ in range(reps):
+        fn(*args)
+    return (time.perf_counter() - start) / reps
+
+def allocated(fn, *args):
+    """Peak bytes of new memory one call needs (NumPy buffers included)."""
+    fn(*args)
+    tracemalloc.start()
+    fn(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+def main():
+    rng = np.random.default_rng(0)
+    budget = BLOCK / RATE
+    mixer = Mixer(BLOCK)
+    out = np.zeros((BLOCK, 1), dtype=np.int16)
+    print(f"{'speakers':>9}{'legacy us':>11}{'mixer us':>10}{'% budget':>10}{'legacy B':>10}{'mixer B':>9}")
+    for speakers in [1, 2, 4, 8, 16, 32]:
+        # Every third stream arrives one packet short, as when a sender's block size differs
+        frames_in = [rng.normal(0, 4000, (BLOCK - (i % 3 == 2) * 64, 1)).astype(np.int16) for i in range(speakers)]
+        old = timed(legacy, frames_in, out)
+        new = timed(preallocated, mixer, frames_in, out)
+        old_bytes = allocated(legacy, frames_in, out)
+        new_bytes = allocated(preallocated, mixer, frames_in, out)
+        print(f"{speakers:>9}{old * 1e6:>11.1f}{new * 1e6:>10.1f}{new / budget * 100:>9.2f}%{old_bytes:>10}{new_bytes:>9}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Relay throughput benchmark: threaded NetworkEngine vs ShardedRelayServer.
+
+Spawns the server in its own process, joins N fake clients over loopback,
+blasts audio-sized packets from N-1 of them and counts how many relayed
+packets the remaining client receives.
+
+At 30 clients the sendmmsg(2) fan-out is ~95% of a relayed frame's cost,
+so a single process is kernel-bound; sharded mode is the one that scales,
+with cores.
+
+    python benchmarks/bench_relay.py --clients 30 --seconds 5
+    python benchmarks/bench_relay.py --mode sharded --workers 4
+"""
+import argparse
+import json
+import multiprocessing as mp
+import os
+import socket
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.network_engine import NetworkEngine
+from app.core.sharded_relay import ShardedRelayServer
+
+AUDIO_BYTES = 1200 # Roughly one zlib-compressed 1024-sample block
+
+def _run_server(mode, workers, stop_event):
+    if mode == "sharded":
+        server = ShardedRelayServer(workers=workers)
+    else:
+        server = NetworkEngine(is_server=True)
+    server.start()
+    stop_event.wait()
+    server.stop()
+
+def _run_listener(sock, seconds, result_queue):
+    sock.settimeout(0.5)
+    count = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        try:
+            sock.recvfrom(NetworkEngine.BUFFER_SIZE)
+            count += 1
+        except socket.timeout:
+            pass
+    result_queue.put(count)
+
+def _join(sock, name, server_addr):
+    msg = json.dumps({"cmd": "JOIN", "args": name}).encode()
+    sock.sendto(bytes([0]) + msg, server_addr)
+
+def run(mode, n_clients, seconds, workers=1):
+    server_addr = ("127.0.0.1", NetworkEngine.PORT)
+    stop_event = mp.Event()
+    server = mp.Process(target=_run_server, args=(mode, workers, stop_event))
+    server.start()
+    time.sleep(1.0)
+
+    socks = []
+    for i in range(n_clients):
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+        s.bind(("127.0.0.1", 0))
+        _join(s, f"bench_{i}", server_addr)
+        socks.append(s)
+    time.sleep(0.5)
+
+    # Throw away join acks / participant lists so the listener only counts audio
+    listener = socks[0]
+    listener.setblocking(False)
+    try:
+        while True:
+            listener.recvfrom(NetworkEngine.BUFFER_SIZE)
+    except BlockingIOError:
+        pass
+    listener.setblocking(True)
+
+    results = mp.Queue()
+    lp = mp.Process(target=_run_listener, args=(listener, seconds, results), daemon=True)
+    lp.start()
+
+    packet = bytes([1]) + b'SPK!' + bytes([0]) + os.urandom(AUDIO_BYTES)
+    speakers = socks[1:]
+    sent = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        for s in speakers:
+            s.sendto(packet, server_addr)
+        sent += len(speakers)
+
+    received = results.get()
+    lp.join()
+    stop_event.set()
+    server.join(timeout=3)
+    for s in socks:
+        s.close()
+
+    return {
+        "mode": mode,
+        "clients": n_clients,
+        "sent_pps": sent / seconds,
+        "relayed_pps": received / seconds,
+        "fanout_pps": received * (n_clients - 1) / seconds,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--clients", type=int, default=30)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--mode", choices=["threaded", "sharded", "all"], default="all")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="worker processes for sharded mode")
+    args = parser.parse_args()
+
+    modes = ["threaded", "sharded"] if args.mode == "all" else [args.mode]
+    for mode in modes:
+        r = run(mode, args.clients, args.seconds, args.workers)
+        print(f"{r['mode']:>9}: {r['relayed_pps']:8.0f} packets/s relayed "
+              f"({r['fanout_pps']:9.0f} datagrams/s out, {r['sent_pps']:8.0f} offered)")
+        time.sleep(1.0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+"""
+Synthetic load generator: N headless NetworkEngine clients spread over
+several processes join a relay, S of them send audio-sized packets at the
+frame rate, and everyone records what arrives. Reports relay throughput,
+relay latency percentiles (send to receive, same-host monotonic clock),
+loss, and CPU of the server and the client processes, and writes it all
+to a JSON file for tracking regressions.
+
+The relay is started in its own process unless --server points at one
+that is already running (its CPU is not reported then). With --servers N,
+N federated relays run on consecutive ports, each peered with all the
+others, and clients are spread over them round-robin: every client still
+hears every speaker, through at most two relays, and the report adds up
+all their CPU.
+
+    python benchmarks/loadgen.py --clients 30 --speakers 5 --seconds 10
+    python benchmarks/loadgen.py --clients 300 --procs 4 --mode sharded --workers 4 --out load.json
+    python benchmarks/loadgen.py --clients 300 --procs 4 --servers 3 --out federated.json
+    python benchmarks/loadgen.py --server 10.0.0.5 --clients 50
+"""
+import argparse
+import json
+import multiprocessing as mp
+import os
+import platform
+import struct
+import sys
+import time
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.network_engine import NetworkEngine
+from app.core.sharded_relay import ShardedRelayServer
+
+_STAMP = struct.Struct("!d") # Send time, at the start of every payload
+LATENCY_SAMPLES = 20000 # Per client process, so the result queue stays small
+
+def _quiet(verbose):
+    if not verbose:
+        sys.stdout = open(os.devnull, "w")
+
+def _run_server(mode, workers, port, peers, clients, ready, go, stop, results, verbose):
+    _quiet(verbose)
+    if mode == "sharded":
+        server = ShardedRelayServer(workers=workers, port=port, max_clients=clients)
+    else:
+        server = NetworkEngine(is_server=True, port=port, peers=peers)
+    server.start()
+    ready.set()
+    go.wait()
+    cpu, wall = time.process_time(), time.perf_counter()
+    stop.wait()
+    cpu, wall = time.process_time() - cpu, time.perf_counter() - wall
+    metrics = getattr(server, "metrics", None)
+    counters = None
+    if metrics:
+        counters = {"packets_in": sum(metrics.packets_in), "packets_out": metrics.packets_out,
+                    "send_errors": metrics.send_errors}
+    server.stop()
+    if mode == "sharded":
+        # Worker CPU only shows up once they have exited, and then covers their whole life
+        children = os.times()
+        cpu = children.children_user + children.children_system
+    results.put({"port": port, "cpu_s": cpu, "wall_s": wall, "counters": counters})
+
+def _run_clients(index, names, speakers, args, ready, go, results):
+    _quiet(args.verbose)
+    clients = []
+    latencies = [] # One list per client: only its receive thread appends to it
+    for name, port in names:
+        client = NetworkEngine(is_server=False, username=name, codec=args.codec, port=port)
+        received = []
+        latencies.append(received)
+        # Bound default args: each client gets its own list
+        def on_audio(username, data, seq, timestamp, codec, rate, received=received):
+            now = time.monotonic()
+            if len(data) >= _STAMP.size:
+                received.append(now - _STAMP.unpack_from(data)[0])
+        client.on_audio_received = on_audio
+        client.start(args.server or "127.0.0.1")
+        clients.append(client)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline and not all(c.ctl_version and len(c.roster) >= args.clients for c in clients):
+        time.sleep(0.1)
+    ready.put((index, sum(1 for c in clients if c.ctl_version)))
+    go.wait()
+
+    # One thread paces every speaker in this process
+    talking = [c for c in clients if c.username in speakers]
+    filler = os.urandom(max(0, args.packet_bytes - _STAMP.size))
+    interval = args.frame_ms / 1000
+    sent = 0
+    cpu = time.process_time()
+    next_tick = time.perf_counter()
+    end = next_tick + args.seconds
+    media_ms = 0
+    while next_tick < end:
+        for c in talking:
+            c.send_audio(_STAMP.pack(time.monotonic()) + filler, level=30, timestamp=media_ms)
+        sent += len(talking)
+        media_ms += args.frame_ms
+        next_tick += interval
+        delay = next_tick - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+    time.sleep(args.drain) # Let the last packets land
+    cpu = time.process_time() - cpu
+    for c in clients:
+        c.stop()
+
+    all_latencies = np.array([x for lst in latencies for x in lst], dtype=np.float64)
+    if len(all_latencies) > LATENCY_SAMPLES:
+        all_latencies = np.random.default_rng(index).choice(all_latencies, LATENCY_SAMPLES, replace=False)
+    results.put({"index": index, "sent": sent, "received": int(sum(len(lst) for lst in latencies)),
+                 "latencies": all_latencies.tolist(), "cpu_s": cpu})
+
+def run(clients=30, speakers=5, seconds=10.0, procs=None, frame_ms=20, packet_bytes=164, codec="adpcm",
+        mode="threaded", workers=2, server=None, drain=1.0, verbose=False, servers=1):
+    """Runs one load test and returns the results dict (see main() for the options)."""
+    if servers > 1 and (mode == "sharded" or server):
+        raise ValueError("Federated relays are started here, one process each: no sharded or external mode")
+    args = argparse.Namespace(clients=clients, speakers=min(speakers, clients), seconds=seconds, frame_ms=frame_ms,
+                              packet_bytes=max(packet_bytes, _STAMP.size), codec=codec, server=server, drain=drain,
+                              verbose=verbose)
+    procs = max(1, min(procs or min(4, os.cpu_count() or 1), clients))
+    ports = [NetworkEngine.PORT + i for i in range(servers)]
+    names = [(f"load_{i}", ports[i % servers]) for i in range(clients)]
+    speaking = set(name for name, _ in names[:args.speakers])
+
+    go, stop = mp.Event(), mp.Event()
+    server_results = mp.Queue()
+    server_procs = []
+    if server is None:
+        for port in ports:
+            server_ready = mp.Event()
+            peers = [("127.0.0.1", p) for p in ports if p != port]
+            proc = mp.Process(target=_run_server, args=(mode, workers, port, peers, clients, server_ready, go, stop,
+                                                        server_results, verbose))
+            proc.start()
+            server_procs.append(proc)
+            if not server_ready.wait(10):
+                raise RuntimeError("Relay failed to start")
+
+    ready, results = mp.Queue(), mp.Queue()
+    workers_procs = []
+    for i in range(procs):
+        # Round-robin so speakers are spread over the processes
+        p = mp.Process(target=_run_clients, args=(i, names[i::procs], speaking, args, ready, go, results))
+        p.start()
+        workers_procs.append(p)
+    joined = sum(ready.get(timeout=60)[1] for _ in workers_procs)
+
+    go.set()
+    started = time.perf_counter()
+    outcomes = [results.get(timeout=seconds + drain + 60) for _ in workers_procs]
+    elapsed = time.perf_counter() - started
+    stop.set()
+    server_outcomes = sorted((server_results.get(timeout=30) for _ in server_procs), key=lambda o: o["port"])
+    for p in workers_procs + server_procs:
+        p.join(timeout=10)
+
+    sent = sum(o["sent"] for o in outcomes)
+    received = sum(o["received"] for o in outcomes)
+    expected = sent * (joined - 1) # Every joined client but the speaker hears each packet
+    latencies = np.array([x for o in outcomes for x in o["latencies"]]) * 1000
+    percentiles = {}
+    if len(latencies):
+        for p in (50, 90, 99, 99.9):
+            percentiles[f"p{p:g}"] = round(float(np.percentile(latencies, p)), 3)
+        percentiles["max"] = round(float(latencies.max()), 3)
+
+    result = {
+        "config": {"clients": clients, "joined": joined, "speakers": args.speakers, "seconds": seconds,
+                   "procs": procs, "frame_ms": frame_ms, "packet_bytes": args.packet_bytes, "codec": codec,
+                   "mode": mode if server is None else "external", "workers": workers if mode == "sharded" else 1,
+                   "servers": servers},
+        "sent": sent,
+        "received": received,
+        "expected": expected,
+        "loss": round(1 - received / expected, 6) if expected else None,
+        "offered_pps": round(sent / seconds, 1),
+        "relayed_pps": round(received / seconds, 1),
+        "latency_ms": percentiles,
+        "client_cpu_percent": round(100 * sum(o["cpu_s"] for o in outcomes) / elapsed, 1),
+        "server": None,
+        "servers": [],
+        "host": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+    for outcome in server_outcomes:
+        result["servers"].append({"port": outcome["port"],
+                                  "cpu_percent": round(100 * outcome["cpu_s"] / outcome["wall_s"], 1),
+                                  "counters": outcome["counters"]})
+    if result["servers"]:
+        # All relays together; the counters include what they forward to each other
+        counters = [s["counters"] for s in result["servers"]]
+        result["server"] = {"cpu_percent": round(sum(s["cpu_percent"] for s in result["servers"]), 1),
+                            "counters": None if None in counters else
+                            {k: sum(c[k] for c in counters) for k in counters[0]}}
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="SpeekChat relay load generator")
+    parser.add_argument("--clients", type=int, default=30)
+    parser.add_argument("--speakers", type=int, default=5, help="clients sending audio (the rest only listen)")
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--procs", type=int, default=None, help="client processes (default: up to 4, one per CPU)")
+    parser.add_argument("--frame-ms", type=int, default=20)
+    parser.add_argument("--packet-bytes", type=int, default=164, help="audio payload size (164 = 20 ms of ADPCM)")
+    parser.add_argument("--codec", default="adpcm", help="codec the clients ask for at JOIN")
+    parser.add_argument("--mode", choices=["threaded", "sharded"], default="threaded")
+    parser.add_argument("--workers", type=int, default=2, help="worker processes for sharded mode")
+    parser.add_argument("--servers", type=int, default=1, help="federated relays on consecutive ports (not sharded)")
+    parser.add_argument("--server", default=None, help="use a relay already running on this host")
+    parser.add_argument("--out", default="loadgen.json", help="where to write the JSON results")
+    parser.add_argument("--verbose", action="store_true", help="keep the engines' console output")
+    args = parser.parse_args()
+
+    result = run(args.clients, args.speakers, args.seconds, args.procs, args.frame_ms, args.packet_bytes,
+                 args.codec, args.mode, args.workers, args.server, verbose=args.verbose, servers=args.servers)
+    with open(args.out, "w") as f:
+        json.dump(result, f, indent=2)
+
+    lat = result["latency_ms"]
+    server = result["server"]
+    print(f"{result['config']['joined']}/{args.clients} clients joined, {result['config']['speakers']} speaking")
+    print(f"offered {result['offered_pps']:.0f} pkt/s, relayed {result['relayed_pps']:.0f} pkt/s, "
+          f"loss {100 * (result['loss'] or 0):.2f}%")
+    if lat:
+        print(f"latency ms: p50 {lat['p50']}, p90 {lat['p90']}, p99 {lat['p99']}, max {lat['max']}")
+    print(f"CPU: clients {result['client_cpu_percent']}%" + (f", server {server['cpu_percent']}%" if server else ""))
+    if len(result["servers"]) > 1:
+        print("  per relay: " + ", ".join(f"{s['port']} {s['cpu_percent']}%" for s in result["servers"]))
+    print(f"Results written to {args.out}")
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,14 @@
 import customtkinter as ctk
 import threading
-import queue
 from app.core.network_engine import NetworkEngine
 from app.core.audio_handler import AudioHandler
 import sys
 import random
 
 class ClientApp(ctk.CTk):
+    CODEC = "adpcm" # Asked for at JOIN; older servers make us fall back to zlib
+    FEC = 0 # Parity packet every FEC frames (0 = off); receivers buffer our audio that much deeper
+
     def __init__(self):
         super().__init__()
 
@@ -21,6 +23,7 @@ class ClientApp(ctk.CTk):
         self.audio = AudioHandler()
         
         self.is_connected = False
+        self.participant_labels = {}
         
         self.protocol("WM_DELETE_WINDOW", self.on_closing)
         self.setup_login_ui()
@@ -38,9 +41,12 @@ class ClientApp(ctk.CTk):
         self.entry_username.insert(0, self.username)
         self.entry_username.pack(pady=10)
         
-        self.entry_ip = ctk.CTkEntry(self.login_frame, placeholder_text="Server IP (e.g. 127.0.0.1)", width=250)
+        self.entry_ip = ctk.CTkEntry(self.login_frame, placeholder_text="Server IP[:port] (e.g. 127.0.0.1)", width=250)
         self.entry_ip.pack(pady=10)
         
+        self.entry_room = ctk.CTkEntry(self.login_frame, placeholder_text="Room (optional)", width=250)
+        self.entry_room.pack(pady=10)
+        
         self.btn_connect = ctk.CTkButton(self.login_frame, text="Connect", command=self.connect_to_server, width=250)
         self.btn_connect.pack(pady=20)
 
@@ -93,11 +99,18 @@ class ClientApp(ctk.CTk):
         self.btn_connect.configure(text="Connecting...", state="disabled")
         self.entry_ip.configure(state="disabled")
         self.entry_username.configure(state="disabled")
+        self.entry_room.configure(state="disabled")
 
         try:
-            self.network = NetworkEngine(is_server=False, username=self.username)
+            ip, _, port = ip.partition(":")
+            self.network = NetworkEngine(is_server=False, username=self.username, codec=self.CODEC, fec=self.FEC,
+                                         sample_rate=self.audio.sample_rate, room=self.entry_room.get().strip(),
+                                         port=int(port) if port else None)
             self.network.on_audio_received = self.audio.receive_audio
+            self.network.on_comfort_noise = self.audio.receive_comfort_noise
+            self.network.on_fec_stream = self.audio.set_fec_group
             self.network.on_participants_updated = self.update_participant_list
+            self.network.on_participants_delta = self.update_participant_delta
             self.network.on_connected = self.on_connected_confirmed
             self.network.on_error = self.show_error
             
@@ -113,6 +126,7 @@ class ClientApp(ctk.CTk):
     def _on_connected_confirmed_ui(self):
         self.is_connected = True
         self.setup_main_ui()
+        self.audio.set_codec(self.network.codec)
         self.audio.start()
         # Start sending audio loop
         threading.Thread(target=self.send_audio_loop, daemon=True).start()
@@ -120,16 +134,20 @@ class ClientApp(ctk.CTk):
     def send_audio_loop(self):
         while self.is_connected:
             try:
-                data = self.audio.input_queue.get(timeout=1)
+                frame = self.audio.read_frame(timeout=1)
+                if frame is None:
+                    continue
+                data, level, flags, timestamp = frame
                 if self.network:
-                    self.network.send_audio(data)
-            except queue.Empty:
-                continue
+                    self.network.send_audio(data, level, flags, timestamp)
             except Exception as e:
                 print(f"Error in send loop: {e}")
                 break
 
     def update_participant_list(self, participants):
+        for name in list(self.audio.jitter_buffers):
+            if name not in participants:
+                self.audio.remove_user(name) # Gone while we weren't told one by one
         # UI updates must happen on the main thread
         self.after(0, lambda: self._update_participant_list_ui(participants))
 
@@ -137,10 +155,30 @@ class ClientApp(ctk.CTk):
         # Clear frame
         for widget in self.scroll_participants.winfo_children():
             widget.destroy()
+        self.participant_labels = {} # name: [label, ...] (names aren't unique)
             
         for name in participants:
-            lbl = ctk.CTkLabel(self.scroll_participants, text=f"• {name}", font=("Roboto", 14), anchor="w")
-            lbl.pack(fill="x", padx=10, pady=2)
+            self._add_participant_label(name)
+
+    def update_participant_delta(self, op, name):
+        if op == "LEFT" and name not in self.network.participants:
+            self.audio.remove_user(name) # Names aren't unique: only once the last one has left
+        self.after(0, lambda: self._update_participant_delta_ui(op, name))
+
+    def _update_participant_delta_ui(self, op, name):
+        if not hasattr(self, 'scroll_participants') or not self.scroll_participants.winfo_exists():
+            return
+        if op == "JOINED":
+            self._add_participant_label(name)
+        else:
+            labels = self.participant_labels.get(name)
+            if labels:
+                labels.pop().destroy()
+
+    def _add_participant_label(self, name):
+        lbl = ctk.CTkLabel(self.scroll_participants, text=f"• {name}", font=("Roboto", 14), anchor="w")
+        lbl.pack(fill="x", padx=10, pady=2)
+        self.participant_labels.setdefault(name, []).append(lbl)
 
     def toggle_mute(self):
         state = not self.audio.muted
@@ -163,6 +201,7 @@ class ClientApp(ctk.CTk):
             self.btn_connect.configure(text="Connect", state="normal")
             self.entry_ip.configure(state="normal")
             self.entry_username.configure(state="normal")
+            self.entry_room.configure(state="normal")
         
         # We could add a label for errors here
         if not hasattr(self, 'label_error'):
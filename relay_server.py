@@ -0,0 +1,61 @@
+import argparse
+import time
+from app.core.network_engine import NetworkEngine
+from app.core.sharded_relay import ShardedRelayServer
+from app.core.metrics import MetricsServer
+
+def main():
+    parser = argparse.ArgumentParser(description="SpeekChat headless relay server (no GUI)")
+    parser.add_argument("--workers", type=int, default=1, help="relay worker processes sharing the port (SO_REUSEPORT)")
+    parser.add_argument("--mix", action="store_true", help="MCU mode: mix on the server, one stream per client")
+    parser.add_argument("--last-n", type=int, default=None, help="only relay the N loudest speakers of each room")
+    parser.add_argument("--metrics-port", type=int, default=None, help="serve Prometheus-style metrics on 127.0.0.1:PORT")
+    parser.add_argument("--client-timeout", type=float, default=15.0, help="drop clients silent for this many seconds")
+    parser.add_argument("--sweep-interval", type=float, default=1.0, help="seconds between client expiry sweeps")
+    parser.add_argument("--port", type=int, default=NetworkEngine.PORT, help="UDP port to listen on")
+    parser.add_argument("--peer", action="append", default=[], metavar="HOST[:PORT]",
+                        help="another relay sharing our rooms (repeat for each; every relay lists all the others)")
+    args = parser.parse_args()
+    expiry = {"client_timeout": args.client_timeout, "sweep_interval": args.sweep_interval}
+
+    if args.mix and args.workers > 1:
+        parser.error("--mix needs every stream in one process, it can't be combined with --workers")
+    if args.last_n and args.workers > 1:
+        parser.error("--last-n ranks speakers within one process, it can't be combined with --workers")
+    if args.metrics_port and args.workers > 1:
+        parser.error("--metrics-port reports one process's counters, it can't be combined with --workers")
+    if args.peer and (args.workers > 1 or args.mix):
+        parser.error("--peer needs a single-process relay that forwards streams, not --workers or --mix")
+
+    if args.workers > 1:
+        server = ShardedRelayServer(workers=args.workers, port=args.port)
+        server.start()
+    else:
+        server = NetworkEngine(is_server=True, mix=args.mix, last_n=args.last_n, port=args.port, peers=args.peer,
+                               **expiry)
+        server.start()
+
+    mode = f"{args.workers} workers" if args.workers > 1 else "1 process"
+    if args.mix:
+        mode += ", mixing"
+    if args.last_n:
+        mode += f", last-{args.last_n}"
+    if args.peer:
+        mode += f", {len(args.peer)} peer relay(s)"
+    print(f"[Server] Relay listening on port {server.port} ({mode})")
+    metrics = None
+    if args.metrics_port:
+        metrics = MetricsServer(server.metrics_text, port=args.metrics_port)
+        metrics.start()
+    try:
+        while server.is_running:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if metrics:
+            metrics.stop()
+        server.stop()
+
+if __name__ == "__main__":
+    main()
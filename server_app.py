@@ -1,10 +1,13 @@
 import customtkinter as ctk
 import threading
 from app.core.network_engine import NetworkEngine
+from app.core.sharded_relay import ShardedRelayServer
+from app.core.metrics import MetricsServer
+import argparse
 import sys
 
 class ServerApp(ctk.CTk):
-    def __init__(self):
+    def __init__(self, workers=1, mix=False, last_n=None, metrics_port=None, port=None, peers=None):
         super().__init__()
 
         self.title("SpeekChat Server")
@@ -12,7 +15,12 @@ class ServerApp(ctk.CTk):
         ctk.set_appearance_mode("dark")
         ctk.set_default_color_theme("blue")
 
-        self.network = NetworkEngine(is_server=True)
+        # More than one worker shards the relay across processes on the same port
+        if workers > 1:
+            self.network = ShardedRelayServer(workers=workers, port=port)
+        else:
+            self.network = NetworkEngine(is_server=True, mix=mix, last_n=last_n, port=port, peers=peers)
+        self.metrics_server = MetricsServer(self.network.metrics_text, port=metrics_port) if metrics_port else None
         
         self.protocol("WM_DELETE_WINDOW", self.on_closing)
         self.setup_ui()
@@ -34,7 +42,7 @@ class ServerApp(ctk.CTk):
         self.label_public_ip = ctk.CTkLabel(self.info_frame, text="Public IP: Loading...")
         self.label_public_ip.grid(row=1, column=0, padx=10, pady=5)
 
-        self.label_port = ctk.CTkLabel(self.info_frame, text=f"Port: {self.network.PORT}")
+        self.label_port = ctk.CTkLabel(self.info_frame, text=f"Port: {self.network.port}")
         self.label_port.grid(row=2, column=0, padx=10, pady=5)
 
         self.label_sidebar = ctk.CTkLabel(self, text="ACTIVE PARTICIPANTS", font=("Roboto", 12, "bold"), text_color="gray")
@@ -52,6 +60,8 @@ class ServerApp(ctk.CTk):
     def start_server(self):
         try:
             self.network.start()
+            if self.metrics_server:
+                self.metrics_server.start()
             
             # Update IP info in background
             threading.Thread(target=self.update_ips, daemon=True).start()
@@ -71,26 +81,48 @@ class ServerApp(ctk.CTk):
 
     def update_stats(self):
         if self.network.is_running:
-            participants = list(self.network.clients.values())
-            count = len(participants)
+            rooms = self.network.clients_by_room()
+            count = sum(len(names) for names in rooms.values())
             
-            self.label_clients.configure(text=f"Total: {count} / 30")
+            self.label_clients.configure(text=f"Total: {count} / 30 in {len(rooms)} room(s)")
             
-            # Update names list
+            # Update names list, grouped by room (default room first)
             for widget in self.scroll_participants.winfo_children():
                 widget.destroy()
-            for name in participants:
-                lbl = ctk.CTkLabel(self.scroll_participants, text=f"• {name}", font=("Roboto", 12))
-                lbl.pack(fill="x", padx=10, pady=1)
+            for room in sorted(rooms):
+                title = f"# {room}" if room else "# default"
+                lbl = ctk.CTkLabel(self.scroll_participants, text=f"{title} ({len(rooms[room])})",
+                                   font=("Roboto", 12, "bold"), text_color="gray", anchor="w")
+                lbl.pack(fill="x", padx=5, pady=(6, 1))
+                for name in rooms[room]:
+                    lbl = ctk.CTkLabel(self.scroll_participants, text=f"• {name}", font=("Roboto", 12), anchor="w")
+                    lbl.pack(fill="x", padx=15, pady=1)
                 
             self.after(2000, self.update_stats)
 
     def on_closing(self):
+        if self.metrics_server:
+            self.metrics_server.stop()
         self.network.stop()
         self.destroy()
         sys.exit()
 
 if __name__ == "__main__":
-    app = ServerApp()
+    parser = argparse.ArgumentParser(description="SpeekChat voice server")
+    parser.add_argument("--workers", type=int, default=1, help="relay worker processes sharing the port (SO_REUSEPORT)")
+    parser.add_argument("--mix", action="store_true", help="MCU mode: mix on the server, one stream per client")
+    parser.add_argument("--last-n", type=int, default=None, help="only relay the N loudest speakers")
+    parser.add_argument("--metrics-port", type=int, default=None, help="serve Prometheus-style metrics on 127.0.0.1:PORT")
+    parser.add_argument("--port", type=int, default=NetworkEngine.PORT, help="UDP port to listen on")
+    parser.add_argument("--peer", action="append", default=[], metavar="HOST[:PORT]",
+                        help="another relay sharing our rooms (repeat for each; every relay lists all the others)")
+    args = parser.parse_args()
+    if (args.mix or args.last_n or args.metrics_port or args.peer) and args.workers > 1:
+        parser.error("--mix, --last-n, --metrics-port and --peer can't be combined with --workers")
+    if args.mix and args.peer:
+        parser.error("--mix only mixes local clients, it can't be combined with --peer")
+
+    app = ServerApp(workers=args.workers, mix=args.mix, last_n=args.last_n, metrics_port=args.metrics_port,
+                    port=args.port, peers=args.peer)
     app.protocol("WM_DELETE_WINDOW", app.on_closing)
     app.mainloop()
@@ -0,0 +1,27 @@
+"""Shared by the tests that run real clients against a local relay."""
+import sys
+import os
+import threading
+import time
+
+sys.path.append(os.getcwd())
+
+from app.core.network_engine import NetworkEngine
+
+def join(name, room="", port=None):
+    """Starts a client, waits until it is in; the usernames it hears audio from go to `client.heard`."""
+    client = NetworkEngine(is_server=False, username=name, room=room, port=port)
+    connected = threading.Event()
+    client.on_connected = connected.set
+    client.heard = []
+    client.on_audio_received = lambda username, *rest: client.heard.append(username)
+    client.start("127.0.0.1")
+    assert connected.wait(5)
+    return client
+
+def wait_until(condition, timeout=5):
+    """Polls `condition` until it holds or `timeout` runs out; returns its last value."""
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.05)
+    return condition()
@@ -0,0 +1,11 @@
+import sys
+import os
+import time
+
+sys.path.append(os.getcwd())
+from benchmarks.bench_audio import run_all, BUDGET_FRACTION
+
+def test_audio_paths_within_realtime_budget():
+    # CPU time of this thread: what the code costs, whatever else the machine is running
+    for r in run_all(quick=True, clock=time.thread_time):
+        assert r["p99"] < BUDGET_FRACTION * r["budget"], f"{r['name']}: p99 {r['p99'] * 1e3:.2f} ms"
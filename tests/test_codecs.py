@@ -0,0 +1,95 @@
+import json
+import socket
+import threading
+import zlib
+import sys
+import os
+import numpy as np
+
+sys.path.append(os.getcwd())
+from app.core import audio_codecs
+from app.core.network_engine import NetworkEngine
+
+def speech(n=1024):
+    t = np.arange(n) / 16000
+    return (8000 * np.sin(2 * np.pi * 220 * t) + 2000 * np.sin(2 * np.pi * 1330 * t)).astype(np.int16)
+
+def snr(a, b):
+    a = a.astype(np.float64)
+    err = a - b
+    return 10 * np.log10(np.dot(a, a) / max(np.dot(err, err), 1e-9))
+
+def test_codec_roundtrips():
+    frame = speech()
+    for codec_id, min_snr in [(audio_codecs.ZLIB, 150), (audio_codecs.ULAW, 30),
+                              (audio_codecs.ALAW, 30), (audio_codecs.ADPCM, 20)]:
+        encoder = audio_codecs.create(codec_id)
+        data = encoder.encode(frame)
+        assert len(data) * 8 <= len(frame) * max(encoder.BITS_PER_SAMPLE, 8) + 64
+        decoded = audio_codecs.get(codec_id).decode(data)
+        assert decoded.dtype == np.int16 and len(decoded) == len(frame)
+        assert snr(frame, decoded) > min_snr
+
+    # G.711 reference points
+    silence = np.zeros(1, dtype=np.int16)
+    assert audio_codecs.create("ulaw").encode(silence) == b'\xff'
+    assert audio_codecs.create("alaw").encode(silence) == b'\xd5'
+
+    # ADPCM: odd frame lengths, and state carried across frames still decodes per packet
+    encoder = audio_codecs.create("adpcm")
+    first, second = encoder.encode(frame[:333]), encoder.encode(frame[333:])
+    decoder = audio_codecs.get(audio_codecs.ADPCM)
+    joined = np.concatenate((decoder.decode(first), decoder.decode(second)))
+    assert len(joined) == len(frame)
+    assert snr(frame, joined) > 20
+
+def test_mixed_codec_room():
+    server = NetworkEngine(is_server=True)
+    server.start()
+    alice = NetworkEngine(is_server=False, username="alice", codec="adpcm")
+    bob = NetworkEngine(is_server=False, username="bob")
+    legacy = socket.socket(socket.AF_INET, socket.SOCK_DGRAM) # Speaks control v2: zlib only
+    legacy.bind(("127.0.0.1", 0))
+    legacy.settimeout(2)
+    received = []
+    got = threading.Event()
+    try:
+        for client in (alice, bob):
+            connected = threading.Event()
+            client.on_connected = connected.set
+            client.start("127.0.0.1")
+            assert connected.wait(5)
+        assert alice.codec == audio_codecs.ADPCM
+        assert bob.codec == audio_codecs.ZLIB
+        legacy.sendto(bytes([0]) + json.dumps({"cmd": "JOIN", "args": "old", "caps": {"ctl": 2}}).encode(),
+                      ("127.0.0.1", NetworkEngine.PORT))
+
+        def on_audio(name, data, seq, timestamp, codec, rate):
+            received.append((name, data, codec))
+            got.set()
+        bob.on_audio_received = on_audio
+        for _ in range(20):
+            if "alice" in bob.roster.values() and len(server.clients) == 3:
+                break
+            got.wait(0.1)
+
+        frame = speech()
+        encoded = audio_codecs.create("adpcm").encode(frame)
+        alice.send_audio(encoded, level=10)
+
+        # A v3 peer gets alice's ADPCM untouched, tagged with its codec
+        assert got.wait(5)
+        assert received[0] == ("alice", encoded, audio_codecs.ADPCM)
+
+        # The v2 peer gets the same audio transcoded to zlib
+        while True:
+            data, _ = legacy.recvfrom(NetworkEngine.BUFFER_SIZE)
+            if data[:5] == b'\x01SPK2':
+                break
+        pcm = np.frombuffer(zlib.decompress(data[15:]), dtype=np.int16)
+        assert (pcm == audio_codecs.get(audio_codecs.ADPCM).decode(encoded)).all()
+    finally:
+        alice.stop()
+        bob.stop()
+        server.stop()
+        legacy.close()
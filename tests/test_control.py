@@ -0,0 +1,106 @@
+import json
+import socket
+import sys
+import os
+import threading
+
+sys.path.append(os.getcwd())
+
+from app.core import control
+from app.core.network_engine import NetworkEngine
+
+def test_binary_roundtrip():
+    for cmd, args in [("JOIN", "alice"), ("JOIN_ACK", {"ctl": 1}), ("LEAVE", "alice"),
+                      ("PING", None), ("PARTICIPANTS", ["alice", "bøb", ""])]:
+        data = control.encode(cmd, args)
+        assert data[0] == control.PACKET_TYPE
+        assert control.decode(data[1:]) == (cmd, args)
+
+def test_negotiation_keeps_legacy_clients_on_json():
+    server = NetworkEngine(is_server=True)
+    server.start()
+    client = NetworkEngine(is_server=False, username="modern")
+    legacy = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    legacy.bind(("127.0.0.1", 0))
+    legacy.settimeout(2)
+    try:
+        legacy.sendto(bytes([0]) + json.dumps({"cmd": "JOIN", "args": "legacy"}).encode(), ("127.0.0.1", NetworkEngine.PORT))
+        ack, _ = legacy.recvfrom(NetworkEngine.BUFFER_SIZE)
+        assert json.loads(ack[1:]) == {"cmd": "JOIN_ACK", "args": None}
+
+        got_both = threading.Event()
+        client.on_participants_updated = lambda names: sorted(names) == ["legacy", "modern"] and got_both.set()
+        client.start("127.0.0.1")
+        assert got_both.wait(5)
+        assert client.ctl_version == control.VERSION
+
+        # The legacy client still gets the roster as JSON
+        while True:
+            data, _ = legacy.recvfrom(NetworkEngine.BUFFER_SIZE)
+            if data[0] == 0 and sorted(json.loads(data[1:])["args"]) == ["legacy", "modern"]:
+                break
+    finally:
+        client.stop()
+        server.stop()
+        legacy.close()
+
+def test_snapshot_parts_fit_in_datagrams():
+    members = [(i, f"User_{i:04d}" * 4) for i in range(300)]
+    parts = control.snapshot_parts(7, members)
+    assert len(parts) > 1
+    decoded = [control.decode(control.encode("ROSTER_SNAPSHOT", p)[1:])[1] for p in parts]
+    assert all(len(control.encode("ROSTER_SNAPSHOT", p)) < NetworkEngine.BUFFER_SIZE for p in parts)
+    assert [m for d in decoded for m in d["members"]] == members
+
+def test_roster_deltas_and_gap_recovery():
+    server = NetworkEngine(is_server=True)
+    server.start()
+    alice = NetworkEngine(is_server=False, username="alice")
+    bob = NetworkEngine(is_server=False, username="bob")
+    deltas = []
+    saw_bob_leave = threading.Event()
+    def on_delta(op, name):
+        deltas.append((op, name))
+        if op == "LEFT":
+            saw_bob_leave.set()
+    try:
+        connected = threading.Event()
+        alice.on_connected = connected.set
+        alice.on_participants_delta = on_delta
+        alice.start("127.0.0.1")
+        assert connected.wait(5)
+
+        bob_connected = threading.Event()
+        bob.on_connected = bob_connected.set
+        bob.start("127.0.0.1")
+        assert bob_connected.wait(5)
+        bob.stop()
+        assert saw_bob_leave.wait(5)
+        assert deltas == [("JOINED", "bob"), ("LEFT", "bob")]
+        assert alice.roster_seq == server.roster_seq
+        assert list(alice.roster.values()) == ["alice"]
+
+        # Pretend we missed a delta: the client must ask for a fresh snapshot
+        resynced = threading.Event()
+        alice.on_participants_updated = lambda names: resynced.set()
+        alice._on_roster_delta({"seq": alice.roster_seq + 2, "op": "JOINED", "id": 99, "name": "ghost"})
+        assert resynced.wait(5)
+        assert list(alice.roster.values()) == ["alice"]
+    finally:
+        alice.stop()
+        server.stop()
+
+def test_roster_ids_skip_live_clients_after_wrapping():
+    server = NetworkEngine(is_server=True)
+    try:
+        server._add_client(("127.0.0.1", 1001), "old-timer") # Holds id 1 the whole time
+        server._add_client(("127.0.0.1", 1002), "gone")
+        server._remove_client(("127.0.0.1", 1002)) # Frees id 2
+        server._next_client_id = 0xFFFF
+        server._add_client(("127.0.0.1", 1003), "last")
+        server._add_client(("127.0.0.1", 1004), "wrapped")
+        assert server.client_ids[("127.0.0.1", 1003)] == 0xFFFF
+        assert server.client_ids[("127.0.0.1", 1004)] == 2
+        assert len(set(server.client_ids.values())) == 3
+    finally:
+        server.sock.close()
@@ -0,0 +1,100 @@
+import json
+import socket
+import threading
+import time
+import sys
+import os
+
+sys.path.append(os.getcwd())
+from app.core.network_engine import NetworkEngine
+
+def test_silent_clients_expire():
+    server = NetworkEngine(is_server=True, client_timeout=0.5, sweep_interval=0.1)
+    server.start()
+    alice = NetworkEngine(is_server=False, username="alice")
+    alice.PING_INTERVAL = 0.1 # Heartbeats keep alice alive
+    crashed = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    crashed.bind(("127.0.0.1", 0))
+    left = threading.Event()
+    alice.on_participants_delta = lambda op, name: op == "LEFT" and name == "crashed" and left.set()
+    try:
+        connected = threading.Event()
+        alice.on_connected = connected.set
+        alice.start("127.0.0.1")
+        assert connected.wait(5)
+        crashed.sendto(bytes([0]) + json.dumps({"cmd": "JOIN", "args": "crashed"}).encode(),
+                       ("127.0.0.1", NetworkEngine.PORT))
+        for _ in range(20):
+            if len(server.clients) == 2:
+                break
+            time.sleep(0.05)
+        assert len(server.clients) == 2
+
+        # No LEAVE, no packets: dropped after the timeout and everyone is told
+        assert left.wait(3)
+        assert list(server.clients.values()) == ["alice"]
+        assert crashed.getsockname() not in server._last_seen
+        assert len(server._expiry) == 1 # alice's entry, re-queued on every sweep
+    finally:
+        alice.stop()
+        server.stop()
+        crashed.close()
+        time.sleep(0.2)
+
+def test_rejoining_client_keeps_one_heap_entry():
+    server = NetworkEngine(is_server=True, client_timeout=0.2)
+    addr = ("127.0.0.1", 40001)
+    try:
+        for room in ("", "red", "", "blue"):
+            server._drop_client(addr) # Leave (or switch rooms), then back within the timeout
+            server._add_client(addr, "flapper", room=room)
+        for _ in range(3):
+            server._expire_clients(time.monotonic() + 0.1) # Nothing due yet
+            server._track(addr) # Still talking
+            server._expire_clients(time.monotonic() + 0.15) # Due, but heard from: re-queued
+        assert len(server._expiry) == 1
+        assert list(server.clients) == [addr]
+
+        server._drop_client(addr)
+        server._expire_clients(time.monotonic() + 1)
+        assert server._expiry == [] and not server._queued
+    finally:
+        server.sock.close()
+
+def test_expired_client_rejoins_when_it_comes_back():
+    server = NetworkEngine(is_server=True, client_timeout=1.0, sweep_interval=0.1)
+    server.start()
+    alice = NetworkEngine(is_server=False, username="alice") # Default 5 s heartbeat: goes quiet
+    bob = NetworkEngine(is_server=False, username="bob")
+    bob.PING_INTERVAL = 0.2
+    heard = []
+    bob.on_audio_received = lambda username, *rest: heard.append(username)
+    connects = []
+    try:
+        for client in (alice, bob):
+            connected = threading.Event()
+            client.on_connected = lambda: (connects.append(1), connected.set())
+            client.start("127.0.0.1")
+            assert connected.wait(5)
+        left = threading.Event()
+        bob.on_participants_delta = lambda op, name: op == "LEFT" and name == "alice" and left.set()
+        assert left.wait(3) # Laptop lid closed
+        assert list(server.clients.values()) == ["bob"]
+
+        # Back: the first frame is answered with REJOIN, and alice is in again
+        alice.send_audio(b"x" * 40)
+        for _ in range(60):
+            if sorted(alice.participants) == ["alice", "bob"] and len(server.clients) == 2:
+                break
+            time.sleep(0.05)
+        assert sorted(server.clients.values()) == ["alice", "bob"]
+        assert sorted(alice.participants) == ["alice", "bob"]
+        alice.send_audio(b"x" * 40)
+        time.sleep(0.3)
+        assert heard == ["alice"]
+        assert len(connects) == 2 # on_connected fired once per client, not again on the rejoin
+    finally:
+        alice.stop()
+        bob.stop()
+        server.stop()
+        time.sleep(0.2)
@@ -0,0 +1,45 @@
+import socket
+import sys
+import os
+
+sys.path.append(os.getcwd())
+
+from app.core.fanout import FanOut
+
+def _sinks(n):
+    socks = []
+    for _ in range(n):
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        s.bind(("127.0.0.1", 0))
+        s.settimeout(0.2)
+        socks.append(s)
+    return socks
+
+def _drain(sock):
+    got = []
+    try:
+        while True:
+            got.append(sock.recvfrom(2048)[0])
+    except socket.timeout:
+        return got
+
+def test_fanout_excludes_sender_and_reports_failures():
+    for batched in (True, False):
+        sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sinks = _sinks(4)
+        addrs = [s.getsockname() for s in sinks]
+        fanout = FanOut(sender, batched=batched)
+        fanout.update(addrs + [("127.0.0.1", 0)]) # Port 0 is not a valid destination
+
+        for i in range(3):
+            failures = fanout.send(b"frame%d" % i, exclude=addrs[i])
+            assert [addr for addr, _ in failures] == [("127.0.0.1", 0)]
+            assert isinstance(failures[0][1], OSError)
+
+        assert _drain(sinks[0]) == [b"frame1", b"frame2"]
+        assert _drain(sinks[1]) == [b"frame0", b"frame2"]
+        assert _drain(sinks[2]) == [b"frame0", b"frame1"]
+        assert _drain(sinks[3]) == [b"frame0", b"frame1", b"frame2"]
+
+        for s in sinks + [sender]:
+            s.close()
@@ -0,0 +1,153 @@
+import sys
+import os
+import json
+import random
+import socket
+import threading
+import time
+
+sys.path.append(os.getcwd())
+
+from app.core.network_engine import NetworkEngine
+from app.core.audio_handler import AudioHandler
+from app.core.fec import FecEncoder, FecDecoder
+from app.core import audio_packet
+
+def _packets(n, rng, seq=0):
+    """n (seq, flags, level, timestamp, data) like an ADPCM sender's, sizes varying a little."""
+    return [((seq + i) & 0xFFFF, 0, rng.randrange(20, 60), (i * 20) & 0xFFFFFFFF, rng.randbytes(rng.randrange(150, 170)))
+            for i in range(n)]
+
+def test_any_single_loss_is_rebuilt_exactly():
+    rng = random.Random(1)
+    for lost in range(4):
+        encoder, decoder = FecEncoder(4), FecDecoder()
+        packets = _packets(4, rng, seq=0xFFFE) # Group straddles the seq wrap
+        parity = None
+        for i, packet in enumerate(packets):
+            parity = encoder.add(*packet) or parity
+            if i != lost:
+                assert decoder.add(*packet) == []
+        assert parity[0] == 0xFFFE and parity[1][0] == 4
+        assert decoder.add_parity(*parity) == [packets[lost]]
+
+    # Parity overtaking the last packet: the rebuild waits for it
+    encoder, decoder = FecEncoder(3), FecDecoder()
+    packets = _packets(3, rng)
+    parity = [encoder.add(*p) for p in packets][-1]
+    decoder.add(*packets[1])
+    assert decoder.add_parity(*parity) == []
+    assert decoder.add(*packets[2]) == [packets[0]]
+    assert decoder.recovered == 1
+
+def test_cn_marker_closes_the_group():
+    encoder = FecEncoder(5)
+    assert encoder.add(0, 0, 30, 0, b"a" * 10) is None
+    first, parity = encoder.add(1, audio_packet.FLAG_CN, 70, 20, b"")
+    assert first == 0 and parity[0] == 2
+    assert encoder.add(2, audio_packet.FLAG_CN, 70, 400, b"") is None # Lone marker in silence
+
+def test_loss_simulation():
+    """Random loss on frames and parity alike: how many lost frames come back, and at what cost."""
+    rows = []
+    for group in (2, 3, 5):
+        for loss in (0.02, 0.05, 0.10):
+            rng = random.Random(group * 100 + int(loss * 100))
+            encoder, decoder = FecEncoder(group), FecDecoder()
+            media_bytes = parity_bytes = lost = 0
+            for packet in _packets(3000, rng):
+                media_bytes += audio_packet.V3_HEADER_SIZE + len(packet[4])
+                if rng.random() >= loss:
+                    decoder.add(*packet)
+                else:
+                    lost += 1
+                parity = encoder.add(*packet)
+                if parity:
+                    parity_bytes += audio_packet.V3_HEADER_SIZE + len(parity[1])
+                    if rng.random() >= loss:
+                        decoder.add_parity(*parity)
+            rows.append((group, loss, lost, decoder.recovered, parity_bytes / media_bytes))
+
+    print("\ngroup  loss  lost frames  recovered  overhead")
+    for group, loss, lost, recovered, overhead in rows:
+        print(f"{group:5d}  {loss:4.0%}  {lost:11d}  {recovered / lost:9.1%}  {overhead:8.1%}")
+
+    result = {(group, loss): (recovered / lost, overhead) for group, loss, lost, recovered, overhead in rows}
+    for group in (2, 3, 5):
+        # A loss is rebuilt when the rest of its group and the parity arrive: (1 - loss) ** group
+        assert result[(group, 0.02)][0] > 0.8 * 0.98 ** group
+        assert abs(result[(group, 0.05)][1] - 1 / group) < 0.05
+    assert result[(2, 0.10)][0] > result[(3, 0.10)][0] > result[(5, 0.10)][0]
+
+def test_relay_passes_parity_to_clients_that_understand_it():
+    server = NetworkEngine(is_server=True)
+    server.start()
+    alice = NetworkEngine(is_server=False, username="alice", fec=2)
+    bob = NetworkEngine(is_server=False, username="bob")
+    old = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    old.bind(("127.0.0.1", 0))
+    old.settimeout(0.2)
+    try:
+        # A v3 client from before FEC
+        join = {"cmd": "JOIN", "args": "old", "caps": {"ctl": 4, "codec": "zlib"}}
+        old.sendto(bytes([0]) + json.dumps(join).encode(), ("127.0.0.1", NetworkEngine.PORT))
+
+        heard = []
+        bob.on_audio_received = lambda username, data, seq, *rest: heard.append((seq, data))
+        streams = []
+        bob.on_fec_stream = lambda username, group: streams.append((username, group))
+        deliver = bob._handle_audio
+        def lossy(payload, addr):
+            if payload.startswith(audio_packet.MAGIC_V3):
+                _, flags, _, _, _, seq, _, _ = audio_packet.parse_v3(payload)
+                # Groups are (0, 1), (2, 3), (4, 5); the first parity starts bob's decoder
+                if seq in (3, 4) and not flags & audio_packet.FLAG_FEC:
+                    return # Lost on the way to bob
+            deliver(payload, addr)
+        bob._handle_audio = lossy
+        for client in (alice, bob):
+            connected = threading.Event()
+            client.on_connected = connected.set
+            client.start("127.0.0.1")
+            assert connected.wait(5)
+        time.sleep(0.3)
+
+        frames = [bytes([i]) * (40 + i) for i in range(6)]
+        for i, frame in enumerate(frames):
+            alice.send_audio(frame, level=30, timestamp=i * 20)
+        time.sleep(0.3)
+        assert sorted(heard) == list(enumerate(frames))
+        assert bob.link_stats()["senders"]["alice"]["recovered"] == 2
+        assert streams == [("alice", 2)] # Once, not on every parity packet
+
+        flags = []
+        while True:
+            try:
+                data, _ = old.recvfrom(NetworkEngine.BUFFER_SIZE)
+            except socket.timeout:
+                break
+            if data[1:5] == audio_packet.MAGIC_V3:
+                flags.append(audio_packet.parse_v3(data[1:])[1])
+        assert len(flags) == 6 and not any(f & audio_packet.FLAG_FEC for f in flags)
+
+        # alice leaves: bob drops her decoder along with her stats
+        assert "alice" in bob._fec_decoders
+        left = threading.Event()
+        bob.on_participants_delta = lambda op, name: op == "LEFT" and left.set()
+        alice.stop()
+        assert left.wait(3)
+        assert not bob._fec_decoders and "alice" not in bob._sender_stats
+    finally:
+        alice.stop()
+        bob.stop()
+        old.close()
+        server.stop()
+
+def test_only_fec_senders_get_a_deeper_jitter_buffer():
+    handler = AudioHandler(frame_ms=20, dtx=False)
+    handler.add_user("bob")
+    handler.set_fec_group("alice", 3)
+    assert handler.jitter_buffers["alice"].min_frames == 3 # A frame rebuilt 3 frames late still plays
+    assert handler.jitter_buffers["bob"].min_frames == 1
+    handler.set_fec_group("bob", 1) # Never below our own floor
+    assert handler.jitter_buffers["bob"].min_delay_ms == 20
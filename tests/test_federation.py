@@ -0,0 +1,61 @@
+import sys
+import os
+import time
+
+sys.path.append(os.getcwd())
+
+from app.core.network_engine import NetworkEngine
+from app.core import federation
+from helpers import join, wait_until
+
+def test_members_split_and_reassemble():
+    members = [(i, f"room{i % 3}", f"user_{i:03d}") for i in range(200)]
+    datagrams = federation.encode_members(7, members)
+    assert len(datagrams) > 1 and all(len(d) < 1300 for d in datagrams)
+
+    link = federation.PeerLink(("127.0.0.1", 1))
+    out = None
+    for datagram in reversed(datagrams):
+        assert datagram[0] == federation.PACKET_TYPE and datagram[1] == federation.MEMBERS
+        out = link.receive_part(*federation.decode_members(datagram[2:]))
+    assert out == members
+    assert federation.parse_peer("localhost:6000", 1) == ("127.0.0.1", 6000)
+    assert federation.parse_peer("127.0.0.1", 50005) == ("127.0.0.1", 50005)
+
+def test_room_spans_two_relays():
+    port_a, port_b = NetworkEngine.PORT, NetworkEngine.PORT + 1
+    # No periodic announcements during the test: the counters below stay exact
+    a = NetworkEngine(is_server=True, port=port_a, peers=[f"127.0.0.1:{port_b}"], sweep_interval=60)
+    b = NetworkEngine(is_server=True, port=port_b, peers=[("127.0.0.1", port_a)], sweep_interval=60)
+    a.start()
+    b.start()
+    clients = []
+    try:
+        alice = join("alice", "red", port=port_a)
+        bob = join("bob", "red", port=port_b)
+        carol = join("carol", "blue", port=port_b)
+        clients += [alice, bob, carol]
+
+        assert wait_until(lambda: sorted(alice.participants) == ["alice", "bob"])
+        assert wait_until(lambda: sorted(bob.participants) == ["alice", "bob"])
+        assert wait_until(lambda: carol.participants == ["carol"])
+        assert wait_until(lambda: a.clients_by_room() == {"red": ["alice", f"bob (via 127.0.0.1:{port_b})"],
+                                                          "blue": [f"carol (via 127.0.0.1:{port_b})"]})
+
+        from_peer = b.metrics.packets_in[federation.PACKET_TYPE]
+        for i in range(5):
+            alice.send_audio(b"x" * 40, timestamp=i * 20)
+        assert wait_until(lambda: len(bob.heard) == 5)
+        assert bob.heard == ["alice"] * 5
+        time.sleep(0.2)
+        assert carol.heard == [] # Same relay as bob, other room
+        assert b.metrics.packets_in[federation.PACKET_TYPE] - from_peer == 5 # One copy per frame
+
+        # Relay B goes away: its clients leave alice's roster at once
+        b.stop()
+        assert wait_until(lambda: alice.participants == ["alice"])
+    finally:
+        for client in clients:
+            client.stop()
+        a.stop()
+        b.stop()
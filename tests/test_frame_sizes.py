@@ -0,0 +1,53 @@
+import zlib
+import sys
+import os
+import numpy as np
+
+sys.path.append(os.getcwd())
+from app.core.audio_handler import AudioHandler
+
+def ramp(n, start=0):
+    return (np.arange(start, start + n) % 20000).astype(np.int16)
+
+def play(handler, blocks):
+    out = []
+    silence = bytes(2 * handler.block_size)
+    for _ in range(blocks):
+        buf = bytearray(2 * handler.block_size)
+        handler._audio_callback(silence, buf, handler.block_size, None, None)
+        out.append(np.frombuffer(bytes(buf), dtype=np.int16))
+    return np.concatenate(out)
+
+def test_playout_splits_and_packs_packets():
+    signal = ramp(1280)
+
+    # 20 ms packets played through a 10 ms device block: each packet spans two callbacks
+    handler = AudioHandler(frame_ms=20, block_size=160, dtx=False)
+    for seq in range(4):
+        handler.receive_audio("alice", zlib.compress(signal[seq * 320:(seq + 1) * 320].tobytes()), seq, seq * 20)
+    assert (play(handler, 8) == signal).all()
+
+    # 10 ms packets into a 40 ms block: four packets per callback, jitter buffer re-sized to match
+    handler = AudioHandler(frame_ms=10, block_size=640, dtx=False)
+    played = []
+    for block in range(2):
+        for seq in range(block * 4, block * 4 + 4):
+            handler.receive_audio("alice", zlib.compress(signal[seq * 160:(seq + 1) * 160].tobytes()), seq, seq * 10)
+        played.append(play(handler, 1))
+    assert handler.jitter_buffers["alice"].frame_ms == 10
+    assert (np.concatenate(played) == signal).all()
+
+def test_capture_packs_blocks_into_frames():
+    handler = AudioHandler(frame_ms=40, block_size=160, dtx=False)
+    signal = ramp(640)
+    out = bytearray(2 * 160)
+    for i in range(4):
+        handler._audio_callback(signal[i * 160:(i + 1) * 160].tobytes(), out, 160, None, None)
+    data, level, flags, capture_ms = handler.read_frame(timeout=1)
+    assert (np.frombuffer(zlib.decompress(data), dtype=np.int16) == signal).all()
+    assert capture_ms == 0
+
+    # Shorter packets cut the packetization and buffering stages of the budget
+    budgets = {ms: AudioHandler(frame_ms=ms).latency_estimate(network_ms=10) for ms in AudioHandler.FRAME_DURATIONS}
+    assert budgets[10]["packetization"] == 10 and budgets[60]["packetization"] == 60
+    assert budgets[10]["total"] < budgets[20]["total"] < budgets[60]["total"]
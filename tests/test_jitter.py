@@ -0,0 +1,47 @@
+import sys
+import os
+import random
+
+sys.path.append(os.getcwd())
+
+from app.core.jitter import JitterBuffer, LOST
+
+def test_reorder_loss_and_late():
+    jb = JitterBuffer(frame_ms=20, min_delay_ms=40)
+    # 0, 2, 1 arrive out of order, 3 is lost, 4 arrives
+    for seq in (0, 2, 1):
+        jb.put(seq, seq * 20, b"f%d" % seq, seq * 20)
+    assert [jb.get() for _ in range(3)] == [b"f0", b"f1", b"f2"]
+    jb.put(4, 80, b"f4", 85)
+    assert jb.get() is LOST
+    assert jb.get() == b"f4"
+    jb.put(3, 60, b"f3", 120) # Its slot was already concealed
+    stats = jb.stats()
+    assert (stats["lost"], stats["late"]) == (1, 1)
+
+def test_stops_after_speaker_goes_quiet_and_restarts():
+    jb = JitterBuffer(frame_ms=20, min_delay_ms=20, max_conceal=2)
+    jb.put(0, 0, b"a", 0)
+    assert jb.get() == b"a"
+    assert [jb.get() for _ in range(3)] == [LOST, LOST, None]
+    assert jb.stats()["underruns"] == 1
+    jb.put(10, 1000, b"b", 1000) # DTX ended, new talk spurt
+    assert jb.get() == b"b"
+
+def test_latency_cap_and_adaptive_target():
+    jb = JitterBuffer(frame_ms=20, min_delay_ms=40, max_delay_ms=200)
+    for seq in range(50): # A burst nobody consumed
+        jb.put(seq, seq * 20, seq, 0)
+    depth = jb.depth
+    assert depth <= jb.max_frames
+    assert jb.get() == 50 - depth # Oldest frames went, the newest stayed
+    assert jb.stats()["dropped"] > 0
+
+    calm = JitterBuffer(frame_ms=20)
+    rough = JitterBuffer(frame_ms=20)
+    rng = random.Random(1)
+    for seq in range(200):
+        calm.put(seq, seq * 20, seq, seq * 20 + 5)
+        rough.put(seq, seq * 20, seq, seq * 20 + rng.uniform(0, 80))
+    assert calm.target_frames == calm.min_frames
+    assert rough.target_frames > calm.target_frames
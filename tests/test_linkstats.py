@@ -0,0 +1,69 @@
+import threading
+import time
+import sys
+import os
+
+sys.path.append(os.getcwd())
+from app.core import control
+from app.core.linkstats import SeqTracker
+from app.core.network_engine import NetworkEngine
+
+def test_ping_roundtrip():
+    ping = {"seq": 7, "ts": 123456, "echo": 99, "held": 5000}
+    assert control.decode(control.encode("PING", ping)[1:]) == ("PING", ping)
+    assert control.decode(control.encode("PING", None)[1:]) == ("PING", None)
+    pong = {"seq": 7, "ts": 123456, "server_ts": 42}
+    assert control.decode(control.encode("PONG", pong)[1:]) == ("PONG", pong)
+
+def test_seq_tracker():
+    t = SeqTracker(window=10)
+    for seq in [65534, 65535, 2, 3, 1, 2]: # Wraps, loses 0 and 1, then 1 and a duplicate arrive late
+        t.update(seq)
+    assert (t.received, t.lost, t.late) == (4, 2, 2)
+    assert abs(t.loss_rate - 1 / 3) < 1e-9
+    t.update(40000) # Sender restarted: not 26000 losses
+    assert t.lost == 2
+
+def test_rtt_loss_and_jitter_on_both_ends():
+    server = NetworkEngine(is_server=True)
+    server.start()
+    alice = NetworkEngine(is_server=False, username="alice")
+    bob = NetworkEngine(is_server=False, username="bob")
+    try:
+        for client in (alice, bob):
+            client.PING_INTERVAL = 0.05
+            connected = threading.Event()
+            client.on_connected = connected.set
+            client.start("127.0.0.1")
+            assert connected.wait(5)
+        got = threading.Event()
+        bob.on_audio_received = lambda *args: got.set()
+        for _ in range(50):
+            if "alice" in bob.roster.values():
+                break
+            time.sleep(0.05)
+
+        for seq in range(10):
+            if seq == 4:
+                alice._audio_seq += 1 # One frame lost on the way to the server
+            alice.send_audio(b'frame', level=10, timestamp=seq * 20)
+            time.sleep(0.02)
+        time.sleep(0.3)
+
+        # Clients see RTT on every PONG, the server on the PING after
+        client_view = alice.link_stats()
+        assert client_view["server"]["rtt_ms"] is not None and client_view["server"]["rtt_ms"] < 100
+        server_view = {s["username"]: s for s in server.link_stats().values()}
+        assert server_view["alice"]["rtt_ms"] is not None
+        assert server_view["alice"]["ping_loss"] == 0
+
+        # Audio sequence gaps show up at the server and at every receiver
+        assert (server_view["alice"]["packets"], server_view["alice"]["lost"]) == (10, 1)
+        assert got.is_set()
+        from_alice = bob.link_stats()["senders"]["alice"]
+        assert (from_alice["packets"], from_alice["lost"]) == (10, 1)
+        assert from_alice["loss_rate"] > 0 and from_alice["jitter_ms"] < 20
+    finally:
+        alice.stop()
+        bob.stop()
+        server.stop()
@@ -0,0 +1,13 @@
+import sys
+import os
+
+sys.path.append(os.getcwd())
+from benchmarks.loadgen import run
+
+def test_loadgen_smoke():
+    result = run(clients=4, speakers=2, seconds=1, procs=2, drain=0.5)
+    assert result["config"]["joined"] == 4
+    assert result["sent"] > 0 and result["expected"] == result["sent"] * 3
+    assert result["loss"] < 0.05
+    assert result["latency_ms"]["p50"] < result["latency_ms"]["max"] < 1000
+    assert result["server"]["counters"]["packets_out"] >= result["received"]
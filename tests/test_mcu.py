@@ -0,0 +1,37 @@
+import sys
+import os
+import zlib
+import numpy as np
+
+sys.path.append(os.getcwd())
+
+from app.core.mcu import ServerMixer
+
+def _frame(value, n):
+    return zlib.compress(np.full(n, value, dtype=np.int16).tobytes())
+
+def _decode(data):
+    return np.frombuffer(zlib.decompress(data), dtype=np.int16)
+
+def test_n_minus_one_mix():
+    mixer = ServerMixer(frame_size=64)
+    a, b, c, listener = ("h", 1), ("h", 2), ("h", 3), ("h", 4)
+    mixer.push(a, _frame(100, 64))
+    mixer.push(b, _frame(20, 64))
+    mixer.push(c, _frame(3, 32)) # Short frame gets zero-padded
+
+    out = {tuple(addrs): _decode(frame) for frame, _, addrs in mixer.mix([a, b, c, listener])}
+    assert np.all(out[(listener,)] == np.r_[np.full(32, 123), np.full(32, 120)])
+    assert np.all(out[(a,)] == np.r_[np.full(32, 23), np.full(32, 20)])
+    assert np.all(out[(b,)] == np.r_[np.full(32, 103), np.full(32, 100)])
+    assert np.all(out[(c,)] == 120)
+
+    # Queues are drained one frame per tick
+    assert mixer.mix([a, b, c, listener]) == []
+
+def test_mix_clips_instead_of_wrapping():
+    mixer = ServerMixer(frame_size=16)
+    mixer.push(("h", 1), _frame(30000, 16))
+    mixer.push(("h", 2), _frame(30000, 16))
+    (frame, _, _), = [m for m in mixer.mix([("h", 1), ("h", 2), ("h", 3)]) if m[2] == [("h", 3)]]
+    assert np.all(_decode(frame) == 32767)
@@ -0,0 +1,53 @@
+import threading
+import time
+import urllib.request
+import sys
+import os
+
+sys.path.append(os.getcwd())
+from app.core.metrics import Histogram, MetricsServer
+from app.core.network_engine import NetworkEngine
+
+def test_histogram_buckets():
+    h = Histogram(buckets=(1, 10))
+    for v in (0.5, 1, 5, 50):
+        h.observe(v)
+    lines = h.render("x", "help")
+    assert 'x_bucket{le="1"} 2' in lines and 'x_bucket{le="10"} 3' in lines
+    assert 'x_bucket{le="+Inf"} 4' in lines and "x_count 4" in lines
+
+def test_metrics_endpoint():
+    server = NetworkEngine(is_server=True)
+    server.start()
+    endpoint = MetricsServer(server.metrics_text, port=0)
+    endpoint.start()
+    alice = NetworkEngine(is_server=False, username="alice")
+    bob = NetworkEngine(is_server=False, username="bob")
+    try:
+        for client in (alice, bob):
+            connected = threading.Event()
+            client.on_connected = connected.set
+            client.start("127.0.0.1")
+            assert connected.wait(5)
+        for seq in range(32):
+            alice.send_audio(b'frame', level=10, timestamp=seq * 20)
+        time.sleep(0.3)
+
+        with urllib.request.urlopen(f"http://127.0.0.1:{endpoint.port}/metrics", timeout=5) as r:
+            assert r.headers["Content-Type"].startswith("text/plain")
+            text = r.read().decode()
+        values = dict(line.rsplit(" ", 1) for line in text.splitlines() if not line.startswith("#"))
+        assert values["speekchat_clients"] == "2"
+        assert values['speekchat_packets_received_total{type="audio"}'] == "32"
+        # Each frame went out once, to bob
+        assert int(values['speekchat_packets_sent_total{path="relay"}']) >= 32
+        assert int(values["speekchat_relay_seconds_count"]) == 32 // 16
+        alice_addr = next(a for a, name in server.clients.items() if name == "alice")
+        labels = f'client="{alice_addr[0]}:{alice_addr[1]}",username="alice",room=""'
+        assert values[f"speekchat_client_audio_packets_total{{{labels}}}"] == "32"
+        assert float(values[f"speekchat_client_audio_packets_per_second{{{labels}}}"]) > 0
+    finally:
+        endpoint.stop()
+        alice.stop()
+        bob.stop()
+        server.stop()
@@ -0,0 +1,58 @@
+import sys
+import os
+import numpy as np
+
+sys.path.append(os.getcwd())
+from app.core.mixer import Mixer
+
+def tone(amplitude, n=256, freq=7):
+    return (amplitude * np.sin(2 * np.pi * freq * np.arange(n) / n)).astype(np.int16).reshape(-1, 1)
+
+def test_single_speaker_is_not_attenuated():
+    mixer = Mixer(256)
+    out = np.zeros((256, 1), dtype=np.int16)
+    frame = tone(10000)
+    mixer.clear(256)
+    mixer.add(frame)
+    assert (mixer.mix_into(out) == frame).all()
+
+    # Silence when nobody is ready
+    mixer.clear(256)
+    assert not mixer.mix_into(out).any()
+
+def test_loud_mix_is_limited_not_wrapped():
+    mixer = Mixer(256)
+    out = np.zeros((256, 1), dtype=np.int16)
+    frames = [tone(30000), tone(30000), tone(20000)]
+    mixer.clear(256)
+    for f in frames:
+        mixer.add(f)
+    mixer.mix_into(out)
+
+    total = sum(f.astype(np.int32) for f in frames)
+    assert (np.sign(out) == np.sign(total)).all() # No int16 wraparound
+    assert np.abs(out).max() < 32767
+    # Monotonic: louder input never comes out quieter
+    order = np.argsort(total.ravel())
+    assert (np.diff(out.ravel()[order].astype(np.int32)) >= 0).all()
+    # Quiet parts below the knee pass through untouched
+    quiet = np.abs(total) <= 0.5 * 32767
+    assert (out[quiet] == total[quiet]).all()
+
+def test_short_and_long_frames():
+    mixer = Mixer(256)
+    out = np.zeros((256, 1), dtype=np.int16)
+    mixer.clear(256)
+    mixer.add(np.full((100, 1), 1000, dtype=np.int16))
+    mixer.add(np.full((400, 1), 10, dtype=np.int16))
+    mixer.add(np.full((256, 1), 1000, dtype=np.int16), shift=1)
+    mixer.mix_into(out)
+    assert (out[:100] == 1510).all()
+    assert (out[100:] == 510).all()
+
+    # Comfort noise style float input, broadcast over channels
+    stereo = Mixer(256, channels=2)
+    out = np.zeros((256, 2), dtype=np.int16)
+    stereo.clear(256)
+    stereo.add_scaled(np.ones(256, dtype=np.float32), 300.0)
+    assert (stereo.mix_into(out) == 300).all()
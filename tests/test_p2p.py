@@ -0,0 +1,128 @@
+import sys
+import os
+import socket
+import threading
+import time
+import uuid
+import numpy as np
+
+sys.path.append(os.getcwd())
+
+from app.core.network import NetworkManager, peer_index
+from app.core.audio import AudioEngine
+from app.core import comm
+
+BASE_PORT = 50105
+
+def _group(n):
+    """n bridges on localhost that already discovered each other (no zeroconf browsing)."""
+    nms = [NetworkManager(f"p{i}", port=BASE_PORT + i) for i in range(n)]
+    for nm in nms:
+        for other in nms:
+            other._add_peer(nm.id, nm.username, "127.0.0.1", nm.port)
+    bridges = [comm.CommunicationBridge(nm, AudioEngine(16000, chunk_size=160)) for nm in nms]
+    for bridge in bridges:
+        bridge.start()
+    return nms, bridges
+
+def _close(nms, bridges):
+    for bridge in bridges:
+        bridge.stop()
+    for nm in nms:
+        nm.zeroconf.close()
+
+def _speak(bridge):
+    bridge.ae.capture_ring.write(np.full((160, 1), 1000, dtype=np.int16))
+
+def _heard(bridge, nm):
+    q = bridge.ae.output_queues.get(nm.id)
+    return q.qsize() if q else 0
+
+def test_small_group_is_a_full_mesh():
+    nms, bridges = _group(3)
+    try:
+        send, flags, _, _, _, _, _ = bridges[1]._route()
+        assert flags == 0 and len(send) == 2
+        _speak(bridges[1])
+        time.sleep(0.3)
+        assert [_heard(b, nms[1]) for b in bridges] == [1, 0, 1]
+    finally:
+        _close(nms, bridges)
+
+def test_large_group_relays_through_the_host():
+    nms, bridges = _group(6)
+    try:
+        host = next(i for i, nm in enumerate(nms) if nm.is_host)
+        speaker = (host + 1) % len(nms)
+        send, flags, _, _, _, _, _ = bridges[speaker]._route()
+        assert flags == comm.FLAG_RELAY and len(send) == 1 # One uplink copy, to the host
+        assert all(nm.host_id == nms[host].id for nm in nms)
+
+        _speak(bridges[speaker])
+        time.sleep(0.3)
+        heard = [_heard(b, nms[speaker]) for b in bridges]
+        assert heard == [0 if i == speaker else 1 for i in range(len(nms))]
+
+        # The host's own frames go straight to everyone
+        send, flags, _, _, _, _, _ = bridges[host]._route()
+        assert flags == 0 and len(send) == len(nms) - 1
+    finally:
+        _close(nms, bridges)
+
+def test_compact_header_and_legacy_packets():
+    nms, bridges = _group(2)
+    try:
+        assert comm._HEADER.size == 10 # Was a 36-character UUID, "@<rate>" and '|'
+        # A peer that predates the compact format is still understood
+        bridges[0].udp_sock.sendto(f"{nms[0].id}@16000|".encode() + bytes(320), ("127.0.0.1", nms[1].port))
+        time.sleep(0.2)
+        assert _heard(bridges[1], nms[0]) == 1
+    finally:
+        _close(nms, bridges)
+
+def test_relay_and_heartbeats_from_two_threads_stay_apart():
+    nm = NetworkManager("host", port=BASE_PORT + 10)
+    nm.HEARTBEAT_INTERVAL = 0.001 # Heartbeats go out while the receive thread relays
+    sinks = {}
+    for name in ("a", "b"):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind(("127.0.0.1", 0))
+        sock.settimeout(0.1)
+        peer_id = str(uuid.uuid4())
+        nm._add_peer(peer_id, name, "127.0.0.1", sock.getsockname()[1])
+        sinks[name] = (sock, peer_id, [])
+    bridge = comm.CommunicationBridge(nm, AudioEngine(16000, chunk_size=160))
+
+    done = threading.Event()
+    def drain(sock, got):
+        while not done.is_set():
+            try:
+                got.append(sock.recv(4096))
+            except socket.timeout:
+                pass
+    threads = [threading.Thread(target=drain, args=(sock, got)) for sock, _, got in sinks.values()]
+    bridge.start()
+    try:
+        for t in threads:
+            t.start()
+        a, a_id, a_got = sinks["a"]
+        frame = comm._HEADER.pack(comm.MAGIC, comm.FLAG_RELAY, peer_index(a_id), 16000) + bytes(320)
+        for i in range(1000):
+            a.sendto(frame, ("127.0.0.1", nm.port))
+            if i % 20 == 0:
+                time.sleep(0.002)
+        time.sleep(0.3)
+    finally:
+        done.set()
+        for t in threads:
+            t.join()
+        _close([nm], [bridge])
+        for sock, _, _ in sinks.values():
+            sock.close()
+
+    heartbeat = bridge._headers[comm.FLAG_HEARTBEAT]
+    relayed = bytes([comm.MAGIC, 0]) + frame[2:]
+    b_got = sinks["b"][2]
+    assert set(a_got) == {heartbeat} # Never its own frame back, nor a torn one
+    assert set(b_got) == {heartbeat, relayed}
+    assert b_got.count(relayed) == 1000
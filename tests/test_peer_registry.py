@@ -0,0 +1,95 @@
+import sys
+import os
+import threading
+import time
+import uuid
+
+sys.path.append(os.getcwd())
+
+from app.core.network import PeerRegistry, NetworkManager, peer_index
+from app.core.audio import AudioEngine
+from app.core.comm import CommunicationBridge
+
+def _info(peer_id, proto=2):
+    return {'username': peer_id[:4], 'address': "127.0.0.1", 'port': 1, 'index': peer_index(peer_id), 'proto': proto}
+
+def test_readers_never_see_a_changing_dict():
+    registry = PeerRegistry(str(uuid.uuid4()))
+    ids = [str(uuid.uuid4()) for _ in range(50)]
+    stop = threading.Event()
+    errors = []
+
+    def churn():
+        while not stop.is_set():
+            for peer_id in ids:
+                registry.add(peer_id, _info(peer_id))
+            registry.remove(ids[::2])
+
+    writer = threading.Thread(target=churn)
+    writer.start()
+    try:
+        deadline = time.monotonic() + 0.5
+        while time.monotonic() < deadline:
+            snap = registry.snapshot
+            try:
+                for peer_id, info in snap.peers.items():
+                    assert snap.by_index[info['index']] == peer_id
+            except Exception as e:
+                errors.append(e)
+    finally:
+        stop.set()
+        writer.join()
+    assert errors == []
+
+def test_host_follows_the_smallest_id():
+    me = "5" + str(uuid.uuid4())[1:]
+    registry = PeerRegistry(me)
+    assert registry.snapshot.host_id == me
+    low, high = "1" + me[1:], "9" + me[1:]
+    assert not registry.add(high, _info(high))
+    assert registry.add(low, _info(low))
+    assert registry.snapshot.host_id == low
+    assert not registry.remove([high])
+    assert registry.remove([low])
+    assert registry.snapshot.host_id == me
+
+def test_silent_peers_expire_and_heartbeats_revive_them():
+    registry = PeerRegistry(str(uuid.uuid4()))
+    quiet, chatty, legacy = (str(uuid.uuid4()) for _ in range(3))
+    for peer_id in (quiet, chatty):
+        registry.add(peer_id, _info(peer_id))
+    registry.add(legacy, _info(legacy, proto=1)) # Can't heartbeat: left to zeroconf
+    now = time.monotonic()
+    registry.touch(chatty, now + 9)
+
+    expired, _ = registry.expire(10, now=now + 11)
+    assert expired == [quiet]
+    assert set(registry.snapshot.peers) == {chatty, legacy}
+    assert registry.revive(peer_index(quiet)) == quiet
+    assert quiet in registry.snapshot.peers
+    registry.remove([quiet]) # A zeroconf removal is final
+    assert registry.revive(peer_index(quiet)) is None
+
+def test_bridges_keep_each_other_alive():
+    nms = [NetworkManager(f"p{i}", port=50115 + i) for i in range(2)]
+    for nm in nms:
+        nm.HEARTBEAT_INTERVAL = 0.1
+        for other in nms:
+            other._add_peer(nm.id, nm.username, "127.0.0.1", nm.port)
+    bridges = [CommunicationBridge(nm, AudioEngine(16000, chunk_size=160)) for nm in nms]
+    try:
+        for bridge in bridges:
+            bridge.start()
+        time.sleep(0.5)
+        assert nms[0].registry.expire(0.3) == ([], False)
+
+        bridges[1].stop()
+        time.sleep(0.5)
+        expired, _ = nms[0].registry.expire(0.3)
+        assert expired == [nms[1].id]
+        assert nms[0].is_host
+    finally:
+        for bridge in bridges:
+            bridge.stop()
+        for nm in nms:
+            nm.zeroconf.close()
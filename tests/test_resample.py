@@ -0,0 +1,69 @@
+import json
+import socket
+import threading
+import zlib
+import sys
+import os
+import numpy as np
+
+sys.path.append(os.getcwd())
+from app.core.resample import Resampler, filter_bank
+from app.core.network_engine import NetworkEngine
+
+def tone(freq, rate, n, amplitude=10000):
+    return (amplitude * np.sin(2 * np.pi * freq * np.arange(n) / rate)).astype(np.int16)
+
+def rms(x):
+    return np.sqrt(np.mean(x.astype(np.float64) ** 2))
+
+def test_streaming_resample():
+    for from_rate, to_rate in [(44100, 16000), (16000, 48000), (48000, 16000)]:
+        signal = tone(1000, from_rate, from_rate)
+        whole = Resampler(from_rate, to_rate).process(signal)
+
+        # Frame by frame (odd sizes) gives exactly the same stream as one call
+        r = Resampler(from_rate, to_rate)
+        chunks = [r.process(signal[i:i + 999]) for i in range(0, len(signal), 999)]
+        assert (np.concatenate(chunks) == whole).all()
+
+        # One second in, one second out, and a passband tone keeps its level
+        assert len(whole) == to_rate
+        assert abs(rms(whole[1000:]) / rms(signal) - 1) < 0.01
+
+    # Going down, content above the new Nyquist is filtered rather than aliased
+    high = tone(12000, 44100, 44100)
+    assert rms(Resampler(44100, 16000).process(high)[1000:]) < rms(high) / 300
+
+    # Filter banks are built once per rate pair
+    assert filter_bank(160, 441) is Resampler(44100, 16000).bank
+
+def test_relay_resamples_for_legacy_peers():
+    server = NetworkEngine(is_server=True)
+    server.start()
+    alice = NetworkEngine(is_server=False, username="alice", sample_rate=48000)
+    legacy = socket.socket(socket.AF_INET, socket.SOCK_DGRAM) # Control v2: zlib at 16 kHz only
+    legacy.bind(("127.0.0.1", 0))
+    legacy.settimeout(2)
+    try:
+        connected = threading.Event()
+        alice.on_connected = connected.set
+        alice.start("127.0.0.1")
+        assert connected.wait(5)
+        legacy.sendto(bytes([0]) + json.dumps({"cmd": "JOIN", "args": "old", "caps": {"ctl": 2}}).encode(),
+                      ("127.0.0.1", NetworkEngine.PORT))
+        for _ in range(50):
+            if len(server.clients) == 2:
+                break
+            connected.wait(0.1)
+
+        alice.send_audio(zlib.compress(tone(440, 48000, 960).tobytes()), level=10)
+        while True:
+            data, _ = legacy.recvfrom(NetworkEngine.BUFFER_SIZE)
+            if data[:5] == b'\x01SPK2':
+                break
+        # 20 ms at 48 kHz arrives as 20 ms at 16 kHz
+        assert len(np.frombuffer(zlib.decompress(data[15:]), dtype=np.int16)) == 320
+    finally:
+        alice.stop()
+        server.stop()
+        legacy.close()
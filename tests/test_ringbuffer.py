@@ -0,0 +1,50 @@
+import threading
+import sys
+import os
+import numpy as np
+
+sys.path.append(os.getcwd())
+from app.core.ringbuffer import RingBuffer
+
+def block(start, n):
+    return np.arange(start, start + n, dtype=np.int16).reshape(-1, 1)
+
+def test_fifo_wraparound_and_drop_oldest():
+    ring = RingBuffer(16, guard=4)
+    out = np.zeros((4, 1), dtype=np.int16)
+
+    # Several laps through the array, consumer keeping up
+    for i in range(10):
+        ring.write(block(i * 4, 4))
+        assert ring.read(4, out, timeout=0).ravel().tolist() == list(range(i * 4, i * 4 + 4))
+    assert ring.overflows == 0
+    assert ring.read(4, out, timeout=0.01) is None
+
+    # Consumer stalls for 6 blocks: the oldest get overwritten, not the newest
+    for i in range(6):
+        ring.write(block(100 + i * 4, 4))
+    assert ring.read(4, out, timeout=0).ravel().tolist() == [112, 113, 114, 115]
+    assert ring.overflows == 12 # capacity - guard = 12 samples kept
+    assert ring.read_position == 40 + 12 + 4
+
+def test_concurrent_reads_are_never_torn():
+    # Every block is filled with its own index, so a torn read mixes two values
+    ring = RingBuffer(64, guard=8)
+    blocks = 5000
+    got = []
+
+    def produce():
+        for i in range(blocks):
+            ring.write(np.full((8, 1), i % 30000, dtype=np.int16))
+
+    producer = threading.Thread(target=produce)
+    producer.start()
+    out = np.zeros((8, 1), dtype=np.int16)
+    while producer.is_alive() or ring.available() >= 8:
+        if ring.read(8, out, timeout=0.05) is not None:
+            assert (out == out[0]).all()
+            got.append(int(out[0, 0]))
+    producer.join()
+
+    assert got == sorted(got)
+    assert len(got) * 8 + ring.overflows == blocks * 8
@@ -0,0 +1,69 @@
+import sys
+import os
+import time
+import numpy as np
+
+sys.path.append(os.getcwd())
+
+from app.core.network_engine import NetworkEngine
+from app.core.mcu import ServerMixer
+from app.core import audio_codecs
+from helpers import join
+
+def test_rooms_keep_audio_and_rosters_apart():
+    server = NetworkEngine(is_server=True)
+    server.start()
+    clients = []
+    try:
+        alice = join("alice", "red")
+        bob = join("bob", "red")
+        carol = join("carol", "blue")
+        dave = join("dave") # No room: the default one, like a legacy client
+        clients += [alice, bob, carol, dave]
+        time.sleep(0.3)
+
+        assert server.clients_by_room() == {"red": ["alice", "bob"], "blue": ["carol"], "": ["dave"]}
+        assert sorted(alice.participants) == ["alice", "bob"]
+        assert carol.participants == ["carol"]
+        assert dave.participants == ["dave"]
+
+        for i in range(5):
+            alice.send_audio(b"x" * 40, timestamp=i * 20)
+        time.sleep(0.3)
+        assert bob.heard == ["alice"] * 5
+        assert carol.heard == [] and dave.heard == []
+
+        # A join elsewhere is not a roster change here: no gap, no resync
+        updates = []
+        alice.on_participants_updated = updates.append
+        seq = alice.roster_seq
+        clients.append(join("erin", "blue"))
+        time.sleep(0.3)
+        assert alice.roster_seq == seq and updates == []
+        assert sorted(carol.participants) == ["carol", "erin"]
+
+        # Re-joining with another room moves the client
+        bob.room = "blue"
+        bob._send_command("JOIN", "bob")
+        time.sleep(0.3)
+        assert server.clients_by_room()["blue"] == ["bob", "carol", "erin"]
+        assert alice.participants == ["alice"]
+        assert sorted(carol.participants) == ["bob", "carol", "erin"]
+    finally:
+        for client in clients:
+            client.stop()
+        server.stop()
+
+def test_mixer_only_mixes_the_recipients_room():
+    mixer = ServerMixer(frame_size=32)
+    red, blue = [("r", 1), ("r", 2)], [("b", 1)]
+    codec = audio_codecs.get(audio_codecs.ZLIB)
+    mixer.push(red[0], codec.encode(np.full(32, 100, dtype=np.int16)))
+    mixer.push(blue[0], codec.encode(np.full(32, 7, dtype=np.int16)))
+
+    (frame, _, recipients), = mixer.mix(red)
+    assert recipients == [red[1]]
+    assert np.all(codec.decode(frame) == 100)
+    (frame, _, recipients), = mixer.mix(blue + [("b", 2)])
+    assert recipients == [("b", 2)]
+    assert np.all(codec.decode(frame) == 7)
@@ -0,0 +1,145 @@
+import json
+import socket
+import sys
+import os
+import threading
+import time
+
+sys.path.append(os.getcwd())
+
+from app.core.network_engine import NetworkEngine
+from app.core.sharded_relay import ShardedRelayServer, SharedClientTable, _ShardWorker
+from helpers import join
+
+def test_shared_table_snapshot():
+    table = SharedClientTable()
+    try:
+        table.add(("127.0.0.1", 4000), "alice")
+        table.add(("127.0.0.1", 4001), "bob")
+        table.add(("127.0.0.1", 4000), "alice2", 1) # Re-join updates in place
+        assert table.snapshot() == {("127.0.0.1", 4000): ("alice2", 1, 0, ""), ("127.0.0.1", 4001): ("bob", 0, 1, "")}
+
+        reader = SharedClientTable(table.name, table.lock)
+        table.remove(("127.0.0.1", 4001))
+        assert reader.snapshot() == {("127.0.0.1", 4000): ("alice2", 1, 0, "")}
+        reader.close()
+    finally:
+        table.close()
+
+def test_shared_table_keeps_a_roster_sequence_per_room():
+    table = SharedClientTable()
+    try:
+        assert table.add(("127.0.0.1", 4000), "alice", 2, "red") == 1
+        assert table.add(("127.0.0.1", 4001), "bob", 2, "blue") == 1
+        assert table.add(("127.0.0.1", 4002), "carol", 2, "red") == 2
+        assert table.add(("127.0.0.1", 4002), "carol", 2, "red") == 2 # Join retry
+        assert table.room_seqs() == {"red": 2, "blue": 1}
+
+        assert table.remove(("127.0.0.1", 4001)) == 2
+        assert table.room_seqs() == {"red": 2} # Blue is empty, and red never noticed
+        assert table.add(("127.0.0.1", 4000), "alice", 2, "blue") == 1 # Moving: left red, joined blue
+        assert table.room_seqs() == {"red": 3, "blue": 1}
+    finally:
+        table.close()
+
+def test_sharded_rooms_get_deltas_without_resyncs():
+    server = ShardedRelayServer(workers=2)
+    server.start()
+    time.sleep(0.5)
+    clients = []
+    try:
+        alice = join("alice", "red")
+        clients.append(alice)
+        time.sleep(0.2)
+        seq = alice.roster_seq
+        for i in range(4): # Spread over both workers, all elsewhere
+            clients.append(join(f"blue{i}", "blue"))
+        clients.append(join("bob", "red"))
+        time.sleep(0.3)
+        assert sorted(alice.participants) == ["alice", "bob"]
+        assert alice.roster_seq == seq + 1 # Bob's JOINED delta, nothing in between
+        assert alice._last_roster_request == 0 # Never saw a gap
+    finally:
+        for client in clients:
+            client.stop()
+        server.stop()
+
+def test_sharded_relay_forwards_between_workers():
+    server = ShardedRelayServer(workers=2)
+    server.start()
+    time.sleep(0.5)
+    socks = []
+    try:
+        # Enough clients that the kernel spreads them over both workers
+        for i in range(8):
+            s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            s.bind(("127.0.0.1", 0))
+            s.settimeout(2)
+            s.sendto(bytes([0]) + json.dumps({"cmd": "JOIN", "args": f"c{i}"}).encode(), ("127.0.0.1", NetworkEngine.PORT))
+            socks.append(s)
+        time.sleep(0.5)
+        assert sorted(server.clients.values()) == [f"c{i}" for i in range(8)]
+
+        for s in socks[1:]:
+            s.sendto(bytes([1]) + b'SPK!' + bytes([0]) + b'x', ("127.0.0.1", NetworkEngine.PORT))
+        senders = set()
+        while len(senders) < 7:
+            data, _ = socks[0].recvfrom(NetworkEngine.BUFFER_SIZE)
+            if data[0] == 1:
+                senders.add(data[6:6 + data[5]].decode())
+        assert senders == {f"c{i}" for i in range(1, 8)}
+    finally:
+        for s in socks:
+            s.close()
+        server.stop()
+
+def test_full_table_rejects_thejoin():
+    server = ShardedRelayServer(workers=1, max_clients=2)
+    server.start()
+    time.sleep(0.5)
+    clients = []
+    try:
+        clients += [join("alice", ""), join("bob", "")]
+        carol = NetworkEngine(is_server=False, username="carol")
+        clients.append(carol)
+        connected, refused = threading.Event(), []
+        carol.on_connected = connected.set
+        carol.on_error = refused.append
+        carol.start("127.0.0.1")
+        for _ in range(40):
+            if refused:
+                break
+            time.sleep(0.05)
+        assert refused and "Server full" in refused[0]
+        assert not connected.is_set() and not carol.is_running
+        assert sorted(server.clients.values()) == ["alice", "bob"]
+    finally:
+        for client in clients:
+            client.stop()
+        server.stop()
+
+def test_workers_forget_departed_clients():
+    table = SharedClientTable()
+    workers = [_ShardWorker(SharedClientTable(table.name, table.lock), port=50310) for _ in range(2)]
+    addr = ("127.0.0.1", 4000)
+    try:
+        workers[0]._add_client(addr, "alice", 2, "red")
+        workers[1]._add_client(("127.0.0.1", 4001), "bob", 2, "red") # Keeps the room (and its selector) around
+        for worker in workers:
+            worker._sync_clients()
+            worker.send_failures[addr] = 3
+            worker._legacy_seq[addr] = 7
+            worker._legacy_resamplers[addr] = object()
+            worker.last_n = 3
+            worker._selected("red", addr, 30)
+        workers[0]._drop_client(addr)
+        workers[1]._sync_clients() # Left through the other worker
+        for worker in workers:
+            assert list(worker.clients.values()) == ["bob"]
+            assert not worker.send_failures and not worker._legacy_seq and not worker._legacy_resamplers
+            assert addr not in worker.selectors["red"].scores
+    finally:
+        for worker in workers:
+            worker.sock.close()
+            worker.table.close()
+        table.close()
@@ -0,0 +1,66 @@
+import sys
+import os
+import threading
+
+sys.path.append(os.getcwd())
+
+from app.core.speakers import SpeakerSelector
+from app.core.network_engine import NetworkEngine
+
+def test_last_n_with_hysteresis():
+    sel = SpeakerSelector(max_speakers=2, hysteresis_db=6, hold_time=0.5)
+    t = 0.0
+    # a and b take both slots, c is only slightly louder than b: no flapping
+    for _ in range(10):
+        t += 0.02
+        assert sel.update("a", 20, t)
+        assert sel.update("b", 40, t)
+        assert not sel.update("c", 37, t)
+    # c gets much louder than b and b's hold time is over: c replaces b
+    for _ in range(20):
+        t += 0.02
+        sel.update("a", 20, t)
+        sel.update("b", 40, t)
+        forwarded = sel.update("c", 10, t)
+    assert forwarded
+    assert set(sel.active) == {"a", "c"}
+
+def test_silent_speaker_releases_slot():
+    sel = SpeakerSelector(max_speakers=1, hold_time=0.5)
+    assert sel.update("a", 20, 0.0)
+    assert not sel.update("b", 30, 0.1)
+    assert not sel.update("b", 127, 0.2) # Silence never claims a slot
+    # a stops sending entirely (muted / DTX), b takes over after the hold time
+    assert sel.update("b", 30, 1.0)
+    assert set(sel.active) == {"b"}
+
+def test_v2_audio_maps_sender_id_to_name():
+    server = NetworkEngine(is_server=True)
+    server.start()
+    alice = NetworkEngine(is_server=False, username="alice")
+    bob = NetworkEngine(is_server=False, username="bob")
+    received = []
+    got = threading.Event()
+    try:
+        for client in (alice, bob):
+            connected = threading.Event()
+            client.on_connected = connected.set
+            client.start("127.0.0.1")
+            assert connected.wait(5)
+
+        def on_audio(name, data, seq, timestamp, codec, rate):
+            received.append((name, data))
+            got.set()
+        bob.on_audio_received = on_audio
+        # Give bob's roster a moment to catch alice's id, then speak
+        for _ in range(20):
+            if "alice" in bob.roster.values():
+                break
+            got.wait(0.1)
+        alice.send_audio(b"frame", level=10)
+        assert got.wait(5)
+        assert received[0] == ("alice", b"frame")
+    finally:
+        alice.stop()
+        bob.stop()
+        server.stop()
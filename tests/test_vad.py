@@ -0,0 +1,24 @@
+import sys
+import os
+
+sys.path.append(os.getcwd())
+
+from app.core import vad
+
+def test_dtx_hangover_and_comfort_noise():
+    det = vad.VoiceActivityDetector(frame_ms=20, hangover_ms=100, cn_interval_ms=200)
+    levels = [55] * 50 + [25] * 20 + [55] * 50
+    decisions = [det.process(level) for level in levels]
+
+    # Background only: one CN marker, then one every 10 frames (200 ms)
+    assert decisions[0] == vad.COMFORT_NOISE
+    assert [i for i, d in enumerate(decisions[:50]) if d == vad.COMFORT_NOISE] == [0, 10, 20, 30, 40]
+    assert vad.VOICE not in decisions[:50]
+
+    # Speech plus 5 frames (100 ms) of hangover, then CN straight away
+    assert decisions[50:75] == [vad.VOICE] * 25
+    assert decisions[75] == vad.COMFORT_NOISE
+    assert 50 <= det.comfort_noise_level <= 60
+
+    sent = sum(d != vad.SILENT for d in decisions)
+    assert sent < len(levels) / 2